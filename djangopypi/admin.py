@@ -2,8 +2,9 @@ from django.contrib import admin
 from django.contrib.auth.models import Group
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from django.db.models import Sum
 from djangopypi.models import Package, Release, Classifier, \
-                              Distribution, Review
+                              Distribution, DistributionDownloads, Review
 
 def full_delete_selected(self,request,queryset):
     for obj in queryset:
@@ -50,6 +51,33 @@ class PackageModelAdmin(FullDeletingModelAdmin):
     )
     search_fields = ('name',)
 
+class DistributionDownloadsInline(admin.TabularInline):
+    model = DistributionDownloads
+    fields = readonly_fields = ('day', 'count')
+    extra = 0
+    max_num = 0
+    can_delete = False
+
+class DistributionModelAdmin(FullDeletingModelAdmin):
+    inlines = [DistributionDownloadsInline]
+    list_display = (
+        '__unicode__',
+        'filetype',
+        'pyversion',
+        'created',
+        'download_count',
+    )
+    search_fields = ('release__package__name',)
+
+    def queryset(self, request):
+        return super(DistributionModelAdmin, self).queryset(request) \
+            .annotate(download_count=Sum('downloads__count'))
+
+    def download_count(self, obj):
+        return obj.download_count or 0
+    download_count.short_description = "Downloads"
+    download_count.admin_order_field = 'download_count'
+
 def make_staff(modeladmin, request, queryset):
     count = 0
     for obj in queryset:
@@ -88,5 +116,5 @@ admin.site.register(User, EnhancedUserAdmin)
 admin.site.register(Package,PackageModelAdmin)
 admin.site.register(Release,FullDeletingModelAdmin)
 admin.site.register(Classifier)
-admin.site.register(Distribution,FullDeletingModelAdmin)
+admin.site.register(Distribution,DistributionModelAdmin)
 admin.site.register(Review)
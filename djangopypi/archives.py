@@ -0,0 +1,193 @@
+""" Reading the metadata file of a distribution archive without unpacking it.
+
+Zip based archives (zip sdists, eggs and wheels) are read through their
+central directory at the end of the file, so only the directory and the one
+member are read; local files are memory-mapped rather than read through a
+buffered file. Tarballs have no directory, so they are decompressed as a
+stream that stops as soon as the top-level ``PKG-INFO`` has gone by, instead
+of listing every member first as ``pkginfo`` does.
+
+``SDist``, ``BDist`` and ``Wheel`` are drop-in replacements for the
+``pkginfo`` classes of the same names that read their metadata this way. """
+import mmap
+import os
+import tarfile
+import zipfile
+from contextlib import contextmanager
+
+import pkginfo
+
+from djangopypi import wheels
+
+ZIP_SUFFIXES = ('.zip', '.egg', '.whl')
+TAR_SUFFIXES = ('.tar.gz', '.tgz', '.tar.bz2', '.tbz', '.tar')
+
+def kind(filename):
+    """ 'wheel', 'egg' or 'sdist' for the archive ``filename``, or None when
+    it is not an archive that holds metadata """
+    lower = filename.lower()
+    if wheels.is_wheel(lower):
+        return 'wheel'
+    if lower.endswith('.egg'):
+        return 'egg'
+    if lower.endswith(ZIP_SUFFIXES + TAR_SUFFIXES):
+        return 'sdist'
+    return None
+
+def _depth(kind, name):
+    """ How good a metadata file the member ``name`` is: 0 for the one the
+    archive format defines, 1 for a nested sdist PKG-INFO such as that of the
+    egg-info directory, None for any other member """
+    parts = name.split('/')
+    if kind == 'wheel':
+        if len(parts) == 2 and parts[0].endswith('.dist-info') and \
+           parts[1] == 'METADATA':
+            return 0
+    elif kind == 'egg':
+        if parts == ['EGG-INFO', 'PKG-INFO']:
+            return 0
+    elif parts[-1] == 'PKG-INFO':
+        return 0 if len(parts) == 2 else 1
+    return None
+
+class MappedFile(object):
+    """ The file-like reads ``zipfile`` needs, over a memory map """
+
+    def __init__(self, mapped):
+        self._mapped = mapped
+        self._position = 0
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += len(self._mapped)
+        if offset < 0:
+            raise IOError('Invalid argument')
+        self._position = offset
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        start = self._position
+        if size < 0:
+            end = len(self._mapped)
+        else:
+            end = min(start + size, len(self._mapped))
+        self._position = max(start, end)
+        return self._mapped[start:end]
+
+@contextmanager
+def _mapped(fileobj):
+    """ A read-only memory map of ``fileobj`` when it is a local file, or the
+    file itself otherwise """
+    try:
+        mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, ValueError, EnvironmentError, mmap.error):
+        # Not a real file, or an empty one
+        mapped = None
+    if mapped is None:
+        yield fileobj
+    else:
+        try:
+            yield MappedFile(mapped)
+        finally:
+            mapped.close()
+
+def _read_zip(fileobj, kind):
+    with _mapped(fileobj) as source:
+        archive = zipfile.ZipFile(source)
+        try:
+            candidates = [(depth, name) for depth, name in
+                          ((_depth(kind, name), name)
+                           for name in archive.namelist())
+                          if depth is not None]
+            for depth, name in sorted(candidates):
+                data = archive.read(name)
+                if 'Metadata-Version' in data:
+                    return data
+        finally:
+            archive.close()
+    return None
+
+def _read_tar(fileobj, kind):
+    fallback = None
+    archive = tarfile.open(fileobj=fileobj, mode='r|*')
+    try:
+        for member in archive:
+            depth = _depth(kind, member.name)
+            if depth is None or not member.isfile():
+                continue
+            data = archive.extractfile(member).read()
+            if 'Metadata-Version' not in data:
+                continue
+            if depth == 0:
+                return data
+            if fallback is None:
+                fallback = data
+    finally:
+        archive.close()
+    return fallback
+
+def read_metadata(fileobj, filename):
+    """ The PKG-INFO or METADATA of the archive ``filename``, read from
+    ``fileobj``, or None when it has none or is not an archive """
+    archive_kind = kind(filename)
+    if archive_kind is None:
+        return None
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    try:
+        if filename.lower().endswith(ZIP_SUFFIXES):
+            return _read_zip(fileobj, archive_kind)
+        return _read_tar(fileobj, archive_kind)
+    except (zipfile.BadZipfile, tarfile.TarError, IOError, EOFError):
+        return None
+
+def read_file(path):
+    """ ``read_metadata`` for a file on disk """
+    f = open(path, 'rb')
+    try:
+        return read_metadata(f, path)
+    finally:
+        f.close()
+
+class ArchiveMixin(object):
+
+    def __init__(self, filename, metadata_version=None):
+        self.filename = filename
+        self.metadata_version = metadata_version
+        self.extractMetadata()
+
+    def read(self):
+        if not os.path.isfile(self.filename):
+            raise ValueError('No such file: %s' % (self.filename,))
+        data = read_file(self.filename)
+        if data is None:
+            raise ValueError('No PKG-INFO in archive: %s' % (self.filename,))
+        return data
+
+class SDist(ArchiveMixin, pkginfo.SDist):
+    pass
+
+class BDist(ArchiveMixin, pkginfo.BDist):
+    pass
+
+try:
+    class Wheel(ArchiveMixin, pkginfo.Wheel):
+        pass
+except AttributeError:
+    # pkginfo before 1.0
+    Wheel = None
+
+def get_metadata(path):
+    """ Like ``pkginfo.get_metadata`` for an archive: the ``SDist``,
+    ``BDist`` or ``Wheel`` of ``path``, or None """
+    cls = {'sdist': SDist, 'egg': BDist, 'wheel': Wheel}.get(kind(path))
+    if cls is None:
+        return None
+    try:
+        return cls(path)
+    except (ValueError, IOError):
+        return None
@@ -0,0 +1,613 @@
+""" A benchmark of the public views over a synthetic index, to catch
+performance regressions before they reach production.
+
+``seed`` fills the database with packages whose number of releases follows a
+long tail, up to a given maximum, some of them only downloadable by one of
+several groups, with releases depending on a few other packages. ``run``
+then drives each view through the test client, once with the caches
+invalidated and then a few times warm, recording the number of queries, the
+wall time and the growth of the peak memory of the process. The report is a
+JSON-serializable dict that ``compare`` checks against an earlier one.
+
+It writes to the database and to the storage of distributions, so the
+``benchmark`` management command runs it against a throwaway test database
+and ``isolated_storage``.
+
+``archive_corpus`` and ``run_archives`` time reading the metadata of a corpus
+of mixed archives with ``djangopypi.archives`` and with ``pkginfo``, for the
+``benchmark_archives`` management command.
+
+``seed_releases`` and ``run_releases`` time loading a large number of
+releases, with and without decoding their metadata, for the
+``benchmark_releases`` management command. """
+import os
+import random
+import resource
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import xmlrpclib
+import zipfile
+from contextlib import contextmanager
+from StringIO import StringIO
+
+import pkginfo
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User, Group, Permission
+from django.core.files.base import ContentFile
+from django.core.signals import request_started
+from django.core.urlresolvers import reverse
+from django.db import connection, reset_queries, transaction
+from django.db.models import AutoField
+from django.test.client import Client
+from django.utils.datastructures import MultiValueDict
+
+from djangopypi import archives, classifiers, conf, dependencies, \
+                      documents, models, permissions, resolver, simple, \
+                      versions
+from djangopypi.models import Package, Release, Distribution, Dependency, \
+                              metadata_columns
+
+DATASETS = {'1k': 1000, '10k': 10000, '50k': 50000}
+
+BATCH_SIZE = 500
+
+# Shape of the long tail of releases per package
+RELEASES_ALPHA = 1.2
+
+# Share of the packages only some group may download
+RESTRICTED_SHARE = 0.2
+
+# Most dependencies of a release, and number of requirements resolved by the
+# resolve scenario
+MAX_DEPENDENCIES = 3
+REQUIREMENTS = 200
+
+USERNAME = 'benchmark'
+PASSWORD = 'benchmark'
+UPLOAD_PACKAGE = 'benchmark-upload'
+BOUNDARY = '--------------BENCHMARK7543FJKLFHRE75642756743254'
+
+def _insert(model, objects):
+    """ Insert unsaved ``objects`` of ``model`` with one statement per batch,
+    without the signals and extra queries of ``save`` """
+    fields = [field for field in model._meta.local_fields
+              if not isinstance(field, AutoField)]
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(model._meta.db_table),
+        ', '.join(qn(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+    cursor = connection.cursor()
+    for start in xrange(0, len(objects), BATCH_SIZE):
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(field.pre_save(obj, True),
+                                    connection=connection)
+             for field in fields]
+            for obj in objects[start:start + BATCH_SIZE]])
+
+def package_name(number):
+    return 'package-%05d' % (number,)
+
+def _sdist(name, version):
+    """ The content of a small source distribution """
+    content = StringIO()
+    archive = tarfile.open(fileobj=content, mode='w:gz')
+    pkg_info = 'Metadata-Version: 1.0\nName: %s\nVersion: %s\n' % (name,
+                                                                   version)
+    info = tarfile.TarInfo('%s-%s/PKG-INFO' % (name, version))
+    info.size = len(pkg_info)
+    archive.addfile(info, StringIO(pkg_info))
+    archive.close()
+    return content.getvalue()
+
+def _release(name, number, count):
+    """ The unsaved ``number``th release of the ``count`` of a package """
+    version = '%d.%d' % divmod(number, 10)
+    package_info = MultiValueDict({
+        'summary': ['Synthetic package %s' % (name,)],
+        'author': ['Author of %s' % (name,)],
+        'license': ['BSD'],
+        'keywords': ['benchmark synthetic'],
+    })
+    release = Release(package_id=name, version=version,
+                      sort_key=versions.parse(version).sort_key,
+                      package_info=package_info,
+                      hidden=number != count - 1)
+    for field, value in metadata_columns(package_info).iteritems():
+        setattr(release, field, value)
+    return release
+
+def seed(packages=1000, max_releases=1000, groups=10, seed=0):
+    """ Fill the database with a synthetic index, and return a description
+    of it with the sample objects that the scenarios use """
+    rng = random.Random(seed)
+    group_list = [Group.objects.create(name='benchmark-%d' % (number,))
+                  for number in xrange(groups)]
+    group_list[0].permissions.add(
+        Permission.objects.get(codename='add_package'))
+    user = User.objects.create_user(USERNAME, '%s@example.com' % USERNAME,
+                                    PASSWORD)
+    user.groups.add(group_list[0])
+
+    # The first package has the most releases, the others a long tail
+    counts = [max_releases] + [
+        min(max_releases, int(rng.paretovariate(RELEASES_ALPHA)))
+        for number in xrange(1, packages)]
+    names = [package_name(number) for number in xrange(packages)]
+    _insert(Package, [Package(name=name) for name in names])
+
+    owners, restricted = [], []
+    for number, name in enumerate(names):
+        owners.append(Package.owners.through(
+            package_id=name, group_id=rng.choice(group_list).pk))
+        if number and rng.random() < RESTRICTED_SHARE:
+            restricted.append(Package.download_permissions.through(
+                package_id=name, group_id=rng.choice(group_list).pk))
+    _insert(Package.owners.through, owners)
+    _insert(Package.download_permissions.through, restricted)
+    restricted_names = set(row.package_id for row in restricted)
+    public_names = [name for name in names if name not in restricted_names]
+
+    releases = []
+    for name, count in zip(names, counts):
+        for number in xrange(count):
+            releases.append(_release(name, number, count))
+    _insert(Release, releases)
+    del releases
+
+    # Releases depend on public packages that come after their own, so that
+    # a requirement pulls in a tree of them
+    position = dict((name, number) for number, name in enumerate(public_names))
+    dependency_rows = []
+    for pk, name in Release.objects.order_by('pk') \
+            .values_list('pk', 'package').iterator():
+        later = public_names[position.get(name, -1) + 1:]
+        for dependency in rng.sample(
+                later, min(len(later), rng.randint(0, MAX_DEPENDENCIES))):
+            dependency_rows.append(Dependency(release_id=pk, name=dependency))
+    _insert(Dependency, dependency_rows)
+
+    files = []
+    for pk, name, version in Release.objects.order_by() \
+            .values_list('pk', 'package', 'version').iterator():
+        filename = '%s-%s.tar.gz' % (name, version)
+        files.append(Distribution(release_id=pk, uploader_id=user.pk,
+                                  content=os.path.join(filename[0], filename),
+                                  filename=filename, md5_digest='0' * 32,
+                                  filetype='sdist'))
+    _insert(Distribution, files)
+    transaction.commit_unless_managed()
+
+    # Only the files of the sample packages, whose pages show their sizes,
+    # need to exist
+    largest = Package.objects.get(name=names[0])
+    public = [(count, name) for name, count in zip(names, counts)
+              if name not in restricted_names]
+    typical = sorted(public)[len(public) // 2][1]
+    for dist in Distribution.objects.filter(
+            release__package__in=[largest.name, typical]) \
+            .select_related('release'):
+        dist.content.storage.save(dist.content.name, ContentFile(
+            _sdist(dist.release.package_id, dist.release.version)))
+    download = Distribution.objects.get(release=largest.latest)
+
+    return {
+        'packages': packages,
+        'releases': sum(counts),
+        'distributions': sum(counts),
+        'max_releases': max_releases,
+        'groups': groups,
+        'restricted': len(restricted),
+        'dependencies': len(dependency_rows),
+        'seed': seed,
+        'samples': {'largest': largest.name, 'typical': typical,
+                    'version': largest.latest.version,
+                    'download': download.content.name,
+                    'requirements': '\n'.join(sorted(rng.sample(
+                        public_names,
+                        min(REQUIREMENTS, len(public_names)))))},
+    }
+
+def _auth():
+    return 'Basic %s' % ('%s:%s' % (USERNAME, PASSWORD)) \
+                        .encode('base64').strip()
+
+def _xmlrpc(method, *args):
+    def scenario(client, dataset, iteration):
+        body = xmlrpclib.dumps(tuple(arg % dataset['samples']
+                                     if isinstance(arg, basestring) else arg
+                                     for arg in args), method)
+        return client.post(reverse('djangopypi-release-index'), body,
+                           content_type='text/xml')
+    return scenario
+
+def _get(url_name, query=None, **kwargs):
+    def scenario(client, dataset, iteration):
+        url = reverse(url_name, kwargs=dict(
+            (key, value % dataset['samples'])
+            for key, value in kwargs.iteritems()))
+        return client.get(url, query or {}, HTTP_AUTHORIZATION=_auth())
+    return scenario
+
+def _upload(client, dataset, iteration):
+    """ A distutils upload of a new release, encoded like distutils does """
+    version = '%d.0' % (iteration + 1,)
+    fields = [(':action', 'file_upload'), ('name', UPLOAD_PACKAGE),
+              ('version', version), ('metadata_version', '1.0'),
+              ('summary', 'Uploaded by the benchmark'),
+              ('filetype', 'sdist'), ('pyversion', '')]
+    body = StringIO()
+    for key, value in fields:
+        body.write('\n--%s\nContent-Disposition: form-data; name="%s"\n\n%s'
+                   % (BOUNDARY, key, value))
+    body.write('\n--%s\nContent-Disposition: form-data; name="content"; '
+               'filename="%s-%s.tar.gz"\n\n%s' % (
+                   BOUNDARY, UPLOAD_PACKAGE, version,
+                   _sdist(UPLOAD_PACKAGE, version)))
+    body.write('\n--%s--\n' % (BOUNDARY,))
+    return client.post(reverse('djangopypi-release-index'), body.getvalue(),
+                       content_type='multipart/form-data; boundary=%s' % (
+                           BOUNDARY,),
+                       HTTP_AUTHORIZATION=_auth())
+
+def _resolve(client, dataset, iteration):
+    """ A resolution of the requirements of a large application """
+    return client.post(reverse('djangopypi-resolve'),
+                       dataset['samples']['requirements'],
+                       content_type='text/plain', HTTP_AUTHORIZATION=_auth())
+
+# (name, scenario, login) in the order they are run, where login tells that
+# the view wants a session rather than basic authentication. The upload comes
+# last since it invalidates the caches the other ones warm up.
+SCENARIOS = (
+    ('simple_index', _get('djangopypi-package-index-simple'), False),
+    ('simple_details:largest', _get('djangopypi-package-simple',
+                                    package='%(largest)s'), False),
+    ('simple_details:typical', _get('djangopypi-package-simple',
+                                    package='%(typical)s'), False),
+    ('details:largest', _get('djangopypi-package', package='%(largest)s'),
+     True),
+    ('details:typical', _get('djangopypi-package', package='%(typical)s'),
+     True),
+    ('search', _get('djangopypi-search', {'q': 'package-0001'}), False),
+    ('download_dist', _get('djangopypi-download', path='%(download)s'),
+     False),
+    ('rss', _get('djangopypi-rss'), False),
+    ('xmlrpc:list_packages', _xmlrpc('list_packages'), False),
+    ('xmlrpc:package_releases', _xmlrpc('package_releases', '%(largest)s'),
+     False),
+    ('xmlrpc:release_urls', _xmlrpc('release_urls', '%(largest)s',
+                                    '%(version)s'), False),
+    ('xmlrpc:release_data', _xmlrpc('release_data', '%(largest)s',
+                                    '%(version)s'), False),
+    ('resolve', _resolve, False),
+    ('register_or_upload', _upload, False),
+)
+
+def invalidate(dataset):
+    """ Make the caches the views rely on cold """
+    simple.invalidate()
+    classifiers.invalidate()
+    dependencies.invalidate()
+    for name in (dataset['samples']['largest'],
+                 dataset['samples']['typical'], UPLOAD_PACKAGE):
+        simple.invalidate(name)
+        documents.invalidate_package(name)
+    for pk in User.objects.filter(username=USERNAME) \
+                          .values_list('pk', flat=True):
+        permissions.invalidate_user(pk)
+    resolver.INDEX = resolver.VersionIndex()
+
+def peak_memory():
+    """ The peak resident set size of the process, in kilobytes """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+def _measure(scenario, login, dataset, iteration):
+    client = Client()
+    if login:
+        client.login(username=USERNAME, password=PASSWORD)
+    start_queries = len(connection.queries)
+    start = time.time()
+    response = scenario(client, dataset, iteration)
+    elapsed = time.time() - start
+    queries = connection.queries[start_queries:]
+    if hasattr(response, 'close'):
+        response.close()
+    return {
+        'status': response.status_code,
+        'time': elapsed * 1000,
+        'queries': len(queries),
+        'query_time': sum(float(query['time']) for query in queries) * 1000,
+    }
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def run(dataset, repeat=5, names=None, verbosity=0, stdout=sys.stdout):
+    """ Run the scenarios over a seeded ``dataset``, all of them or those in
+    ``names``, and return the report """
+    # Leave the one-off costs of the process, such as loading templates and
+    # url patterns, out of the first scenario
+    Client().get(reverse('djangopypi-release-index'))
+
+    results = {}
+    old_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    # Every request is served by this process, which sees its own cache
+    # invalidated, so the warm runs are served from it like with memcached
+    old_shared_cache = conf.SHARED_CACHE
+    conf.SHARED_CACHE = True
+    # Keep the queries of a request around until they are counted
+    request_started.disconnect(reset_queries)
+    try:
+        for name, scenario, login in SCENARIOS:
+            if names and name not in names:
+                continue
+            peak_before = peak_memory()
+            invalidate(dataset)
+            cold = _measure(scenario, login, dataset, 0)
+            warm = [_measure(scenario, login, dataset, iteration)
+                    for iteration in xrange(1, repeat + 1)]
+            times = [measure['time'] for measure in warm] or [cold['time']]
+            results[name] = {
+                'status': (warm or [cold])[-1]['status'],
+                'cold_queries': cold['queries'],
+                'queries': (warm or [cold])[-1]['queries'],
+                'cold_time_ms': round(cold['time'], 2),
+                'min_time_ms': round(min(times), 2),
+                'time_ms': round(_median(times), 2),
+                'max_time_ms': round(max(times), 2),
+                'query_time_ms': round(_median(
+                    [measure['query_time'] for measure in warm] or
+                    [cold['query_time']]), 2),
+                'memory_growth_kb': peak_memory() - peak_before,
+            }
+            del connection.queries[:]
+            if verbosity:
+                stdout.write('%-26s %s %4d/%-4d queries %9.2f/%-9.2f ms\n' % (
+                    name, results[name]['status'],
+                    results[name]['cold_queries'], results[name]['queries'],
+                    results[name]['cold_time_ms'], results[name]['time_ms']))
+    finally:
+        request_started.connect(reset_queries)
+        connection.use_debug_cursor = old_debug_cursor
+        conf.SHARED_CACHE = old_shared_cache
+    return {
+        'dataset': dict((key, value) for key, value in dataset.iteritems()
+                        if key != 'samples'),
+        'environment': {
+            'python': sys.version.split()[0],
+            'django': django.get_version(),
+            'database': settings.DATABASES['default']['ENGINE'],
+        },
+        'repeat': repeat,
+        'peak_memory_kb': peak_memory(),
+        'scenarios': results,
+    }
+
+def compare(report, baseline, tolerance=0.25, slack=1.0):
+    """ The regressions of ``report`` against ``baseline``, as a list of
+    messages. A scenario regresses when it makes more queries, cold or warm,
+    or when its fastest warm time grows by more than ``tolerance`` and
+    ``slack`` milliseconds. The fastest time is the one that varies the least
+    from run to run; cold times vary too much to be compared. """
+    regressions = []
+    if report['dataset'] != baseline['dataset']:
+        regressions.append('The datasets differ: %r and %r' % (
+            report['dataset'], baseline['dataset']))
+    for name, result in sorted(report['scenarios'].iteritems()):
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        if result['status'] != before['status']:
+            regressions.append('%s: status %s, was %s' % (
+                name, result['status'], before['status']))
+        for key in ('cold_queries', 'queries'):
+            if result[key] > before[key]:
+                regressions.append('%s: %s %s, was %s' % (
+                    name, key.replace('_', ' '), result[key], before[key]))
+        limit = max(before['min_time_ms'] * (1 + tolerance),
+                    before['min_time_ms'] + slack)
+        if result['min_time_ms'] > limit:
+            regressions.append('%s: %.2f ms, was %.2f ms' % (
+                name, result['min_time_ms'], before['min_time_ms']))
+    return regressions
+
+@contextmanager
+def isolated_storage():
+    """ Point the storage of distributions at a temporary directory for the
+    duration of the benchmark, so it never writes next to real files """
+    storage = Distribution._meta.get_field('content').storage
+    old_location = storage.location
+    directory = tempfile.mkdtemp(prefix='djangopypi-benchmark-')
+    storage.location = directory
+    try:
+        yield directory
+    finally:
+        storage.location = old_location
+        shutil.rmtree(directory, ignore_errors=True)
+
+# The kinds of archives of the corpus, with the suffix of their files
+ARCHIVE_KINDS = (
+    ('sdist.tar.gz:metadata_last', '.tar.gz'),
+    ('sdist.tar.gz:metadata_first', '.tar.gz'),
+    ('sdist.zip', '.zip'),
+    ('egg', '-py2.7.egg'),
+    ('wheel', '-py2-none-any.whl'),
+)
+
+def _pkginfo_metadata(path):
+    """ The metadata of ``path`` as ``pkginfo`` reads it, listing every
+    member of a tarball first """
+    cls = {'sdist': pkginfo.SDist, 'egg': pkginfo.BDist,
+           'wheel': getattr(pkginfo, 'Wheel', None)}.get(archives.kind(path))
+    if cls is None:
+        return None
+    return cls(path)
+
+# Readers of the metadata of an archive, by name
+ARCHIVE_READERS = {
+    'archives': archives.get_metadata,
+    'pkginfo': _pkginfo_metadata,
+}
+
+def _tar(path, members):
+    archive = tarfile.open(path, 'w:gz')
+    try:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, StringIO(data))
+    finally:
+        archive.close()
+
+def _zip(path, members):
+    archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+    try:
+        for name, data in members:
+            archive.writestr(name, data)
+    finally:
+        archive.close()
+
+def archive_corpus(directory, count=40, member_size=2 * 1024 * 1024,
+                   modules=200, seed=0):
+    """ Write ``count`` archives of each of the ``ARCHIVE_KINDS`` to
+    ``directory``, and return their ``(kind, path)``. The tarballs hold two
+    incompressible members of ``member_size`` bytes, with the PKG-INFO
+    before or after them, as setuptools and other tools write it; the zip
+    files hold ``modules`` small modules. """
+    rng = random.Random(seed)
+    data = ('%0*x' % (member_size * 2, rng.getrandbits(member_size * 8))) \
+           .decode('hex')
+    corpus = []
+    for number in xrange(count):
+        name = 'archive%d' % (number,)
+        pkg_info = 'Metadata-Version: 1.1\nName: %s\nVersion: 1.0\n' % (
+            name,)
+        root = '%s-1.0' % (name,)
+        large = [('%s/data%d.bin' % (root, index), data)
+                 for index in xrange(2)]
+        sources = [('%s/module%d.py' % (name, index), 'x = %d\n' % index * 200)
+                   for index in xrange(modules)]
+        members = {
+            'sdist.tar.gz:metadata_last': large + [
+                ('%s/%s.egg-info/PKG-INFO' % (root, name), pkg_info),
+                ('%s/PKG-INFO' % (root,), pkg_info)],
+            'sdist.tar.gz:metadata_first': [
+                ('%s/PKG-INFO' % (root,), pkg_info)] + large,
+            'sdist.zip': sources + [('%s/PKG-INFO' % (root,), pkg_info)],
+            'egg': sources + [('EGG-INFO/PKG-INFO', pkg_info)],
+            'wheel': sources + [('%s.dist-info/METADATA' % (root,),
+                                 pkg_info)],
+        }
+        for kind, suffix in ARCHIVE_KINDS:
+            path = os.path.join(directory, '%s-%s%s' % (
+                kind.replace(':', '-').replace('.', '-'), root, suffix))
+            if suffix.endswith('.tar.gz'):
+                _tar(path, members[kind])
+            else:
+                _zip(path, members[kind])
+            corpus.append((kind, path))
+    return corpus
+
+def run_archives(corpus, repeat=3, verbosity=0, stdout=sys.stdout):
+    """ Read the metadata of every archive of ``corpus`` with each of the
+    ``ARCHIVE_READERS``, ``repeat`` times, and return the report: the
+    median total time of each reader over each kind of archive """
+    results = {}
+    for reader_name, reader in sorted(ARCHIVE_READERS.iteritems()):
+        totals = dict((kind, []) for kind, suffix in ARCHIVE_KINDS)
+        for iteration in xrange(repeat):
+            elapsed = dict((kind, 0.0) for kind in totals)
+            for kind, path in corpus:
+                start = time.time()
+                metadata = reader(path)
+                elapsed[kind] += time.time() - start
+                if metadata is None or metadata.version != '1.0':
+                    raise ValueError('%s read no metadata from %s' % (
+                        reader_name, path))
+            for kind, value in elapsed.iteritems():
+                totals[kind].append(value * 1000)
+        results[reader_name] = dict(
+            (kind, round(_median(values), 2))
+            for kind, values in totals.iteritems())
+        results[reader_name]['total'] = round(
+            sum(results[reader_name].values()), 2)
+        if verbosity:
+            stdout.write('%-10s %9.2f ms  %s\n' % (
+                reader_name, results[reader_name]['total'],
+                '  '.join('%s=%.2f' % (kind, results[reader_name][kind])
+                          for kind, suffix in ARCHIVE_KINDS)))
+    return {
+        'archives': len(corpus),
+        'environment': {'python': sys.version.split()[0]},
+        'repeat': repeat,
+        'readers': results,
+    }
+
+# Ways of loading every release, by name: listing them without reading their
+# metadata, which leaves package_info undecoded, then reading a column, and
+# reading the metadata, which decodes it as every load once did
+RELEASE_LOADS = (
+    ('list', lambda release: None),
+    ('list+summary', lambda release: release.summary),
+    ('list+package_info', lambda release: release.package_info),
+)
+
+def seed_releases(count=100000, per_package=100):
+    """ Fill the database with ``count`` releases, ``per_package`` to a
+    package, for ``run_releases`` """
+    names = [package_name(number) for number in
+             xrange((count + per_package - 1) // per_package)]
+    _insert(Package, [Package(name=name) for name in names])
+    releases = []
+    for number in xrange(count):
+        name = names[number // per_package]
+        releases.append(_release(name, number % per_package, per_package))
+        if len(releases) == BATCH_SIZE:
+            _insert(Release, releases)
+            releases = []
+    _insert(Release, releases)
+    return {'releases': count, 'per_package': per_package}
+
+def run_releases(dataset, repeat=3, verbosity=0, stdout=sys.stdout):
+    """ Load every release of the ``dataset`` seeded by ``seed_releases``
+    with each of the ``RELEASE_LOADS``, ``repeat`` times, and return the
+    report: the fastest and the median time of each """
+    results = {}
+    for name, read in RELEASE_LOADS:
+        times = []
+        for iteration in xrange(repeat):
+            start = time.time()
+            releases = list(Release.objects.all())
+            for release in releases:
+                read(release)
+            times.append((time.time() - start) * 1000)
+            del releases
+        results[name] = {'min_time_ms': round(min(times), 2),
+                         'time_ms': round(_median(times), 2)}
+        if verbosity:
+            stdout.write('%-18s %9.2f/%-9.2f ms\n' % (
+                name, results[name]['min_time_ms'], results[name]['time_ms']))
+    return {
+        'dataset': dataset,
+        'environment': {
+            'python': sys.version.split()[0],
+            'database': settings.DATABASES['default']['ENGINE'],
+            'json': getattr(models.json_loads, '__module__', None),
+        },
+        'repeat': repeat,
+        'loads': results,
+    }
@@ -0,0 +1,54 @@
+""" Browsing packages by trove classifier.
+
+The number of packages filed under each classifier is computed with a single
+grouped query over the release to classifier relation, and cached per
+permission scope (see ``djangopypi.permissions``) until a release or the
+download permissions of a package change. """
+import time
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from djangopypi import conf, permissions, simple, singleflight
+from djangopypi.models import Release
+
+GENERATION_KEY = 'djangopypi:classifiers:generation'
+
+def generation():
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        cache.add(GENERATION_KEY, int(time.time() * 1000),
+                  conf.CLASSIFIER_CACHE_TIMEOUT)
+        value = cache.get(GENERATION_KEY)
+    return value
+
+def invalidate():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        pass
+
+def visible_releases(user):
+    """ The releases listed to ``user``, as in the release index """
+    releases = Release.objects.filter(hidden=False)
+    if not user.is_superuser:
+        releases = releases.filter(
+            package__in=permissions.user_packages(user).values('name'))
+    return releases
+
+def counts(user):
+    """ ``(classifier name, number of packages)`` for every classifier used by
+    a package ``user`` can see, ordered by name """
+    key = 'djangopypi:classifiers:counts:%s:%s:%s' % (
+        generation(), simple.generation(None), permissions.user_scope(user))
+
+    def build():
+        return list(Release.classifiers.through.objects
+                    .filter(release__in=visible_releases(user).values('pk'))
+                    .values('classifier')
+                    .annotate(packages=Count('release__package',
+                                             distinct=True))
+                    .order_by('classifier')
+                    .values_list('classifier', 'packages'))
+
+    return singleflight.cached(key, build, conf.CLASSIFIER_CACHE_TIMEOUT)
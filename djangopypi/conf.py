@@ -44,6 +44,7 @@ DIST_FILE_TYPES = (
     ('bdist_wininst','MS Windows installer'),
     ('bdist_egg','Python Egg'),
     ('bdist_dmg','OS X Disk Image'),
+    ('bdist_wheel','Wheel'),
 )
 
 PYTHON_VERSIONS = (
@@ -72,11 +73,18 @@ METADATA_FIELDS = {
             'requires_dist','provides_dist','obsoletes_dist',
             'requires_python','requires_external','project_url'),
 }
+METADATA_FIELDS['2.0'] = METADATA_FIELDS['1.2']
+METADATA_FIELDS['2.1'] = METADATA_FIELDS['1.2'] + (
+    'description_content_type', 'provides_extra')
+METADATA_FIELDS['2.2'] = METADATA_FIELDS['2.1'] + ('dynamic',)
 
 METADATA_FORMS = {
     '1.0': 'djangopypi.forms.Metadata10Form',
     '1.1': 'djangopypi.forms.Metadata11Form',
     '1.2': 'djangopypi.forms.Metadata12Form',
+    '2.0': 'djangopypi.forms.Metadata12Form',
+    '2.1': 'djangopypi.forms.Metadata21Form',
+    '2.2': 'djangopypi.forms.Metadata22Form',
 }
 
 FALLBACK_VIEW = 'djangopypi.views.releases.index'
@@ -85,6 +93,7 @@ ACTION_VIEWS = {
     "file_upload": 'djangopypi.views.distutils.register_or_upload', #``sdist`` command
     "submit": 'djangopypi.views.distutils.register_or_upload', #``register`` command
     "list_classifiers": 'djangopypi.views.distutils.list_classifiers', #``list_classifiers`` command
+    "batch_upload": 'djangopypi.views.distutils.batch_upload', #several files of a release at once
 }
 
 XMLRPC_COMMANDS = {
@@ -100,14 +109,144 @@ XMLRPC_COMMANDS = {
 """ These settings enable proxying of packages that are not in the local index 
 to another index, http://pypi.python.org/ by default. This feature is disabled 
 by default and can be enabled by setting DJANGOPYPI_PROXY_MISSING to True in 
-your settings file. """
+your settings file. Proxied packages are mirrored locally, owned by the
+PROXY_USER user, and checked for new files against the upstream index once
+their PROXY_TTL (in seconds) has passed. Packages the upstream index does not
+know are not asked for again for PROXY_NEGATIVE_TTL seconds. """
 PROXY_BASE_URL = 'http://pypi.python.org/simple'
 
 PROXY_MISSING = False
 
+PROXY_TTL = 60 * 30
+
+PROXY_NEGATIVE_TTL = 60 * 5
+
+PROXY_TIMEOUT = 30
+
+PROXY_USER = 'pypi-mirror'
+
 """ Allow any user to maintain a package. """
 GLOBAL_OWNERSHIP = False
 
+""" How long, in seconds, the precomputed JSON documents of packages and
+releases are kept in the cache. They are invalidated whenever a release or
+distribution changes, so this only bounds how long an unused document lingers.
+"""
+DOCUMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+""" How long, in seconds, rendered simple index pages are kept in the cache.
+Like the JSON documents, they are invalidated on changes. """
+SIMPLE_CACHE_TIMEOUT = 60 * 60 * 24
+
+""" Whether the cache is shared by every process serving the index. Pages,
+documents, permission sets and the other values invalidated on changes are
+only cached when it is, since a process cannot see the others invalidate its
+own cache. None guesses it from the backend: the local memory and dummy
+caches are not shared. Set it to True for a local memory cache in a single
+process. """
+SHARED_CACHE = None
+
+""" A directory that the anonymous part of the simple index is exported to, so
+it can be served by a plain web server. When set, packages are exported again
+as they change; ``manage.py export_simple`` does a full export. """
+STATIC_EXPORT_ROOT = None
+
+""" How long, in seconds, a worker waits for another one that is already
+rebuilding the same cached page, document or permission set before building
+it itself, and how long the lease marking such a rebuild is held at most. """
+COALESCE_WAIT = 10
+COALESCE_LEASE = 30
+
+""" How long, in seconds, the set of packages each group of users may download
+is kept in the cache. It is dropped when packages, download permissions or the
+groups of a user change, which only reaches every worker with a shared cache
+backend such as memcached: without ``SHARED_CACHE``, the sets are not cached.
+Downloads are always checked in the database. """
+PERMISSION_CACHE_TIMEOUT = 60 * 60
+
+""" How long, in seconds, the package counts of the classifier browser are
+kept in the cache. They are recomputed when releases or permissions change. """
+CLASSIFIER_CACHE_TIMEOUT = 60 * 60 * 24
+
+""" How long, in seconds, the dependency closures of releases are kept in the
+cache. They are recomputed when releases or their dependencies change. """
+DEPENDENCY_CACHE_TIMEOUT = 60 * 60 * 24
+
+""" The upper bounds, in seconds, of the latency histograms of
+``djangopypi.metrics``, and in number of queries, of the histograms of
+database queries per request. """
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                           5, 10)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+""" How many of the last requests ``djangopypi.metrics`` keeps. """
+METRICS_BUFFER_SIZE = 1000
+
+""" Addresses allowed to read the metrics without logging in, such as that of
+the Prometheus server, none by default: behind a proxy, every request comes
+from the address of the proxy. Staff users may always read them. """
+METRICS_ALLOWED_IPS = ()
+
+""" Where ``djangopypi.middleware.ProfilingMiddleware`` writes the profiles of
+slow requests; profiling is off until it is set. A ``PROFILE_SAMPLE_RATE``
+share of the requests is profiled, by sampling its stack every
+``PROFILE_INTERVAL`` seconds, and kept when it took ``PROFILE_THRESHOLD``
+seconds or more. Only the last ``PROFILE_MAX_PROFILES`` profiles are kept,
+with up to ``PROFILE_MAX_QUERIES`` queries each. """
+PROFILE_ROOT = None
+PROFILE_SAMPLE_RATE = 0.05
+PROFILE_INTERVAL = 0.005
+PROFILE_THRESHOLD = 1.0
+PROFILE_MAX_PROFILES = 100
+PROFILE_MAX_QUERIES = 1000
+
+""" Where ``djangopypi.downloads`` counts downloads until they are written to
+the database: ``'memory'`` for the memory of each worker, ``'cache'`` for the
+shared cache, which should then be memcached or alike, or ``None`` to not
+count them. Each worker writes its counts after a request once
+``DOWNLOAD_FLUSH_INTERVAL`` seconds have passed since it last did, or once
+``DOWNLOAD_FLUSH_SIZE`` distinct distributions were downloaded. """
+DOWNLOAD_COUNTER = 'memory'
+DOWNLOAD_FLUSH_INTERVAL = 60
+DOWNLOAD_FLUSH_SIZE = 1000
+
+""" Where the audit and access events of ``djangopypi.events`` are written:
+any of ``'logging'``, to the ``djangopypi.events`` logger, ``'jsonl'`` and
+``'sqlite'``, to files in ``EVENT_ROOT``. A background thread writes up to
+``EVENT_BATCH_SIZE`` events at a time, ``EVENT_FLUSH_INTERVAL`` seconds after
+the first of them was queued, and events beyond ``EVENT_QUEUE_SIZE`` queued
+ones are dropped. The JSON lines file is rotated once it reaches
+``EVENT_ROTATE_SIZE`` bytes, and events older than ``EVENT_KEEP_DAYS`` days
+are removed. """
+EVENT_SINKS = ('logging',)
+EVENT_ROOT = None
+EVENT_BATCH_SIZE = 500
+EVENT_FLUSH_INTERVAL = 1.0
+EVENT_QUEUE_SIZE = 10000
+EVENT_ROTATE_SIZE = 64 * 1024 * 1024
+EVENT_KEEP_DAYS = 90
+
+""" How many threads hash the files of a ``batch_upload`` request at once """
+UPLOAD_HASH_THREADS = 4
+
+""" Where ``djangopypi.uploads`` stages the files uploaded in chunks, by
+default a ``-staging`` directory next to ``RELEASE_UPLOAD_TO``, which should
+be on the same file system for committing them to be a rename. Sessions not
+used for ``UPLOAD_SESSION_TTL`` seconds are removed by ``manage.py
+clean_uploads``. """
+UPLOAD_STAGING_ROOT = None
+UPLOAD_SESSION_TTL = 60 * 60 * 24
+
+""" The upload receiver of ``manage.py receive_uploads`` hands the complete
+requests to ``RECEIVER_THREADS`` threads, and refuses bodies larger than
+``RECEIVER_MAX_BODY`` bytes. Bodies are spooled to temporary files in
+``RECEIVER_SPOOL_ROOT``, the temporary directory by default, and
+connections sending nothing for ``RECEIVER_TIMEOUT`` seconds are closed. """
+RECEIVER_THREADS = 4
+RECEIVER_MAX_BODY = 1024 * 1024 * 1024
+RECEIVER_SPOOL_ROOT = None
+RECEIVER_TIMEOUT = 5 * 60
+
 for k in dir(settings):
     if k.startswith('DJANGOPYPI_'):
         locals()[k.split('DJANGOPYPI_', 1)[1]] = getattr(settings, k)
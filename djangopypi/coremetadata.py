@@ -0,0 +1,75 @@
+""" The core metadata files of distributions (PEP 658), served next to them at
+``<file url>.metadata`` so that installers can read the dependencies of a
+file without downloading it.
+
+The metadata is extracted once, when the file of a distribution is saved,
+and stored beside the file with its sha256 digest recorded on the
+``Distribution``, so requests never open the archive. Wheels always have
+such a file. Source distributions only get one when their PKG-INFO is at
+least metadata version 2.2, the first where its fields must match those of
+the built package (PEP 643). """
+import hashlib
+from email.parser import HeaderParser
+
+from django.core.files.base import ContentFile
+
+from djangopypi import archives
+
+SUFFIX = '.metadata'
+
+# Metadata versions whose fields may be trusted in a source distribution
+STATIC_SDIST_VERSION = (2, 2)
+
+def metadata_path(path):
+    """ Where the metadata of the distribution stored at ``path`` goes """
+    return path + SUFFIX
+
+def _metadata_version(data):
+    value = HeaderParser().parsestr(data).get('Metadata-Version', '')
+    try:
+        return tuple(int(part) for part in value.strip().split('.'))
+    except ValueError:
+        return ()
+
+def extract(fileobj, filename):
+    """ The core metadata of the distribution in ``fileobj``, or None when it
+    has none that installers could rely on """
+    archive_kind = archives.kind(filename)
+    if archive_kind not in ('wheel', 'sdist'):
+        return None
+    data = archives.read_metadata(fileobj, filename)
+    if data is None:
+        return None
+    if archive_kind == 'wheel' or \
+       _metadata_version(data) >= STATIC_SDIST_VERSION:
+        return data
+    return None
+
+def read_distribution(dist):
+    """ Extract the metadata of a ``Distribution`` whose file is in
+    storage """
+    try:
+        fileobj = dist.content.storage.open(dist.content.name, 'rb')
+    except (IOError, OSError):
+        return None
+    try:
+        return extract(fileobj, dist.filename)
+    finally:
+        fileobj.close()
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def store(dist, data):
+    """ Write the metadata file of a saved ``Distribution`` """
+    storage = dist.content.storage
+    path = metadata_path(dist.content.name)
+    if storage.exists(path):
+        storage.delete(path)
+    storage.save(path, ContentFile(data))
+
+def delete(dist):
+    storage = dist.content.storage
+    path = metadata_path(dist.content.name)
+    if storage.exists(path):
+        storage.delete(path)
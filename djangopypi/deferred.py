@@ -0,0 +1,67 @@
+""" Work deferred until the transaction of a view commits.
+
+The signal receivers of ``djangopypi.models`` drop cached pages and export
+packages when rows change. Done before the transaction that changed the rows
+commits, another request could rebuild a page from the rows as they were and
+cache it in place of the dropped one. Views that write in a transaction are
+decorated with ``commit_on_success`` from this module, and the receivers
+hand their work to ``on_commit``, which runs it once the outermost of those
+views has committed, or drops it when the transaction is rolled back. Outside
+such a view, e.g. in a management command, the work runs at once. """
+import threading
+
+from django.db import transaction
+
+try:
+    from functools import wraps
+except ImportError:
+    from django.utils.functional import wraps
+
+_local = threading.local()
+
+def _pending():
+    if not hasattr(_local, 'pending'):
+        _local.depth, _local.pending = 0, []
+    return _local.pending
+
+def on_commit(func, *args):
+    """ Call ``func(*args)`` once the current transaction commits. The same
+    call is only made once per transaction. """
+    pending = _pending()
+    if not _local.depth:
+        func(*args)
+    elif (func, args) not in pending:
+        pending.append((func, args))
+
+def discard():
+    """ Drop the calls waiting for the current transaction """
+    del _pending()[:]
+
+def rollback():
+    """ Roll the current transaction back, with the calls waiting for it """
+    transaction.rollback()
+    discard()
+
+def commit_on_success(func):
+    """ Like ``django.db.transaction.commit_on_success``, then make the calls
+    that waited for the commit """
+    managed = transaction.commit_on_success(func)
+
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        _pending()
+        _local.depth += 1
+        try:
+            result = managed(*args, **kwargs)
+        except:
+            _local.depth -= 1
+            if not _local.depth:
+                discard()
+            raise
+        _local.depth -= 1
+        if not _local.depth:
+            pending, _local.pending = _local.pending, []
+            for call, call_args in pending:
+                call(*call_args)
+        return result
+    return wrapped
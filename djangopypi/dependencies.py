@@ -0,0 +1,137 @@
+""" Queries over the dependency index, the ``Dependency`` rows parsed from the
+``Requires`` and ``Requires-Dist`` metadata of every release.
+
+Dependencies are followed through the highest local release that satisfies
+the specifier, ignoring environment markers but skipping requirements that
+only apply to an extra. Closures are memoized in the cache until a release or
+its dependencies change. """
+import time
+
+from django.core.cache import cache
+
+from djangopypi import conf, singleflight, versions
+from djangopypi.models import Package, Release, Dependency
+from djangopypi.requirements import normalize_name
+
+GENERATION_KEY = 'djangopypi:dependencies:generation'
+
+def generation():
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        cache.add(GENERATION_KEY, int(time.time() * 1000),
+                  conf.DEPENDENCY_CACHE_TIMEOUT)
+        value = cache.get(GENERATION_KEY)
+    return value
+
+def invalidate():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        pass
+
+def is_optional(marker):
+    """ Whether a requirement only applies when an extra is requested """
+    return 'extra' in marker
+
+def _safe_matches(specifier, version, prereleases=True):
+    try:
+        return versions.matches(specifier, version, prereleases)
+    except versions.InvalidSpecifier:
+        return False
+
+def dependents(name, version=None):
+    """ ``(package, version, specifier, marker)`` for every release that
+    depends on ``name``, only counting those whose specifier admits
+    ``version`` when it is given """
+    rows = Dependency.objects.filter(name=normalize_name(name)) \
+                             .order_by('release__package', 'release__id') \
+                             .values_list('release__package',
+                                          'release__version',
+                                          'specifier', 'marker')
+    if version is None:
+        return list(rows)
+    return [row for row in rows if _safe_matches(row[2], version)]
+
+class Index(object):
+    """ Lookups used while walking the dependency graph, each done once per
+    walk """
+
+    def __init__(self):
+        self._names = None
+        self._releases = {}
+        self._edges = {}
+
+    def package_name(self, name):
+        """ The local package named ``name`` once normalized, or None """
+        if self._names is None:
+            self._names = dict((normalize_name(n), n) for n in
+                               Package.objects.values_list('name', flat=True))
+        return self._names.get(name)
+
+    def best_release(self, package, specifier):
+        """ ``(pk, version)`` of the highest release of ``package`` matching
+        ``specifier``, preferring final releases, or None """
+        if package not in self._releases:
+            self._releases[package] = sorted(
+                ((versions.parse(v), pk) for pk, v in
+                 Release.objects.filter(package=package)
+                                .values_list('pk', 'version')),
+                reverse=True)
+        for prereleases in (False, True):
+            for version, pk in self._releases[package]:
+                if _safe_matches(specifier, version, prereleases):
+                    return pk, version.string
+        return None
+
+    def requirements(self, release_pks):
+        """ Load the requirements of ``release_pks`` in one query """
+        missing = [pk for pk in release_pks if pk not in self._edges]
+        for pk in missing:
+            self._edges[pk] = []
+        if missing:
+            for pk, name, specifier, marker in Dependency.objects \
+                    .filter(release__in=missing) \
+                    .values_list('release', 'name', 'specifier', 'marker'):
+                if not is_optional(marker):
+                    self._edges[pk].append((name, specifier))
+        return dict((pk, self._edges[pk]) for pk in release_pks)
+
+def _closure_key(release_pk):
+    return 'djangopypi:dependencies:closure:%s:%s' % (generation(), release_pk)
+
+def _walk(release, index):
+    """ Breadth first walk from a release, reusing the memoized closures of
+    the releases it reaches """
+    found = {}
+    seen = set([release.pk])
+    level = [release.pk]
+    while level:
+        next_level = []
+        for pk, requirements in index.requirements(level).iteritems():
+            for name, specifier in requirements:
+                package = index.package_name(name)
+                best = package and index.best_release(package, specifier)
+                if not best:
+                    found.setdefault(name, None)
+                    continue
+                found[name] = best[1]
+                if best[0] in seen:
+                    continue
+                seen.add(best[0])
+                memoized = cache.get(_closure_key(best[0]))
+                if memoized is not None:
+                    for dep_name, dep_version in memoized:
+                        found.setdefault(dep_name, dep_version)
+                else:
+                    next_level.append(best[0])
+        level = next_level
+    found.pop(normalize_name(release.package_id), None)
+    return sorted(found.iteritems())
+
+def closure(release):
+    """ ``(name, version)`` for every package ``release`` depends on, directly
+    or not, sorted by name. The version is that of the release that was
+    followed, or None when no local release satisfies the requirement. """
+    return singleflight.cached(_closure_key(release.pk),
+                               lambda: _walk(release, Index()),
+                               conf.DEPENDENCY_CACHE_TIMEOUT)
@@ -0,0 +1,142 @@
+""" Precomputed JSON documents describing packages and releases, in the same
+shape as the ``/pypi/<name>/json`` API of pypi.python.org.
+
+Documents are built once from the release metadata and distribution rows and
+then kept in the cache, together with their ETag, until one of the signal
+receivers in ``djangopypi.models`` invalidates them, or new download counts
+are written by ``djangopypi.downloads``. Their keys carry the generation of
+the simple page of their package, which the receivers bump along with it. """
+import hashlib
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.utils import simplejson as json
+
+from djangopypi import conf, downloads, simple, singleflight
+from djangopypi.models import Distribution
+
+INFO_FIELDS = ('summary', 'description', 'keywords', 'home_page',
+               'download_url', 'author', 'author_email', 'maintainer',
+               'maintainer_email', 'license', 'platform', 'requires_python',)
+
+INFO_LIST_FIELDS = ('classifier', 'requires', 'requires_dist', 'provides',
+                    'provides_dist', 'obsoletes', 'obsoletes_dist',
+                    'project_url',)
+
+def _cache_key(package_name, version=None):
+    # A document built while its package changed is left under the previous
+    # generation of the package's page
+    prefix = 'djangopypi:json:%s:%s' % (package_name,
+                                        simple.generation(package_name))
+    if version is None:
+        return prefix
+    return '%s:%s' % (prefix, version)
+
+def release_info(release):
+    """ The ``info`` block of a document, built from ``Release.package_info``
+    """
+    info = {
+        'name': release.package_id,
+        'version': release.version,
+        'metadata_version': release.metadata_version,
+        'package_url': reverse('djangopypi-package',
+                               kwargs={'package': release.package_id}),
+        'release_url': reverse('djangopypi-release',
+                               kwargs={'package': release.package_id,
+                                       'version': release.version}),
+    }
+    for field in INFO_FIELDS:
+        info[field] = release.package_info.get(field, u'')
+    for field in INFO_LIST_FIELDS:
+        info[field] = release.package_info.getlist(field)
+    info['classifiers'] = info.pop('classifier')
+    info['description'] = release.description
+    return info
+
+def distribution_info(dist, count=0):
+    """ A file entry of a document, downloaded ``count`` times """
+    try:
+        size = dist.content.size
+    except (OSError, IOError):
+        size = None
+
+    return {
+        'filename': dist.filename,
+        'url': dist.content.url,
+        'packagetype': dist.filetype,
+        'python_version': dist.pyversion,
+        'python_tag': dist.python_tag,
+        'abi_tag': dist.abi_tag,
+        'platform_tag': dist.platform_tag,
+        'size': size,
+        'md5_digest': dist.md5_digest,
+        'digests': {'md5': dist.md5_digest},
+        'has_sig': bool(dist.signature),
+        'comment_text': dist.comment,
+        'downloads': count,
+        'upload_time': dist.created.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def _encode(document):
+    body = json.dumps(document, separators=(',', ':'))
+    return '"%s"' % hashlib.md5(body).hexdigest(), body
+
+def build_package_document(package):
+    """ Build the document for a package: the metadata of its latest release,
+    and the files of every release """
+    releases = list(package.releases.all())
+    dists = list(Distribution.objects.filter(release__package=package))
+    counts = downloads.totals([dist.pk for dist in dists])
+    files = {}
+    for dist in dists:
+        files.setdefault(dist.release_id, []).append(
+            distribution_info(dist, counts[dist.pk]))
+
+    latest = package.latest
+    if latest is None:
+        info = {'name': package.name, 'version': None,
+                'package_url': package.get_absolute_url()}
+        urls = []
+    else:
+        info = release_info(latest)
+        info['downloads'] = downloads.recent(counts.keys())
+        urls = files.get(latest.pk, [])
+
+    return _encode({
+        'info': info,
+        'releases': dict((r.version, files.get(r.pk, [])) for r in releases),
+        'urls': urls,
+    })
+
+def build_release_document(release):
+    """ Build the document for a single release of a package """
+    dists = list(release.distributions.all())
+    counts = downloads.totals([dist.pk for dist in dists])
+    info = release_info(release)
+    info['downloads'] = downloads.recent(counts.keys())
+    return _encode({
+        'info': info,
+        'urls': [distribution_info(dist, counts[dist.pk]) for dist in dists],
+    })
+
+def package_document(package):
+    """ Return ``(etag, body)`` for a package, from the cache when possible
+    """
+    return singleflight.cached(_cache_key(package.name),
+                               lambda: build_package_document(package),
+                               conf.DOCUMENT_CACHE_TIMEOUT)
+
+def release_document(release):
+    """ Return ``(etag, body)`` for a release, from the cache when possible
+    """
+    return singleflight.cached(_cache_key(release.package_id,
+                                          release.version),
+                               lambda: build_release_document(release),
+                               conf.DOCUMENT_CACHE_TIMEOUT)
+
+def invalidate_package(package_name):
+    cache.delete(_cache_key(package_name))
+
+def invalidate_release(package_name, version):
+    cache.delete_many([_cache_key(package_name),
+                       _cache_key(package_name, version)])
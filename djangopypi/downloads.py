@@ -0,0 +1,241 @@
+""" Download counts of distributions.
+
+Counting a download must not cost the request serving it a write to the
+database, so ``count`` only adds to a counter: in the memory of the process
+when ``DOWNLOAD_COUNTER`` is ``'memory'``, or in the shared cache, with an
+atomic increment, when it is ``'cache'``. The counts are written in bulk to
+``DistributionDownloads``, one row per distribution and day, by ``flush``.
+A worker flushes after a request once ``DOWNLOAD_FLUSH_INTERVAL`` seconds
+have passed since its last flush or ``DOWNLOAD_FLUSH_SIZE`` counters are
+pending.
+
+The counts of a worker that exits before flushing them are lost with the
+``'memory'`` counter, so no more than ``DOWNLOAD_FLUSH_INTERVAL`` seconds of
+its downloads. With the ``'cache'`` counter, they stay in the cache until
+another worker flushes the same counters, or ``manage.py flush_downloads``
+sweeps the counters of every distribution. """
+from __future__ import with_statement
+
+import datetime
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.dispatch import receiver
+
+from djangopypi import conf, singleflight
+from djangopypi.models import Distribution, DistributionDownloads
+
+logger = logging.getLogger(__name__)
+
+# Rows written by a single transaction
+BATCH_SIZE = 500
+
+# How long the shared counters are kept in the cache
+COUNTER_TIMEOUT = 60 * 60 * 24 * 7
+
+FLUSH_KEY = 'djangopypi:downloads:flush'
+
+# The downloads windows of ``recent``, in days including today
+WINDOWS = (('last_day', 1), ('last_week', 7), ('last_month', 30))
+
+_lock = threading.Lock()
+# Counts by (distribution id, day), or the counters touched by this process
+# for the 'cache' counter
+_pending = {}
+_last_flush = [time.time()]
+
+def _counter_key(distribution_id, day):
+    return 'djangopypi:downloads:%s:%d' % (day.isoformat(), distribution_id)
+
+def count(distribution_id):
+    """ Count a download of the distribution ``distribution_id`` today """
+    if not conf.DOWNLOAD_COUNTER:
+        return
+    row = (distribution_id, datetime.date.today())
+    if conf.DOWNLOAD_COUNTER == 'cache':
+        key = _counter_key(*row)
+        if not cache.add(key, 1, COUNTER_TIMEOUT):
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Flushed and expired in between
+                cache.add(key, 1, COUNTER_TIMEOUT)
+        with _lock:
+            _pending[row] = 1
+    else:
+        with _lock:
+            _pending[row] = _pending.get(row, 0) + 1
+
+def due():
+    """ Whether the pending counts should be flushed """
+    with _lock:
+        return bool(_pending) and (
+            len(_pending) >= conf.DOWNLOAD_FLUSH_SIZE or
+            time.time() - _last_flush[0] >= conf.DOWNLOAD_FLUSH_INTERVAL)
+
+def _take():
+    with _lock:
+        pending = _pending.copy()
+        _pending.clear()
+        _last_flush[0] = time.time()
+    return pending
+
+def _restore(pending):
+    with _lock:
+        for row, value in pending.iteritems():
+            if conf.DOWNLOAD_COUNTER == 'cache':
+                _pending[row] = 1
+            else:
+                _pending[row] = _pending.get(row, 0) + value
+
+def flush():
+    """ Write the pending counts to the database. Returns the number of
+    downloads written. """
+    rows = sorted(_take().iteritems())
+    written = 0
+    for start in xrange(0, len(rows), BATCH_SIZE):
+        batch = dict(rows[start:start + BATCH_SIZE])
+        try:
+            if conf.DOWNLOAD_COUNTER == 'cache':
+                written += _flush_counters(batch)
+            else:
+                written += write(batch)
+        except:
+            # Only the batches written so far are gone
+            _restore(dict(rows[start:]))
+            raise
+    return written
+
+def _flush_counters(pending):
+    """ Write the shared counters of ``pending``, holding the flush against
+    other workers so that no count is read twice """
+    with singleflight.lock(FLUSH_KEY):
+        keys = dict((_counter_key(*row), row) for row in pending)
+        counts = {}
+        for key, value in cache.get_many(keys.keys()).iteritems():
+            if value:
+                counts[keys[key]] = value
+        written = write(counts)
+        # Downloads counted since the read stay in the counters
+        for row, value in counts.iteritems():
+            try:
+                cache.decr(_counter_key(*row), value)
+            except ValueError:
+                pass
+        return written
+
+def write(counts):
+    """ Add ``counts``, a dict of download counts by ``(distribution id,
+    day)``, to ``DistributionDownloads``. Counts of distributions that no
+    longer exist are dropped. Returns the number of downloads written. """
+    rows = sorted(counts.iteritems())
+    written = 0
+    for start in xrange(0, len(rows), BATCH_SIZE):
+        batch = dict(rows[start:start + BATCH_SIZE])
+        try:
+            written += _write_batch(batch)
+        except IntegrityError:
+            # Another worker created some of the rows, which now exist
+            written += _write_batch(batch)
+    return written
+
+@transaction.commit_on_success
+def _write_batch(counts):
+    from djangopypi import documents
+
+    releases = {}
+    for pk, package, version in Distribution.objects.filter(
+            pk__in=set(pk for pk, day in counts)) \
+            .values_list('pk', 'release__package', 'release__version'):
+        releases[pk] = (package, version)
+    counts = dict((row, value) for row, value in counts.iteritems()
+                  if row[0] in releases)
+    if not counts:
+        return 0
+
+    existing = {}
+    for pk, distribution, day in DistributionDownloads.objects.filter(
+            distribution__in=set(pk for pk, day in counts),
+            day__in=set(day for pk, day in counts)) \
+            .values_list('pk', 'distribution', 'day'):
+        existing[(distribution, day)] = pk
+    updates = [(value, existing[row]) for row, value in
+               sorted(counts.iteritems()) if row in existing]
+    inserts = [(pk, day, value) for (pk, day), value in
+               sorted(counts.iteritems()) if (pk, day) not in existing]
+
+    qn = connection.ops.quote_name
+    table = qn(DistributionDownloads._meta.db_table)
+    cursor = connection.cursor()
+    if updates:
+        cursor.executemany('UPDATE %s SET %s = %s + %%s WHERE %s = %%s' % (
+            table, qn('count'), qn('count'), qn('id')), updates)
+    if inserts:
+        cursor.executemany('INSERT INTO %s (%s, %s, %s) '
+                           'VALUES (%%s, %%s, %%s)' % (
+            table, qn('distribution_id'), qn('day'), qn('count')), inserts)
+
+    # The JSON documents show the counts
+    for package, version in set(releases[pk] for pk, day in counts):
+        documents.invalidate_release(package, version)
+    return sum(counts.itervalues())
+
+def sweep(days=2):
+    """ Flush the shared counters of every distribution for the last
+    ``days`` days, including those of workers that exited. Returns the
+    number of downloads written. """
+    if conf.DOWNLOAD_COUNTER != 'cache':
+        return flush()
+    today = datetime.date.today()
+    with _lock:
+        for pk in Distribution.objects.values_list('pk', flat=True):
+            for age in xrange(days):
+                _pending[(pk, today - datetime.timedelta(days=age))] = 1
+    return flush()
+
+def reset():
+    """ Drop the pending counts """
+    _take()
+
+def totals(distribution_ids):
+    """ The number of downloads of each of ``distribution_ids``, by id """
+    counts = dict((pk, 0) for pk in distribution_ids)
+    if counts:
+        for row in DistributionDownloads.objects.filter(
+                distribution__in=counts.keys()).values('distribution') \
+                .annotate(total=Sum('count')):
+            counts[row['distribution']] = row['total']
+    return counts
+
+def recent(distribution_ids, today=None):
+    """ The number of downloads of ``distribution_ids`` together in each of
+    ``WINDOWS``, as a dict """
+    today = today or datetime.date.today()
+    counts = dict((name, 0) for name, days in WINDOWS)
+    if not distribution_ids:
+        return counts
+    longest = max(days for name, days in WINDOWS)
+    for day, value in DistributionDownloads.objects.filter(
+            distribution__in=distribution_ids,
+            day__gt=today - datetime.timedelta(days=longest)) \
+            .values_list('day', 'count'):
+        for name, days in WINDOWS:
+            if day > today - datetime.timedelta(days=days):
+                counts[name] += value
+    return counts
+
+@receiver(request_finished)
+def flush_if_due(sender, **kwargs):
+    """ Flush once the response has been sent, so no client waits for it """
+    if not due():
+        return
+    try:
+        flush()
+    except Exception:
+        logger.exception('download counts could not be written, '
+                         'will try again')
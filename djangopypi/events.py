@@ -0,0 +1,385 @@
+""" Structured audit and access events: downloads, uploads, registrations,
+logins and the refusals of any of them.
+
+``emit`` only puts the event on a queue, so the request does not pay for
+formatting or writing it. One thread per process writes the queued events in
+batches to each of the ``EVENT_SINKS``:
+
+``logging``
+    One line per event to the ``djangopypi.events`` logger.
+``jsonl``
+    One JSON object per line appended to ``events.jsonl`` in ``EVENT_ROOT``,
+    which is renamed to ``events.<time>.jsonl`` once it reaches
+    ``EVENT_ROTATE_SIZE`` bytes.
+``sqlite``
+    Rows of an indexed table of ``events.sqlite`` in ``EVENT_ROOT``.
+
+Events older than ``EVENT_KEEP_DAYS`` days are removed from both. When the
+queue holds ``EVENT_QUEUE_SIZE`` events, new ones are dropped and counted in
+``dropped`` rather than slowing requests down. ``manage.py query_events``
+searches the events, e.g. for who downloaded a package. """
+from __future__ import with_statement
+
+import Queue
+import atexit
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from django.utils import simplejson as json
+
+from djangopypi import conf
+
+JSONL_NAME = 'events.jsonl'
+SQLITE_NAME = 'events.sqlite'
+
+# The fields of every event, the others being kept together as JSON by the
+# sqlite sink
+FIELDS = ('time', 'event', 'user', 'package', 'version', 'filename',
+          'address')
+
+# How often old events are removed, in seconds
+PRUNE_INTERVAL = 60 * 60
+
+logger = logging.getLogger(__name__)
+
+_queue = Queue.Queue(conf.EVENT_QUEUE_SIZE)
+_write_lock = threading.Lock()
+_writer = []
+_sinks = []
+dropped = [0]
+
+def emit(event, request=None, **fields):
+    """ Queue an ``event`` with ``fields``. The user and address are taken
+    from ``request`` when given. """
+    if not conf.EVENT_SINKS:
+        return
+    fields['event'] = event
+    fields['time'] = time.time()
+    if request is not None:
+        user = getattr(request, 'user', None)
+        if 'user' not in fields and user is not None and \
+           user.is_authenticated():
+            fields['user'] = user.username
+        fields.setdefault('address', request.META.get('REMOTE_ADDR'))
+    try:
+        _queue.put_nowait(fields)
+    except Queue.Full:
+        dropped[0] += 1
+        return
+    # The writer of a parent process does not run in a forked worker
+    if _writer != [os.getpid()]:
+        _start()
+
+def _start():
+    with _write_lock:
+        if _writer != [os.getpid()]:
+            thread = threading.Thread(target=_run, name='djangopypi-events')
+            thread.daemon = True
+            thread.start()
+            _writer[:] = [os.getpid()]
+
+def _take(first=None):
+    batch = first is not None and [first] or []
+    while len(batch) < conf.EVENT_BATCH_SIZE:
+        try:
+            batch.append(_queue.get_nowait())
+        except Queue.Empty:
+            break
+    return batch
+
+def _write(batch):
+    try:
+        targets = sinks()
+    except Exception:
+        logger.exception('%d events could not be written', len(batch))
+        return
+    for sink in targets:
+        try:
+            sink.write(batch)
+        except Exception:
+            logger.exception('%d events could not be written to %s',
+                             len(batch), sink.name)
+
+def _done(batch):
+    for event in batch:
+        _queue.task_done()
+
+def _run():
+    while True:
+        first = _queue.get()
+        # Let a burst of events make a single batch
+        time.sleep(conf.EVENT_FLUSH_INTERVAL)
+        with _write_lock:
+            batch = _take(first)
+            try:
+                _write(batch)
+            finally:
+                _done(batch)
+
+def flush():
+    """ Write the queued events now, and wait for those being written """
+    while True:
+        with _write_lock:
+            batch = _take()
+            if not batch:
+                break
+            try:
+                _write(batch)
+            finally:
+                _done(batch)
+    _queue.join()
+
+atexit.register(flush)
+
+def sinks():
+    """ The sinks of ``EVENT_SINKS`` """
+    if not _sinks:
+        _sinks[:] = [SINKS[name]() for name in conf.EVENT_SINKS]
+    return _sinks
+
+def reset():
+    """ Drop the queued events and close the sinks, so that they are opened
+    again from the settings """
+    with _write_lock:
+        _done(_take())
+    # The batch being written goes to the sinks it was meant for
+    _queue.join()
+    with _write_lock:
+        for sink in _sinks:
+            sink.close()
+        del _sinks[:]
+        dropped[0] = 0
+
+def _root():
+    if not conf.EVENT_ROOT:
+        raise ValueError('EVENT_ROOT must be set for the %s events sinks' % (
+            ', '.join(conf.EVENT_SINKS),))
+    if not os.path.isdir(conf.EVENT_ROOT):
+        os.makedirs(conf.EVENT_ROOT)
+    return conf.EVENT_ROOT
+
+def format_event(event):
+    """ An event as a line of text, without its time """
+    keys = [key for key in FIELDS[1:] if event.get(key) is not None]
+    keys += sorted(key for key in event if key not in FIELDS)
+    return ' '.join('%s: %s' % (key, event[key]) for key in keys)
+
+class LoggingSink(object):
+    name = 'logging'
+
+    def __init__(self):
+        self.logger = logging.getLogger('djangopypi.events')
+
+    def write(self, batch):
+        if self.logger.isEnabledFor(logging.INFO):
+            for event in batch:
+                self.logger.info(format_event(event))
+
+    def close(self):
+        pass
+
+def jsonl_files(root):
+    """ The JSON lines files of ``root``, oldest first """
+    rotated = sorted(name for name in os.listdir(root)
+                     if name.startswith('events.') and name.endswith('.jsonl')
+                     and name != JSONL_NAME)
+    names = rotated + [JSONL_NAME]
+    return [os.path.join(root, name) for name in names
+            if os.path.exists(os.path.join(root, name))]
+
+class JSONLinesSink(object):
+    """ Appends every batch with a single write, so that the lines of
+    processes sharing the file are never interleaved """
+    name = 'jsonl'
+
+    def __init__(self):
+        self.root = _root()
+        self.path = os.path.join(self.root, JSONL_NAME)
+        self.fd = None
+        self.pruned = 0
+
+    def _open(self):
+        # Another process may have rotated the file
+        if self.fd is not None:
+            try:
+                current = os.stat(self.path).st_ino
+            except OSError:
+                current = None
+            if current != os.fstat(self.fd).st_ino:
+                self.close()
+        if self.fd is None:
+            self.fd = os.open(self.path,
+                              os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0640)
+        return self.fd
+
+    def write(self, batch):
+        data = ''.join(json.dumps(event, separators=(',', ':')) + '\n'
+                       for event in batch)
+        fd = self._open()
+        os.write(fd, data)
+        if os.fstat(fd).st_size >= conf.EVENT_ROTATE_SIZE:
+            self.rotate()
+        if time.time() - self.pruned >= PRUNE_INTERVAL:
+            self.prune()
+
+    def rotate(self):
+        lock = open(os.path.join(self.root, '.lock'), 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Unless another process did it first
+            try:
+                size = os.stat(self.path).st_size
+            except OSError:
+                return
+            if size >= conf.EVENT_ROTATE_SIZE:
+                os.rename(self.path, os.path.join(self.root,
+                    'events.%s-%06d.jsonl' % (
+                        time.strftime('%Y%m%dT%H%M%S', time.gmtime()),
+                        int(time.time() % 1 * 1000000))))
+        finally:
+            lock.close()
+        self.close()
+
+    def prune(self):
+        self.pruned = time.time()
+        limit = time.time() - conf.EVENT_KEEP_DAYS * 24 * 60 * 60
+        for path in jsonl_files(self.root)[:-1]:
+            try:
+                if os.path.getmtime(path) < limit:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+class SQLiteSink(object):
+    name = 'sqlite'
+
+    def __init__(self):
+        self.path = os.path.join(_root(), SQLITE_NAME)
+        self.db = None
+        self.pruned = 0
+
+    def _connect(self):
+        if self.db is None:
+            self.db = connect(self.path)
+        return self.db
+
+    def write(self, batch):
+        db = self._connect()
+        rows = []
+        for event in batch:
+            extra = dict((key, value) for key, value in event.iteritems()
+                         if key not in FIELDS)
+            rows.append([event.get(key) for key in FIELDS] +
+                        [extra and json.dumps(extra) or None])
+        with db:
+            db.executemany('INSERT INTO events (%s, data) VALUES (%s)' % (
+                ', '.join(FIELDS), ', '.join('?' * (len(FIELDS) + 1))), rows)
+            if time.time() - self.pruned >= PRUNE_INTERVAL:
+                self.pruned = time.time()
+                db.execute('DELETE FROM events WHERE time < ?', (
+                    time.time() - conf.EVENT_KEEP_DAYS * 24 * 60 * 60,))
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+def connect(path):
+    """ A connection to the sqlite events database at ``path``, created when
+    missing """
+    db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    with db:
+        db.execute('CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY, '
+                   '%s, data TEXT)' % (', '.join(FIELDS),))
+        db.execute('CREATE INDEX IF NOT EXISTS events_package '
+                   'ON events (package, event, time)')
+        db.execute('CREATE INDEX IF NOT EXISTS events_user '
+                   'ON events (user, time)')
+        db.execute('CREATE INDEX IF NOT EXISTS events_time ON events (time)')
+    return db
+
+SINKS = {
+    'logging': LoggingSink,
+    'jsonl': JSONLinesSink,
+    'sqlite': SQLiteSink,
+}
+
+def _matches(event, criteria, since, until):
+    for key, value in criteria.iteritems():
+        if event.get(key) != value:
+            return False
+    return (since is None or event['time'] >= since) and \
+           (until is None or event['time'] < until)
+
+def query(root=None, since=None, until=None, limit=None, **criteria):
+    """ The events whose fields equal ``criteria``, between the ``since`` and
+    ``until`` timestamps, oldest first. Read from the sqlite database when
+    there is one, from the JSON lines files otherwise. """
+    root = root or conf.EVENT_ROOT
+    criteria = dict((key, value) for key, value in criteria.iteritems()
+                    if value is not None)
+    for key in criteria:
+        if key not in FIELDS:
+            raise ValueError('Events cannot be searched by %s' % (key,))
+    if os.path.exists(os.path.join(root, SQLITE_NAME)):
+        return _query_sqlite(root, since, until, limit, criteria)
+    return _query_jsonl(root, since, until, limit, criteria)
+
+def _query_sqlite(root, since, until, limit, criteria):
+    where, params = [], []
+    for key, value in sorted(criteria.iteritems()):
+        where.append('%s = ?' % (key,))
+        params.append(value)
+    if since is not None:
+        where.append('time >= ?')
+        params.append(since)
+    if until is not None:
+        where.append('time < ?')
+        params.append(until)
+    sql = 'SELECT %s, data FROM events' % (', '.join(FIELDS),)
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY time'
+    if limit:
+        sql += ' LIMIT %d' % (limit,)
+    db = connect(os.path.join(root, SQLITE_NAME))
+    try:
+        events = []
+        for row in db.execute(sql, params):
+            event = dict((key, value) for key, value in zip(FIELDS, row)
+                         if value is not None)
+            if row[-1]:
+                event.update(json.loads(row[-1]))
+            events.append(event)
+        return events
+    finally:
+        db.close()
+
+def _query_jsonl(root, since, until, limit, criteria):
+    # Only decode the lines that contain every value looked for
+    needles = [json.dumps(value) for value in criteria.itervalues()]
+    events = []
+    for path in jsonl_files(root):
+        if since is not None and os.path.getmtime(path) < since:
+            continue
+        for line in open(path):
+            if not all(needle in line for needle in needles):
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if _matches(event, criteria, since, until):
+                events.append(event)
+                if limit and len(events) >= limit:
+                    return events
+    return events
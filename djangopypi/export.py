@@ -0,0 +1,186 @@
+""" Export of the anonymous part of the simple index to a directory tree, so
+that installers can be served by a plain web server.
+
+The tree mirrors the URLs of the simple index::
+
+    <root>/simple/index.html
+    <root>/simple/index.json
+    <root>/simple/<package>/index.html
+    <root>/simple/<package>/index.json
+
+Every file is written to a temporary file and renamed into place, so a web
+server never sees a partial page. Each package directory keeps a fingerprint
+of the rows its pages were rendered from, and a package is only rendered
+again when that fingerprint changes.
+
+Only packages whose names match the URLs of the simple index are exported,
+so that no name makes the exporter write or remove files outside the tree. """
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from django.template.loader import render_to_string
+from django.utils import simplejson as json
+
+from djangopypi import conf, simple
+from djangopypi.permissions import anonymous_packages
+from djangopypi.models import Package, Release, Distribution
+
+FINGERPRINT_FILE = '.fingerprint'
+
+# The package names of the URLs of the simple index
+NAME_RE = re.compile(r'^[\w.-]+$')
+
+def exportable(name):
+    """ Whether ``name`` is a single directory name of the tree """
+    return bool(NAME_RE.match(name)) and name not in ('.', '..')
+
+def exportable_packages():
+    return [name for name in anonymous_packages().values_list('name',
+                                                              flat=True)
+            if exportable(name)]
+
+def write_file(path, content):
+    """ Atomically replace the file at ``path`` with ``content`` """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        f = os.fdopen(fd, 'wb')
+        try:
+            f.write(content)
+        finally:
+            f.close()
+        os.chmod(tmp, 0644)
+        os.rename(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
+
+def read_file(path):
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+def _package_rows(name=None):
+    """ Release and distribution rows of one package, or of every package,
+    grouped by package name """
+    release_rows = Release.objects.order_by('id')
+    dist_rows = Distribution.objects.order_by('-release__sort_key', 'id')
+    if name is not None:
+        release_rows = release_rows.filter(package=name)
+        dist_rows = dist_rows.filter(release__package=name)
+
+    releases, dists = {}, {}
+    for row in release_rows.values_list('package', 'version', 'home_page',
+                                        'download_url'):
+        releases.setdefault(row[0], []).append(row[1:])
+    for row in dist_rows.values_list('release__package', 'content',
+                                     'filename', 'md5_digest',
+                                     'release__requires_python',
+                                     'metadata_sha256'):
+        dists.setdefault(row[0], []).append(row[1:])
+    return releases, dists
+
+def _fingerprint(releases, dists):
+    return hashlib.md5(json.dumps([releases, dists])).hexdigest()
+
+class Exporter(object):
+
+    def __init__(self, root):
+        self.root = os.path.join(root, 'simple')
+
+    def package_dir(self, name):
+        if not exportable(name):
+            raise ValueError('Package %r cannot be exported' % (name,))
+        return os.path.join(self.root, name)
+
+    def export_index(self, names):
+        names = sorted(names)
+        write_file(os.path.join(self.root, 'index.html'),
+                   render_to_string('djangopypi/package_list_simple.html',
+                                    {'package_list': [Package(name=name)
+                                                      for name in names]})
+                   .encode('utf-8'))
+        write_file(os.path.join(self.root, 'index.json'),
+                   simple.index_json(names))
+
+    def export_packages(self, names, force=False):
+        """ Render the pages of the packages whose rows changed since they were
+        last exported, and return the names of those packages """
+        if len(names) == 1:
+            releases, dists = _package_rows(names[0])
+        else:
+            releases, dists = _package_rows()
+        exported = []
+        for name in names:
+            directory = self.package_dir(name)
+            fingerprint = _fingerprint(releases.get(name, []),
+                                       dists.get(name, []))
+            fingerprint_path = os.path.join(directory, FINGERPRINT_FILE)
+            if not force and read_file(fingerprint_path) == fingerprint:
+                continue
+
+            package = Package.objects.get(name=name)
+            write_file(os.path.join(directory, 'index.html'),
+                       render_to_string('djangopypi/package_detail_simple.html',
+                                        {'package': package}).encode('utf-8'))
+            write_file(os.path.join(directory, 'index.json'),
+                       simple.detail_json(name, dists.get(name, [])))
+            write_file(fingerprint_path, fingerprint)
+            exported.append(name)
+        return exported
+
+    def exported_names(self):
+        if not os.path.isdir(self.root):
+            return set()
+        return set(name for name in os.listdir(self.root)
+                   if os.path.isdir(os.path.join(self.root, name)))
+
+    def remove_packages(self, names):
+        for name in filter(exportable, names):
+            shutil.rmtree(self.package_dir(name), ignore_errors=True)
+
+    def export(self, force=False):
+        """ Bring the whole tree up to date. Returns the names of the packages
+        that were written and of those that were removed. """
+        names = set(exportable_packages())
+        previous = self.exported_names()
+
+        exported = self.export_packages(sorted(names), force=force)
+        removed = previous - names
+        self.remove_packages(removed)
+        if force or names != previous or \
+           not os.path.exists(os.path.join(self.root, 'index.html')):
+            self.export_index(names)
+        return exported, sorted(removed)
+
+    def export_package(self, name):
+        """ Bring a single package, and the index if the package appeared or
+        disappeared, up to date """
+        if not exportable(name):
+            return
+        is_anonymous = anonymous_packages().filter(name=name).exists()
+        was_exported = os.path.isdir(self.package_dir(name))
+
+        if is_anonymous:
+            self.export_packages([name])
+        elif was_exported:
+            self.remove_packages([name])
+
+        if is_anonymous != was_exported:
+            self.export_index(exportable_packages())
+
+def export_package(name):
+    """ Incremental export, used by the signal receivers when
+    ``STATIC_EXPORT_ROOT`` is set """
+    if conf.STATIC_EXPORT_ROOT:
+        Exporter(conf.STATIC_EXPORT_ROOT).export_package(name)
@@ -45,7 +45,7 @@ class ReleaseFeed(Feed):
     
     def items(self, obj):
         if isinstance(obj, Package):
-            return obj.releases.filter(hidden=False).order_by('-created')[:25]
+            return obj.releases.filter(hidden=False).order_by('-sort_key')[:25]
         return Release.objects.filter(hidden=False).order_by('-created')[:40]
     
     def item_description(self, item):
@@ -237,3 +237,21 @@ class Metadata12Form(Metadata10Form):
                                               'and a label for it, separated '
                                               'by a comma: "Bug Tracker, '
                                               'http://bugs.project.com"'))
+
+class Metadata21Form(Metadata12Form):
+    description_content_type = forms.CharField(required=False,
+                                               help_text=_(u'The markup of '
+                                                           'the description, '
+                                                           'such as '
+                                                           '"text/x-rst".'))
+
+    provides_extra = LinesField(required=False,
+                                help_text=_(u'Each line names an optional '
+                                            'feature that may be requested '
+                                            'when installing the package.'))
+
+class Metadata22Form(Metadata21Form):
+    dynamic = LinesField(required=False,
+                         help_text=_(u'Each line names a field that is '
+                                     'computed when the package is built, '
+                                     'and may differ between its files.'))
@@ -1,4 +1,4 @@
-from django.http import HttpResponse, QueryDict
+from django.http import HttpResponse, HttpResponseNotModified, QueryDict
 from django.core.files.uploadedfile import TemporaryUploadedFile
 from django.utils.datastructures import MultiValueDict
 from django.contrib.auth import authenticate
@@ -8,6 +8,10 @@ class HttpResponseNotImplemented(HttpResponse):
     status_code = 501
 
 
+class HttpResponseBadGateway(HttpResponse):
+    status_code = 502
+
+
 class HttpResponseUnauthorized(HttpResponse):
     status_code = 401
 
@@ -16,6 +20,66 @@ class HttpResponseUnauthorized(HttpResponse):
         self['WWW-Authenticate'] = 'Basic realm="%s"' % realm
 
 
+def conditional_response(request, etag, content, mimetype):
+    """ Serve a precomputed body, or a 304 if the client already has the
+    version identified by ``etag`` """
+    client_etags = request.META.get('HTTP_IF_NONE_MATCH', '').split(',')
+    if etag in [e.strip() for e in client_etags]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, mimetype=mimetype)
+    response['ETag'] = etag
+    return response
+
+
+# How much of a request body is read at once
+CHUNK_SIZE = 64 * 1024
+
+
+class BodyReader(object):
+    """ Reads the ``length`` bytes of a request body a chunk at a time,
+    keeping only what was read past the last token looked for. Reading past
+    the end of the body may block, or raise. """
+
+    def __init__(self, read, length, chunk_size=CHUNK_SIZE):
+        self.read = read
+        self.remaining = length
+        self.chunk_size = chunk_size
+        self.buffer = ''
+
+    def fill(self):
+        if self.remaining <= 0:
+            return False
+        data = self.read(min(self.chunk_size, self.remaining))
+        self.remaining -= len(data)
+        self.buffer += data
+        return bool(data)
+
+    def copy_until(self, token, write):
+        """ Pass the data up to ``token`` to ``write``, and skip ``token``.
+        False when the body ended before it. """
+        while True:
+            index = self.buffer.find(token)
+            if index >= 0:
+                write(self.buffer[:index])
+                self.buffer = self.buffer[index + len(token):]
+                return True
+            # The start of the token may be at the end of the buffer
+            keep = len(token) - 1
+            if len(self.buffer) > keep:
+                write(self.buffer[:len(self.buffer) - keep])
+                self.buffer = self.buffer[len(self.buffer) - keep:]
+            if not self.fill():
+                write(self.buffer)
+                self.buffer = ''
+                return False
+
+    def read_until(self, token):
+        data = []
+        self.copy_until(token, data.append)
+        return ''.join(data)
+
+
 def parse_distutils_request(request):
     """ This is being used because the built in request parser that Django uses,
     django.http.multipartparser.MultiPartParser is interperting the POST data
@@ -23,47 +87,61 @@ def parse_distutils_request(request):
     
     One portion of this is the end marker: \r\n\r\n (what Django expects) 
     versus \n\n (what distutils is sending). 
+
+    The body is streamed: files are written to temporary files as they are
+    read, so that a request with many large files is never held in memory.
     """
     
     try:
-        sep = request.raw_post_data.splitlines()[1]
-    except:
+        length = int(request.META.get('CONTENT_LENGTH', 0))
+    except (ValueError, TypeError):
+        length = 0
+    reader = BodyReader(request.read, length)
+    while not reader.buffer.strip() or \
+          '\n' not in reader.buffer.lstrip():
+        if not reader.fill():
+            raise ValueError('Invalid post data')
+    reader.buffer = reader.buffer.lstrip()
+    sep = reader.read_until('\n')
+    newline = sep.endswith('\r') and '\r\n' or '\n'
+    sep = sep.rstrip('\r')
+    if not sep.startswith('--'):
         raise ValueError('Invalid post data')
     
-    
     request.POST = QueryDict('',mutable=True)
     try:
         request._files = MultiValueDict()
     except Exception, e:
         pass
     
-    for part in filter(lambda e: e.strip(), request.raw_post_data.split(sep)):
-        try:
-            header, content = part.lstrip().split('\n',1)
-        except Exception, e:
-            continue
-        
-        if content.startswith('\n'):
-            content = content[1:]
-        
-        if content.endswith('\n'):
-            content = content[:-1]
-        
-        headers = parse_header(header)
-        
-        if "name" not in headers:
-            continue
+    delimiter = newline + sep
+    while True:
+        headers = {}
+        while True:
+            line = reader.read_until('\n').rstrip('\r')
+            if not line:
+                break
+            headers.update(parse_header(line))
         
         if "filename" in headers:
             dist = TemporaryUploadedFile(name=headers["filename"],
-                                         size=len(content),
+                                         size=0,
                                          content_type="application/gzip",
                                          charset='utf-8')
-            dist.write(content)
+            found = reader.copy_until(delimiter, dist.write)
+            dist.size = dist.tell()
             dist.seek(0)
-            request.FILES.appendlist(headers['name'], dist)
+            if "name" in headers:
+                request.FILES.appendlist(headers['name'], dist)
         else:
-            request.POST.appendlist(headers["name"],content)
+            content = []
+            found = reader.copy_until(delimiter, content.append)
+            if "name" in headers:
+                request.POST.appendlist(headers["name"], ''.join(content))
+        
+        # The rest of the separator line, ``--`` after the last part
+        if not found or reader.read_until('\n').startswith('--'):
+            break
     return
 
 def parse_header(header):
@@ -0,0 +1,42 @@
+"""
+Management command for filling the dependency index of every release from the
+Requires and Requires-Dist fields of its metadata, e.g. after importing
+releases with raw SQL or restoring an old database dump.
+
+Releases are processed in batches, each costing a constant number of queries.
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djangopypi.models import Release, sync_dependencies
+
+class Command(BaseCommand):
+    help = """Fill the dependencies of every release from its metadata"""
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            dest='batch_size',
+            type='int',
+            default=500,
+            help='Number of releases handled per batch',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('The batch size must be positive')
+
+        releases = Release.objects.only('id', 'package_info').order_by('pk')
+        last_pk, total, changed = 0, 0, 0
+        while True:
+            batch = list(releases.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            total += len(batch)
+            if sync_dependencies(batch):
+                changed += 1
+
+        print "Checked %d release(s), updated %d batch(es)" % (total, changed)
@@ -0,0 +1,67 @@
+"""
+Management command for recomputing the version sort keys of releases, e.g.
+after importing releases with raw SQL or after a change to the way versions
+are ordered.
+
+Releases are processed in batches and only those whose key changed are
+written, with one statement per batch.
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from djangopypi import documents, export, simple
+from djangopypi.models import Release
+from djangopypi.versions import parse
+
+class Command(BaseCommand):
+    help = """Recompute the version sort key of every release"""
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            dest='batch_size',
+            type='int',
+            default=500,
+            help='Number of releases handled per batch',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('The batch size must be positive')
+
+        qn = connection.ops.quote_name
+        update_sql = 'UPDATE %s SET %s = %%s WHERE %s = %%s' % (
+            qn(Release._meta.db_table), qn('sort_key'), qn('id'))
+        cursor = connection.cursor()
+
+        rows = Release.objects.order_by('pk') \
+                              .values_list('pk', 'package', 'version',
+                                           'sort_key')
+        last_pk, total, packages = 0, 0, set()
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            total += len(batch)
+            updates = []
+            for pk, package, version, sort_key in batch:
+                new_key = parse(version).sort_key
+                if new_key != sort_key:
+                    updates.append((new_key, pk))
+                    packages.add(package)
+            if updates:
+                cursor.executemany(update_sql, updates)
+                transaction.commit_unless_managed()
+
+        # The latest release and the order of the simple pages may change
+        for package in packages:
+            documents.invalidate_package(package)
+            simple.invalidate(package)
+            export.export_package(package)
+
+        print "Checked %d release(s), updated %d package(s)" % (
+            total, len(packages))
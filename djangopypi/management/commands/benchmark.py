@@ -0,0 +1,132 @@
+"""
+Management command for benchmarking the public views over a synthetic index,
+recording the number of queries, the wall time and the growth of the peak
+memory of each into a JSON report, e.g.::
+
+    ./manage.py benchmark --dataset 10k --output report.json
+    ./manage.py benchmark --dataset 10k --baseline report.json
+
+The index is seeded into a throwaway test database, and the files into a
+temporary directory, so the real ones are never touched. With ``--baseline``,
+the command fails when a view makes more queries or got slower than in the
+baseline report.
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import simplejson as json
+
+from djangopypi import benchmark
+
+class Command(BaseCommand):
+    help = """Benchmark the views over a synthetic index"""
+
+    option_list = BaseCommand.option_list + (
+        make_option('--dataset',
+            dest='dataset',
+            default='1k',
+            choices=sorted(benchmark.DATASETS),
+            help='Number of packages: %s' % (
+                ', '.join(sorted(benchmark.DATASETS)),),
+        ),
+        make_option('--max-releases',
+            dest='max_releases',
+            type='int',
+            default=1000,
+            help='Number of releases of the largest package',
+        ),
+        make_option('--groups',
+            dest='groups',
+            type='int',
+            default=10,
+            help='Number of groups packages may be restricted to',
+        ),
+        make_option('--seed',
+            dest='seed',
+            type='int',
+            default=0,
+            help='Seed of the random generator of the dataset',
+        ),
+        make_option('--repeat',
+            dest='repeat',
+            type='int',
+            default=5,
+            help='Number of warm runs of each scenario',
+        ),
+        make_option('--scenario',
+            dest='scenarios',
+            action='append',
+            default=[],
+            help='Only run this scenario, can be given several times',
+        ),
+        make_option('--output',
+            dest='output',
+            help='Write the JSON report to this file',
+        ),
+        make_option('--baseline',
+            dest='baseline',
+            help='Compare the results to this JSON report',
+        ),
+        make_option('--tolerance',
+            dest='tolerance',
+            type='float',
+            default=0.25,
+            help='Share by which a scenario may get slower than the baseline',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        names = [scenario[0] for scenario in benchmark.SCENARIOS]
+        for name in options['scenarios']:
+            if name not in names:
+                raise CommandError('Unknown scenario %s, choose from: %s' % (
+                    name, ', '.join(names)))
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = json.load(open(options['baseline']))
+            except (IOError, ValueError), e:
+                raise CommandError('Cannot read the baseline: %s' % (e,))
+
+        verbosity = int(options.get('verbosity', 1))
+        try:
+            # Let South create the tables of migrated apps, as in tests
+            from south.management.commands import patch_for_test_db_setup
+        except ImportError:
+            pass
+        else:
+            patch_for_test_db_setup()
+        old_name = connection.creation.create_test_db(verbosity=0,
+                                                      autoclobber=True)
+        try:
+            with benchmark.isolated_storage():
+                dataset = benchmark.seed(
+                    packages=benchmark.DATASETS[options['dataset']],
+                    max_releases=options['max_releases'],
+                    groups=options['groups'], seed=options['seed'])
+                if verbosity:
+                    print "Seeded %(packages)d packages, %(releases)d " \
+                          "releases" % dataset
+                report = benchmark.run(dataset, repeat=options['repeat'],
+                                       names=options['scenarios'],
+                                       verbosity=verbosity)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            output = open(options['output'], 'w')
+            try:
+                json.dump(report, output, indent=2, sort_keys=True)
+            finally:
+                output.close()
+        else:
+            print json.dumps(report, indent=2, sort_keys=True)
+
+        if baseline is not None:
+            regressions = benchmark.compare(report, baseline,
+                                            options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against %s:\n%s' % (
+                    options['baseline'], '\n'.join(regressions)))
+            print "No regressions against %s" % (options['baseline'],)
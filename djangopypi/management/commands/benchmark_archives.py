@@ -0,0 +1,84 @@
+"""
+Management command for benchmarking how the metadata of distributions is
+read, with ``djangopypi.archives`` and with ``pkginfo``, over a corpus of
+mixed archives: tarballs with their PKG-INFO before or after large members,
+zip sdists, eggs and wheels, e.g.::
+
+    ./manage.py benchmark_archives --count 40 --output archives.json
+
+The corpus is generated from a fixed seed into a temporary directory, which
+is removed afterwards, so the numbers can be reproduced.
+"""
+import shutil
+import tempfile
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import simplejson as json
+
+from djangopypi import benchmark
+
+class Command(BaseCommand):
+    help = """Benchmark reading the metadata of a corpus of archives"""
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count',
+            dest='count',
+            type='int',
+            default=40,
+            help='Number of archives of each kind',
+        ),
+        make_option('--member-size',
+            dest='member_size',
+            type='int',
+            default=2 * 1024 * 1024,
+            help='Size of the large members of the tarballs, in bytes',
+        ),
+        make_option('--seed',
+            dest='seed',
+            type='int',
+            default=0,
+            help='Seed of the random generator of the corpus',
+        ),
+        make_option('--repeat',
+            dest='repeat',
+            type='int',
+            default=3,
+            help='Number of reads of the corpus by each reader',
+        ),
+        make_option('--output',
+            dest='output',
+            help='Write the JSON report to this file',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        for name in ('count', 'member_size', 'repeat'):
+            if options[name] < 1:
+                raise CommandError('--%s must be positive' % (
+                    name.replace('_', '-'),))
+
+        verbosity = int(options.get('verbosity', 1))
+        directory = tempfile.mkdtemp(prefix='djangopypi-archives-')
+        try:
+            corpus = benchmark.archive_corpus(
+                directory, count=options['count'],
+                member_size=options['member_size'], seed=options['seed'])
+            if verbosity:
+                print "Wrote %d archives" % (len(corpus),)
+            report = benchmark.run_archives(corpus, repeat=options['repeat'],
+                                            verbosity=verbosity)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        report['corpus'] = {'count': options['count'],
+                            'member_size': options['member_size'],
+                            'seed': options['seed']}
+
+        if options['output']:
+            output = open(options['output'], 'w')
+            try:
+                json.dump(report, output, indent=2, sort_keys=True)
+            finally:
+                output.close()
+        else:
+            print json.dumps(report, indent=2, sort_keys=True)
@@ -0,0 +1,80 @@
+"""
+Management command for benchmarking loading every release of a large index,
+listing them without reading their metadata, then reading a column of each,
+and reading the metadata of each, which decodes its JSON, e.g.::
+
+    ./manage.py benchmark_releases --count 100000 --output releases.json
+
+The releases are seeded into a throwaway test database, so the real one is
+never touched.
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import simplejson as json
+
+from djangopypi import benchmark
+
+class Command(BaseCommand):
+    help = """Benchmark loading the releases of a large index"""
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count',
+            dest='count',
+            type='int',
+            default=100000,
+            help='Number of releases',
+        ),
+        make_option('--per-package',
+            dest='per_package',
+            type='int',
+            default=100,
+            help='Number of releases of each package',
+        ),
+        make_option('--repeat',
+            dest='repeat',
+            type='int',
+            default=3,
+            help='Number of loads of the releases in each way',
+        ),
+        make_option('--output',
+            dest='output',
+            help='Write the JSON report to this file',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        for name in ('count', 'per_package', 'repeat'):
+            if options[name] < 1:
+                raise CommandError('--%s must be positive' % (
+                    name.replace('_', '-'),))
+
+        verbosity = int(options.get('verbosity', 1))
+        try:
+            # Let South create the tables of migrated apps, as in tests
+            from south.management.commands import patch_for_test_db_setup
+        except ImportError:
+            pass
+        else:
+            patch_for_test_db_setup()
+        old_name = connection.creation.create_test_db(verbosity=0,
+                                                      autoclobber=True)
+        try:
+            dataset = benchmark.seed_releases(
+                count=options['count'], per_package=options['per_package'])
+            if verbosity:
+                print "Seeded %(releases)d releases" % dataset
+            report = benchmark.run_releases(dataset, repeat=options['repeat'],
+                                            verbosity=verbosity)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            output = open(options['output'], 'w')
+            try:
+                json.dump(report, output, indent=2, sort_keys=True)
+            finally:
+                output.close()
+        else:
+            print json.dumps(report, indent=2, sort_keys=True)
@@ -0,0 +1,28 @@
+"""
+Management command for removing the uploads in chunks that were abandoned,
+and their staged files, e.g. from cron::
+
+    0 * * * * ./manage.py clean_uploads
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from djangopypi import uploads
+
+class Command(BaseCommand):
+    help = """Remove the upload sessions, and their staged files, that were
+not used for DJANGOPYPI_UPLOAD_SESSION_TTL seconds"""
+
+    option_list = BaseCommand.option_list + (
+        make_option('--max-age',
+            dest='max_age',
+            type='int',
+            help='Remove the sessions not used for this many seconds',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        removed = uploads.clean(options.get('max_age'))
+        if int(options.get('verbosity', 1)):
+            print "Removed %d upload sessions" % (removed,)
@@ -0,0 +1,46 @@
+"""
+Management command for exporting the anonymous part of the simple index to a
+directory, to be served by a plain web server such as nginx, e.g.::
+
+    location /simple/ {
+        root /srv/pypi-export;
+        index index.html;
+    }
+    location /packages/ {
+        alias /srv/pypi/dists/;
+    }
+
+Only packages that changed since the last export are written again.
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djangopypi import conf
+from djangopypi.export import Exporter
+
+class Command(BaseCommand):
+    args = '[<directory>]'
+    help = """Export the simple index pages of anonymous packages to a
+directory, defaulting to DJANGOPYPI_STATIC_EXPORT_ROOT"""
+
+    option_list = BaseCommand.option_list + (
+        make_option('--full',
+            dest='full',
+            action='store_true',
+            default=False,
+            help='Write every package, even those that did not change',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) > 1:
+            raise CommandError('Only one export directory can be given')
+        root = args and args[0] or conf.STATIC_EXPORT_ROOT
+        if not root:
+            raise CommandError('No export directory given, and '
+                               'DJANGOPYPI_STATIC_EXPORT_ROOT is not set')
+
+        exported, removed = Exporter(root).export(force=options['full'])
+        print "Exported %d package(s), removed %d from %s" % (
+            len(exported), len(removed), root)
@@ -0,0 +1,32 @@
+"""
+Management command for extracting the core metadata files (PEP 658) of
+distributions that do not have one yet, e.g. files uploaded before they were
+served, or mirrored files that have been downloaded since.
+"""
+from django.core.management.base import BaseCommand
+
+from djangopypi import coremetadata, export, simple
+from djangopypi.models import Distribution
+
+class Command(BaseCommand):
+    help = """Extract the metadata files of distributions that lack one"""
+
+    def handle(self, *args, **options):
+        packages, extracted = set(), 0
+        dists = Distribution.objects.filter(metadata_sha256='') \
+                                    .select_related('release')
+        for dist in dists.iterator():
+            data = coremetadata.read_distribution(dist)
+            if data is None:
+                continue
+            coremetadata.store(dist, data)
+            Distribution.objects.filter(pk=dist.pk) \
+                                .update(metadata_sha256=coremetadata.digest(data))
+            packages.add(dist.release.package_id)
+            extracted += 1
+
+        for package in packages:
+            simple.invalidate(package)
+            export.export_package(package)
+
+        print "Extracted the metadata of %d file(s)" % (extracted,)
@@ -0,0 +1,32 @@
+"""
+Management command for writing the download counts kept in the shared cache
+to the database, including those of workers that exited before writing them,
+e.g. from cron when ``DJANGOPYPI_DOWNLOAD_COUNTER`` is ``'cache'``::
+
+    0 * * * * ./manage.py flush_downloads
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djangopypi import conf, downloads
+
+class Command(BaseCommand):
+    help = """Write the download counts kept in the cache to the database"""
+
+    option_list = BaseCommand.option_list + (
+        make_option('--days',
+            dest='days',
+            type='int',
+            default=2,
+            help='Number of days of counters to write, including today',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if conf.DOWNLOAD_COUNTER != 'cache':
+            raise CommandError('Only the counts of DOWNLOAD_COUNTER = '
+                               '"cache" can be written from another process')
+        written = downloads.sweep(options['days'])
+        if int(options.get('verbosity', 1)):
+            print "Wrote %d downloads" % (written,)
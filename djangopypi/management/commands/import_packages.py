@@ -1,5 +1,5 @@
 from djangopypi.models import *
-from djangopypi import conf
+from djangopypi import conf, wheels
 from django.contrib.auth.models import User, Group
 from django.conf import settings
 from django.core.management.base import BaseCommand
@@ -7,7 +7,7 @@ from django.utils.datastructures import MultiValueDict
 from django.db.utils import IntegrityError
 from django.db import transaction
 
-from pkginfo import BDist, SDist
+from djangopypi.archives import BDist, SDist, Wheel
 
 from optparse import OptionParser, make_option
 import textwrap
@@ -16,7 +16,7 @@ import sys, os, shutil
 import logging
 
 class Command(BaseCommand):
-    args = '<foo-1.2.3.tar.gz bar-1.9.zip baz-2.2.egg>'
+    args = '<foo-1.2.3.tar.gz bar-1.9.zip baz-2.2.egg qux-1.0-py2-none-any.whl>'
     help = 'Imports one or more packages to the dists folder and adds ' \
             'package metadata to the database'
 
@@ -125,6 +125,9 @@ class Command(BaseCommand):
                 elif filename.endswith('.egg'):
                     package = BDist(self._curfile)
                     self._log(filename, package, *self._add_dist(package))
+                elif filename.endswith('.whl') and Wheel is not None:
+                    package = Wheel(self._curfile)
+                    self._log(filename, package, *self._add_dist(package))
                 else:
                     self.log.debug('Ignoring: %s:' % filename)
 
@@ -228,6 +231,9 @@ class Command(BaseCommand):
         if 'platform' in fields:
             fields.remove('platform')
             fields.append('platforms')
+        if 'provides_extra' in fields:
+            fields.remove('provides_extra')
+            fields.append('provides_extras')
 
         info = []
         for f in fields:
@@ -240,6 +246,8 @@ class Command(BaseCommand):
                 self.log.debug('Could not find %s in the dist data.' % f)
 
         package_info = dict(info)
+        if 'provides_extras' in package_info:
+            package_info['provides_extra'] = package_info.pop('provides_extras')
 
         return package_info
 
@@ -338,6 +346,9 @@ class Command(BaseCommand):
 
     def _get_pyversion(self, dist_data):
         #TODO: Erm pkginfo can haz pyversion?!
+        if Wheel is not None and isinstance(dist_data, Wheel):
+            tags = wheels.parse_filename(os.path.basename(self._curfile))
+            return tags and tags['python_tag'] or ''
         return ''
 
     def _get_filetype(self, dist_data):
@@ -345,5 +356,7 @@ class Command(BaseCommand):
             return 'sdist'
         elif isinstance(dist_data, BDist):
             return 'bdist_egg'
+        elif Wheel is not None and isinstance(dist_data, Wheel):
+            return 'bdist_wheel'
         else:
             return ''
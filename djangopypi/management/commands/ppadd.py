@@ -8,12 +8,11 @@ import os
 import tempfile
 import shutil
 
-import pkginfo
-
 from contextlib import contextmanager
 from django.contrib.auth.models import User
 from django.core.files.base import File
 from django.core.management.base import LabelCommand
+from djangopypi import archives
 from djangopypi.models import Package, Release, Classifier
 from optparse import make_option
 from setuptools.package_index import PackageIndex
@@ -128,7 +127,7 @@ added"""
         print "%s-%s added" % (meta.name, meta.version)
 
     def _get_meta(self, path):
-        data = pkginfo.get_metadata(path)
+        data = archives.get_metadata(path)
         if data:
             return data
         else:
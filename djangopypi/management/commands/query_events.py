@@ -0,0 +1,81 @@
+"""
+Management command for searching the audit and access events written to
+``DJANGOPYPI_EVENT_ROOT``, e.g. for who downloaded a release::
+
+    ./manage.py query_events --event download --package foo --version 1.0
+
+Events are read from the sqlite database when there is one, from the JSON
+lines files otherwise.
+"""
+import datetime
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import simplejson as json
+
+from djangopypi import conf, events
+
+def timestamp(value):
+    """ Seconds since the epoch of a ``YYYY-MM-DD[THH:MM:SS]`` local time """
+    for format in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return time.mktime(datetime.datetime.strptime(value, format)
+                               .timetuple())
+        except ValueError:
+            pass
+    raise CommandError('Invalid date: %s' % (value,))
+
+class Command(BaseCommand):
+    args = '[<directory>]'
+    help = """Search the events in a directory, defaulting to
+DJANGOPYPI_EVENT_ROOT"""
+
+    option_list = BaseCommand.option_list + tuple(
+        make_option('--%s' % (field,),
+            dest=field,
+            help='Only events of this %s' % (field,),
+        ) for field in events.FIELDS[1:]
+    ) + (
+        make_option('--since',
+            dest='since',
+            help='Only events from this date, as YYYY-MM-DD[THH:MM:SS]',
+        ),
+        make_option('--until',
+            dest='until',
+            help='Only events before this date, as YYYY-MM-DD[THH:MM:SS]',
+        ),
+        make_option('--limit',
+            dest='limit',
+            type='int',
+            help='Show at most this many events',
+        ),
+        make_option('--json',
+            dest='json',
+            action='store_true',
+            default=False,
+            help='Show the events as JSON lines',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) > 1:
+            raise CommandError('Only one events directory can be given')
+        root = args and args[0] or conf.EVENT_ROOT
+        if not root:
+            raise CommandError('No events directory given, and '
+                               'DJANGOPYPI_EVENT_ROOT is not set')
+
+        criteria = dict((field, options.get(field))
+                        for field in events.FIELDS[1:])
+        for name in ('since', 'until'):
+            if options.get(name):
+                criteria[name] = timestamp(options[name])
+        for event in events.query(root, limit=options.get('limit'),
+                                  **criteria):
+            if options.get('json'):
+                print json.dumps(event, sort_keys=True)
+                continue
+            when = datetime.datetime.fromtimestamp(event.pop('time'))
+            print '%s %s' % (when.strftime('%Y-%m-%d %H:%M:%S'),
+                             events.format_event(event))
@@ -0,0 +1,58 @@
+"""
+Management command running the upload receiver of ``djangopypi.receiver``,
+which reads the bodies of slow uploads without holding a worker of the
+application server, e.g.::
+
+    ./manage.py receive_uploads 127.0.0.1:8001 --threads 4
+
+with the web server in front sending it the uploads, e.g. for nginx::
+
+    location = /pypi/ {
+        if ($request_method = POST) { proxy_pass http://127.0.0.1:8001; }
+        ...
+    }
+    location /pypi/uploads/ { proxy_pass http://127.0.0.1:8001; }
+"""
+import signal
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djangopypi.receiver import Receiver
+
+class Command(BaseCommand):
+    args = '[<host>:]<port>'
+    help = """Receive uploads, handing only the complete requests to
+Django"""
+
+    option_list = BaseCommand.option_list + (
+        make_option('--threads',
+            dest='threads',
+            type='int',
+            help='Number of threads handling the received requests, '
+                 'DJANGOPYPI_RECEIVER_THREADS by default',
+        ),
+        make_option('--max-body',
+            dest='max_body',
+            type='int',
+            help='Largest request body accepted, in bytes',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('An address to listen on must be given')
+        host, port = ('127.0.0.1:' + args[0]).rsplit(':', 2)[-2:]
+        try:
+            port = int(port)
+        except ValueError:
+            raise CommandError('Invalid port: %s' % (port,))
+
+        receiver = Receiver(host, port, threads=options.get('threads'),
+                            max_body=options.get('max_body'))
+        for number in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(number, lambda *args: receiver.stop())
+        if int(options.get('verbosity', 1)):
+            print "Receiving uploads on %s:%d with %d threads" % (
+                receiver.address[0], receiver.address[1], receiver.threads)
+        receiver.serve()
@@ -0,0 +1,226 @@
+""" In-process metrics of the views, to find out which endpoint is hot in
+production without an external profiler.
+
+``MetricsMiddleware`` (see ``djangopypi.middleware``) measures every request:
+its latency, the number and duration of its database queries and the bytes
+it served. The views are labelled by the ``instrument`` decorator; requests
+to any other view count as ``other``. Hits and misses of the caches are
+counted as well, ``allowed`` and ``scope`` being the permission checks done
+on every authenticated request.
+
+The totals are exposed in the Prometheus text format at ``/metrics/``, and
+the last ``METRICS_BUFFER_SIZE`` requests are kept in a ring buffer, shown at
+``/metrics/recent/``. Both are per process: each worker of a server running
+several has its own. """
+from __future__ import with_statement
+
+import threading
+import time
+from collections import deque
+
+try:
+    from functools import wraps
+except ImportError:
+    from django.utils.functional import wraps
+
+from djangopypi import conf
+
+OTHER = 'other'
+
+_lock = threading.Lock()
+_local = threading.local()
+
+class Histogram(object):
+    """ Counts of observations by upper bound, as Prometheus histograms """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """ ``(bound, count)`` of observations up to each bound """
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+class Endpoint(object):
+    __slots__ = ('requests', 'latency', 'queries', 'queries_total',
+                 'query_time', 'bytes')
+
+    def __init__(self):
+        self.requests = {}
+        self.latency = Histogram(conf.METRICS_LATENCY_BUCKETS)
+        self.queries = Histogram(conf.METRICS_QUERY_BUCKETS)
+        self.queries_total = 0
+        self.query_time = 0.0
+        self.bytes = 0
+
+_endpoints = {}
+_caches = {}
+_recent = deque(maxlen=conf.METRICS_BUFFER_SIZE)
+
+def record(endpoint, method, path, status, duration, queries, query_time,
+           size):
+    """ Account for a request that took ``duration`` seconds """
+    with _lock:
+        stats = _endpoints.get(endpoint)
+        if stats is None:
+            stats = _endpoints[endpoint] = Endpoint()
+        key = (method, status)
+        stats.requests[key] = stats.requests.get(key, 0) + 1
+        stats.latency.observe(duration)
+        stats.queries.observe(queries)
+        stats.queries_total += queries
+        stats.query_time += query_time
+        stats.bytes += size
+        _recent.append((time.time(), endpoint, method, path, status,
+                        duration, queries, query_time, size))
+
+def cache_access(key, hit):
+    """ Count a hit or a miss of the cache named by the second part of
+    ``key``, such as ``simple`` for ``djangopypi:simple:...`` """
+    parts = key.split(':', 2)
+    name = len(parts) > 1 and parts[1] or key
+    with _lock:
+        counts = _caches.get(name)
+        if counts is None:
+            counts = _caches[name] = [0, 0]
+        counts[not hit] += 1
+
+def instrument(name=None):
+    """ Decorator labelling the requests handled by a view, with ``name`` or
+    the module and name of the view. The innermost labelled view wins, so
+    the actions dispatched by the root view are told apart. """
+    def decorator(view_func):
+        label = name or '%s.%s' % (view_func.__module__.rsplit('.', 1)[-1],
+                                   view_func.__name__)
+
+        def _wrapped_view(request, *args, **kwargs):
+            request.metrics_endpoint = label
+            return view_func(request, *args, **kwargs)
+        return wraps(view_func)(_wrapped_view)
+    return decorator
+
+def served(request, size):
+    """ Tell the size of a response whose body is streamed, or served by the
+    web server """
+    request.metrics_bytes = size
+
+def start_queries():
+    _local.queries = 0
+    _local.query_time = 0.0
+
+def count_query(duration):
+    try:
+        _local.queries += 1
+        _local.query_time += duration
+    except AttributeError:
+        # A query outside of a measured request
+        pass
+
+def stop_queries():
+    """ ``(count, seconds)`` of the queries since ``start_queries`` """
+    queries = getattr(_local, 'queries', 0), getattr(_local, 'query_time', 0.0)
+    _local.__dict__.clear()
+    return queries
+
+def recent():
+    """ The last requests, oldest first, as dicts """
+    with _lock:
+        rows = list(_recent)
+    fields = ('time', 'endpoint', 'method', 'path', 'status', 'duration',
+              'queries', 'query_time', 'bytes')
+    return [dict(zip(fields, row)) for row in rows]
+
+def _escape(value):
+    return unicode(value).replace('\\', '\\\\').replace('"', '\\"') \
+                         .replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{%s}' % ','.join('%s="%s"' % (key, _escape(value))
+                             for key, value in sorted(labels.iteritems()))
+
+def _bound(value):
+    return '%g' % (value,)
+
+def _histogram(lines, metric, endpoint, histogram):
+    for bound, count in histogram.cumulative():
+        lines.append('%s_bucket%s %d' % (
+            metric, _labels(endpoint=endpoint, le=_bound(bound)), count))
+    lines.append('%s_bucket%s %d' % (
+        metric, _labels(endpoint=endpoint, le='+Inf'), histogram.count))
+    lines.append('%s_sum%s %r' % (metric, _labels(endpoint=endpoint),
+                                  float(histogram.sum)))
+    lines.append('%s_count%s %d' % (metric, _labels(endpoint=endpoint),
+                                    histogram.count))
+
+def prometheus():
+    """ The metrics in the Prometheus text exposition format """
+    with _lock:
+        endpoints = sorted(_endpoints.iteritems())
+        lines = [
+            '# HELP djangopypi_requests_total Requests handled.',
+            '# TYPE djangopypi_requests_total counter',
+        ]
+        for endpoint, stats in endpoints:
+            for (method, status), count in sorted(stats.requests.iteritems()):
+                lines.append('djangopypi_requests_total%s %d' % (
+                    _labels(endpoint=endpoint, method=method, status=status),
+                    count))
+
+        lines += [
+            '# HELP djangopypi_request_duration_seconds Latency of requests.',
+            '# TYPE djangopypi_request_duration_seconds histogram',
+        ]
+        for endpoint, stats in endpoints:
+            _histogram(lines, 'djangopypi_request_duration_seconds', endpoint,
+                       stats.latency)
+
+        lines += [
+            '# HELP djangopypi_db_queries Database queries per request.',
+            '# TYPE djangopypi_db_queries histogram',
+        ]
+        for endpoint, stats in endpoints:
+            _histogram(lines, 'djangopypi_db_queries', endpoint,
+                       stats.queries)
+
+        for metric, kind, help, attribute in (
+                ('djangopypi_db_query_duration_seconds_total', 'counter',
+                 'Time spent in database queries.', 'query_time'),
+                ('djangopypi_response_bytes_total', 'counter',
+                 'Bytes of response bodies.', 'bytes')):
+            lines += ['# HELP %s %s' % (metric, help),
+                      '# TYPE %s %s' % (metric, kind)]
+            for endpoint, stats in endpoints:
+                lines.append('%s%s %r' % (metric, _labels(endpoint=endpoint),
+                                          getattr(stats, attribute)))
+
+        lines += [
+            '# HELP djangopypi_cache_requests_total Cache lookups.',
+            '# TYPE djangopypi_cache_requests_total counter',
+        ]
+        for name, (hits, misses) in sorted(_caches.iteritems()):
+            lines.append('djangopypi_cache_requests_total%s %d' % (
+                _labels(cache=name, result='hit'), hits))
+            lines.append('djangopypi_cache_requests_total%s %d' % (
+                _labels(cache=name, result='miss'), misses))
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    """ Forget everything recorded so far """
+    with _lock:
+        _endpoints.clear()
+        _caches.clear()
+        _recent.clear()
@@ -0,0 +1,130 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends import util
+
+from djangopypi import conf, metrics, profiling
+
+_watchers = threading.local()
+
+class ObservedCursor(util.CursorWrapper):
+    """ Tells the query watchers of the thread about every query run through
+    a cursor, and how long it took """
+
+    def execute(self, sql, params=()):
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            _notify(sql, params, time.time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            _notify(sql, param_list, time.time() - start)
+
+def _notify(sql, params, duration):
+    for callback in getattr(_watchers, 'callbacks', ()):
+        callback(sql, params, duration)
+
+def _observed_cursor(connection, debug):
+    def make_debug_cursor(cursor):
+        if debug:
+            cursor = util.CursorDebugWrapper(cursor, connection)
+        return ObservedCursor(cursor, connection)
+    return make_debug_cursor
+
+def watch_queries(callback):
+    """ Call ``callback(sql, params, duration)`` for each query this thread
+    runs until ``unwatch_queries``.
+
+    The connections of the thread hand out observed cursors in the meantime;
+    connections are local to their thread, so queries run by other threads
+    are unaffected. """
+    callbacks = getattr(_watchers, 'callbacks', None)
+    if callbacks is None:
+        callbacks = _watchers.callbacks = []
+    if not callbacks:
+        for connection in connections.all():
+            if 'make_debug_cursor' not in connection.__dict__:
+                connection.watched_debug_cursor = connection.use_debug_cursor
+            # The cursor the connection would have used, wrapped
+            debug = connection.watched_debug_cursor or \
+                    (connection.watched_debug_cursor is None and
+                     settings.DEBUG)
+            connection.use_debug_cursor = True
+            connection.make_debug_cursor = _observed_cursor(connection, debug)
+    callbacks.append(callback)
+
+def unwatch_queries(callback):
+    callbacks = getattr(_watchers, 'callbacks', [])
+    if callback in callbacks:
+        callbacks.remove(callback)
+    if not callbacks:
+        for connection in connections.all():
+            if 'make_debug_cursor' in connection.__dict__:
+                del connection.make_debug_cursor
+                connection.use_debug_cursor = connection.watched_debug_cursor
+
+def _count_query(sql, params, duration):
+    metrics.count_query(duration)
+
+class MetricsMiddleware(object):
+    """ Records the latency, database queries and size of every request in
+    ``djangopypi.metrics`` """
+
+    def process_request(self, request):
+        request.metrics_start = time.time()
+        metrics.start_queries()
+        # Left over by a request that failed before process_response
+        unwatch_queries(_count_query)
+        watch_queries(_count_query)
+
+    def process_response(self, request, response):
+        start = getattr(request, 'metrics_start', None)
+        if start is None:
+            return response
+        duration = time.time() - start
+        unwatch_queries(_count_query)
+        queries, query_time = metrics.stop_queries()
+
+        if response.has_header('Content-Length'):
+            size = int(response['Content-Length'])
+        elif response._is_string:
+            size = len(response.content)
+        else:
+            size = getattr(request, 'metrics_bytes', 0)
+        metrics.record(getattr(request, 'metrics_endpoint', metrics.OTHER),
+                       request.method, request.path, response.status_code,
+                       duration, queries, query_time, size)
+        return response
+
+class ProfilingMiddleware(object):
+    """ Samples the stacks and records the queries of a share of the
+    requests, and keeps the profiles of those slower than
+    ``PROFILE_THRESHOLD`` in ``PROFILE_ROOT`` (see ``djangopypi.profiling``).
+    Does nothing unless ``PROFILE_ROOT`` is set. """
+
+    def process_request(self, request):
+        if not conf.PROFILE_ROOT or \
+           random.random() >= conf.PROFILE_SAMPLE_RATE:
+            return None
+        profile = request.profile = profiling.Profile()
+        profile.start()
+        watch_queries(profile.add_query)
+        return None
+
+    def process_response(self, request, response):
+        profile = getattr(request, 'profile', None)
+        if profile is None:
+            return response
+        unwatch_queries(profile.add_query)
+        profile.stop()
+        if profile.duration >= conf.PROFILE_THRESHOLD:
+            profiling.save(profile, request, response)
+        return response
@@ -4,16 +4,14 @@ from south.db import db
 from south.v2 import DataMigration
 from django.db import models
 
-from django.contrib.auth.models import Group
-from djangopypi.models import Package
-
 class Migration(DataMigration):
 
     def forwards(self, orm):
         "Write your forwards methods here."
-        num_groups = Group.objects.count()
+        # Use the frozen models, later migrations add columns to Package
+        num_groups = orm['auth.Group'].objects.count()
 
-        for package in Package.objects.all():
+        for package in orm.Package.objects.all():
             if package.download_permissions.count() == num_groups:
                 package.allow_authenticated = True
                 package.save()
@@ -4,25 +4,25 @@ from south.db import db
 from south.v2 import DataMigration
 from django.db import models
 
-from django.contrib.auth.models import Group
-from djangopypi.models import Package
-
 class Migration(DataMigration):
 
     def forwards(self, orm):
         "Write your forwards methods here."
-        buildbot_group = Group.objects.get_or_create(name='buildbot')[0]
+        # Use the frozen models, later migrations add columns to Package
+        buildbot_group = orm['auth.Group'].objects.get_or_create(
+            name='buildbot')[0]
 
-        for package in Package.objects.all():
+        for package in orm.Package.objects.all():
             if package.download_permissions.count() > 0:
                 package.download_permissions.add(buildbot_group)
                 package.save()
 
     def backwards(self, orm):
         "Write your backwards methods here."
-        buildbot_group = Group.objects.get_or_create(name='buildbot')[0]
+        buildbot_group = orm['auth.Group'].objects.get_or_create(
+            name='buildbot')[0]
 
-        for package in Package.objects.all():
+        for package in orm.Package.objects.all():
             if buildbot_group in package.download_permissions.all():
                 package.download_permissions.remove(buildbot_group)
                 package.save()
@@ -0,0 +1,232 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import DataMigration
+from django.db import connection, models
+from django.utils import simplejson as json
+
+from djangopypi.requirements import parse_requirement
+
+BATCH_SIZE = 500
+
+COLUMNS = (('summary', 512), ('author', 255), ('license', 255),
+           ('keywords', 255), ('requires_python', 128))
+
+def load(value):
+    """ The metadata blob as a dict of lists """
+    if isinstance(value, basestring):
+        value = value and json.loads(value) or {}
+    info = {}
+    for key, values in dict(value).iteritems():
+        if not isinstance(values, list):
+            values = [values]
+        info[key] = values
+    return info
+
+def last(info, key):
+    values = info.get(key)
+    return values and values[-1] or u''
+
+class Migration(DataMigration):
+
+    def batches(self, orm):
+        """ ``(pk, package_info)`` rows of all releases, BATCH_SIZE at a time
+        """
+        last_pk = 0
+        while True:
+            rows = list(orm.Release.objects.filter(pk__gt=last_pk)
+                                           .order_by('pk')
+                                           .values_list('pk', 'package_info')
+                                           [:BATCH_SIZE])
+            if not rows:
+                return
+            last_pk = rows[-1][0]
+            yield rows
+
+    def forwards(self, orm):
+        cursor = connection.cursor()
+        qn = connection.ops.quote_name
+        release_table = qn(orm.Release._meta.db_table)
+        update_sql = 'UPDATE %s SET %s, %s = %%s WHERE %s = %%s' % (
+            release_table,
+            ', '.join('%s = %%s' % qn(column) for column, length in COLUMNS),
+            qn('package_info'), qn('id'))
+        description_sql = 'INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (
+            qn(orm.ReleaseDescription._meta.db_table),
+            qn('release_id'), qn('text'))
+        classifier_sql = 'INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (
+            qn('djangopypi_release_classifiers'),
+            qn('release_id'), qn('classifier_id'))
+        dependency_sql = 'INSERT INTO %s (%s, %s, %s, %s) ' \
+                         'VALUES (%%s, %%s, %%s, %%s)' % (
+            qn(orm.Dependency._meta.db_table), qn('release_id'), qn('name'),
+            qn('specifier'), qn('marker'))
+
+        known_classifiers = set(orm.Classifier.objects.values_list('name',
+                                                                   flat=True))
+        for rows in self.batches(orm):
+            updates, descriptions, classifiers, dependencies = [], [], [], []
+            for pk, package_info in rows:
+                info = load(package_info)
+                description = last(info, 'description')
+                info.pop('description', None)
+                if description:
+                    descriptions.append((pk, description))
+
+                updates.append(tuple(last(info, column)[:length]
+                                     for column, length in COLUMNS) +
+                               (json.dumps(info), pk))
+
+                for name in set(info.get('classifier', ())):
+                    if name not in known_classifiers:
+                        orm.Classifier.objects.create(name=name)
+                        known_classifiers.add(name)
+                    classifiers.append((pk, name))
+
+                seen = set()
+                for value in info.get('requires_dist', ()):
+                    requirement = parse_requirement(value)
+                    if requirement is None:
+                        continue
+                    name, specifier, marker = requirement
+                    row = (pk, name, specifier[:255], marker[:255])
+                    if row not in seen:
+                        seen.add(row)
+                        dependencies.append(row)
+
+            cursor.executemany(update_sql, updates)
+            if descriptions:
+                cursor.executemany(description_sql, descriptions)
+            if classifiers:
+                cursor.executemany(classifier_sql, classifiers)
+            if dependencies:
+                cursor.executemany(dependency_sql, dependencies)
+
+    def backwards(self, orm):
+        # Put the descriptions back into the metadata blobs, the columns and
+        # tables are dropped by the schema migration.
+        cursor = connection.cursor()
+        qn = connection.ops.quote_name
+        update_sql = 'UPDATE %s SET %s = %%s WHERE %s = %%s' % (
+            qn(orm.Release._meta.db_table), qn('package_info'), qn('id'))
+
+        for rows in self.batches(orm):
+            descriptions = dict(orm.ReleaseDescription.objects
+                                   .filter(release__in=[pk for pk, i in rows])
+                                   .values_list('release', 'text'))
+            updates = []
+            for pk, package_info in rows:
+                if pk in descriptions:
+                    info = load(package_info)
+                    info['description'] = [descriptions[pk]]
+                    updates.append((json.dumps(info), pk))
+            if updates:
+                cursor.executemany(update_sql, updates)
+
+    models = {
+        'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        'auth.permission': {
+            'Meta': {'ordering': "('content_type__app_label', 'content_type__model', 'codename')", 'unique_together': "(('content_type', 'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Group']", 'symmetrical': 'False', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'djangopypi.classifier': {
+            'Meta': {'ordering': "('name',)", 'object_name': 'Classifier'},
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '255', 'primary_key': 'True'})
+        },
+        'djangopypi.dependency': {
+            'Meta': {'object_name': 'Dependency'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'marker': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '255', 'db_index': 'True'}),
+            'release': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'dependencies'", 'to': "orm['djangopypi.Release']"}),
+            'specifier': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'})
+        },
+        'djangopypi.distribution': {
+            'Meta': {'unique_together': "(('release', 'filetype', 'pyversion'),)", 'object_name': 'Distribution'},
+            'comment': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'content': ('django.db.models.fields.files.FileField', [], {'max_length': '100'}),
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'filetype': ('django.db.models.fields.CharField', [], {'max_length': '32'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'md5_digest': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'mirror_url': ('django.db.models.fields.CharField', [], {'max_length': '512', 'blank': 'True'}),
+            'pyversion': ('django.db.models.fields.CharField', [], {'max_length': '16', 'blank': 'True'}),
+            'release': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'distributions'", 'to': "orm['djangopypi.Release']"}),
+            'signature': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'uploader': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['auth.User']"})
+        },
+        'djangopypi.package': {
+            'Meta': {'ordering': "['name']", 'object_name': 'Package'},
+            'allow_authenticated': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'allow_comments': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'auto_hide': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'download_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Group']", 'symmetrical': 'False', 'blank': 'True'}),
+            'maintainers': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "'packages_maintained'", 'blank': 'True', 'to': "orm['auth.Group']"}),
+            'mirror_checked': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'mirror_url': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '255', 'primary_key': 'True'}),
+            'owners': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "'packages_owned'", 'blank': 'True', 'to': "orm['auth.Group']"})
+        },
+        'djangopypi.release': {
+            'Meta': {'ordering': "['-created']", 'unique_together': "(('package', 'version'),)", 'object_name': 'Release'},
+            'author': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '255', 'blank': 'True'}),
+            'classifiers': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "'releases'", 'blank': 'True', 'to': "orm['djangopypi.Classifier']"}),
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'hidden': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'keywords': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'license': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '255', 'blank': 'True'}),
+            'metadata_version': ('django.db.models.fields.CharField', [], {'default': "'1.0'", 'max_length': '64'}),
+            'package': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'releases'", 'to': "orm['djangopypi.Package']"}),
+            'package_info': ('djangopypi.models.PackageInfoField', [], {}),
+            'requires_python': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'summary': ('django.db.models.fields.CharField', [], {'max_length': '512', 'blank': 'True'}),
+            'version': ('django.db.models.fields.CharField', [], {'max_length': '128'})
+        },
+        'djangopypi.releasedescription': {
+            'Meta': {'object_name': 'ReleaseDescription'},
+            'release': ('django.db.models.fields.related.OneToOneField', [], {'related_name': "'long_description'", 'unique': 'True', 'primary_key': 'True', 'to': "orm['djangopypi.Release']"}),
+            'text': ('django.db.models.fields.TextField', [], {'blank': 'True'})
+        },
+        'djangopypi.review': {
+            'Meta': {'object_name': 'Review'},
+            'comment': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'rating': ('django.db.models.fields.PositiveSmallIntegerField', [], {'blank': 'True'}),
+            'release': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'reviews'", 'to': "orm['djangopypi.Release']"})
+        }
+    }
+
+    complete_apps = ['djangopypi']
+    symmetrical = True
@@ -1,38 +1,77 @@
 import os
-import logging
+import uuid
 
-from django.db import models
+from django.db import connection, models, transaction
 from django.core.files.storage import FileSystemStorage
 from django.utils.translation import ugettext_lazy as _
 from django.utils import simplejson as json
 from django.utils.datastructures import MultiValueDict
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.conf import settings
 
-from djangopypi import conf
+try:
+    from ujson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+from djangopypi import conf, coremetadata, versions, wheels
+from djangopypi.requirements import parse_requirement
+
+class PackageInfoDescriptor(object):
+    """ Keeps the JSON text of a ``PackageInfoField`` as it was loaded from the
+    database, and only decodes it the first time it is read """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.field.attname]
+        if not isinstance(value, MultiValueDict):
+            value = instance.__dict__[self.field.attname] = \
+                self.field.to_python(value)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
 
 class PackageInfoField(models.Field):
     description = u'Python Package Information Field'
-    __metaclass__ = models.SubfieldBase
 
     def __init__(self, *args, **kwargs):
         kwargs['editable'] = False
         super(PackageInfoField,self).__init__(*args, **kwargs)
 
+    def contribute_to_class(self, cls, name):
+        super(PackageInfoField, self).contribute_to_class(cls, name)
+        setattr(cls, self.name, PackageInfoDescriptor(self))
+
+    def is_loaded(self, instance):
+        """ Whether the value of ``instance`` has been decoded """
+        return isinstance(instance.__dict__.get(self.attname), MultiValueDict)
+
     def to_python(self, value):
         if isinstance(value, basestring):
             if value:
-                return MultiValueDict(json.loads(value))
+                return MultiValueDict(json_loads(value))
             else:
                 return MultiValueDict()
-        if isinstance(value, dict):
-            return MultiValueDict(value)
         if isinstance(value,MultiValueDict):
             return value
+        if isinstance(value, dict):
+            return MultiValueDict(value)
         raise ValueError('Unexpected value encountered when converting data to python')
 
+    def pre_save(self, model_instance, add):
+        # Values that were never decoded are written back as they are
+        if self.attname in model_instance.__dict__:
+            return model_instance.__dict__[self.attname]
+        return getattr(model_instance, self.attname)
+
     def get_prep_value(self, value):
         if isinstance(value,MultiValueDict):
             return json.dumps(dict(value.iterlists()))
@@ -57,6 +96,10 @@ class Classifier(models.Model):
     def __unicode__(self):
         return self.name
 
+    @models.permalink
+    def get_absolute_url(self):
+        return ('djangopypi-classifier', (), {'classifier': self.name})
+
 class Package(models.Model):
     name = models.CharField(max_length=255, unique=True, primary_key=True,
                             editable=False)
@@ -78,6 +121,12 @@ class Package(models.Model):
     )
     maintainers = models.ManyToManyField(Group, blank=True,
                                          related_name="packages_maintained")
+    mirror_url = models.CharField(max_length=255, blank=True, editable=False,
+        help_text="The upstream index page this package is mirrored from, "
+                  "when it was pulled in by the proxy"
+    )
+    mirror_checked = models.DateTimeField(null=True, blank=True,
+                                          editable=False)
 
     class Meta:
         verbose_name = _(u"package")
@@ -88,6 +137,10 @@ class Package(models.Model):
     def __unicode__(self):
         return self.name
 
+    @property
+    def is_mirror(self):
+        return bool(self.mirror_url)
+
     @models.permalink
     def get_absolute_url(self):
         return ('djangopypi-package', (), {'package': self.name})
@@ -114,17 +167,40 @@ class Package(models.Model):
 class Release(models.Model):
     package = models.ForeignKey(Package, related_name="releases", editable=False)
     version = models.CharField(max_length=128, editable=False)
+    # The version as a string that sorts like it (see djangopypi.versions),
+    # so releases can be ordered by version in the database.
+    sort_key = models.CharField(max_length=255, editable=False, db_index=True)
     metadata_version = models.CharField(max_length=64, default='1.0')
     package_info = PackageInfoField(blank=False)
     hidden = models.BooleanField(default=False)
     created = models.DateTimeField(auto_now_add=True, editable=False)
 
+    # Copies of the most queried metadata fields, kept up to date from
+    # package_info on save. The description is kept in ReleaseDescription.
+    summary = models.CharField(max_length=512, blank=True, editable=False)
+    author = models.CharField(max_length=255, blank=True, editable=False,
+                              db_index=True)
+    license = models.CharField(max_length=255, blank=True, editable=False,
+                               db_index=True)
+    keywords = models.CharField(max_length=255, blank=True, editable=False)
+    home_page = models.CharField(max_length=512, blank=True, editable=False)
+    download_url = models.CharField(max_length=512, blank=True,
+                                    editable=False)
+    requires_python = models.CharField(max_length=128, blank=True,
+                                       editable=False, db_index=True)
+    classifiers = models.ManyToManyField(Classifier, blank=True,
+                                         editable=False,
+                                         related_name='releases')
+
+    _description = None
+    _description_changed = False
+
     class Meta:
         verbose_name = _(u"release")
         verbose_name_plural = _(u"releases")
         unique_together = ("package", "version")
-        get_latest_by = 'created'
-        ordering = ['-created']
+        get_latest_by = 'sort_key'
+        ordering = ['-sort_key']
 
     def __unicode__(self):
         return self.release_name
@@ -133,17 +209,53 @@ class Release(models.Model):
     def release_name(self):
         return u"%s-%s" % (self.package.name, self.version)
 
-    @property
-    def summary(self):
-        return self.package_info.get('summary', u'')
-
-    @property
-    def description(self):
-        return self.package_info.get('description', u'')
-
-    @property
-    def classifiers(self):
-        return self.package_info.getlist('classifier')
+    def _get_description(self):
+        if self._description is None:
+            try:
+                self._description = self.long_description.text
+            except ReleaseDescription.DoesNotExist:
+                self._description = u''
+        return self._description
+
+    def _set_description(self, value):
+        self._description = value or u''
+        self._description_changed = True
+
+    description = property(_get_description, _set_description)
+
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        # Metadata that was never decoded has not changed, nor have the
+        # columns, classifiers and dependencies taken from it
+        changed = created or \
+            self._meta.get_field('package_info').is_loaded(self)
+        if changed:
+            if 'description' in self.package_info:
+                self.description = self.package_info['description']
+                del self.package_info['description']
+            for field, value in \
+                    metadata_columns(self.package_info).iteritems():
+                setattr(self, field, value)
+        self.sort_key = versions.parse(self.version).sort_key
+
+        super(Release, self).save(*args, **kwargs)
+
+        if self._description_changed:
+            updated = ReleaseDescription.objects.filter(release=self) \
+                                                .update(text=self._description)
+            if not updated and self._description:
+                ReleaseDescription.objects.create(release=self,
+                                                  text=self._description)
+            self._description_changed = False
+        if changed:
+            self.sync_classifiers(created)
+            self.sync_dependencies(created)
+
+    def sync_classifiers(self, created=False):
+        sync_classifiers([self], created)
+
+    def sync_dependencies(self, created=False):
+        sync_dependencies([self], created)
 
     @models.permalink
     def get_absolute_url(self):
@@ -156,6 +268,151 @@ class Release(models.Model):
         super(Release,self).delete(*args,**kwargs)
 
 
+def metadata_columns(package_info):
+    """ The values of the ``Release`` columns copied from ``package_info`` """
+    columns = {}
+    for field in ('summary', 'author', 'license', 'keywords', 'home_page',
+                  'download_url', 'requires_python'):
+        max_length = Release._meta.get_field(field).max_length
+        columns[field] = (package_info.get(field) or u'')[:max_length]
+    return columns
+
+def sync_classifiers(releases, created=False):
+    """ Make the classifiers relation of each of ``releases`` match its
+    ``package_info``, with a constant number of queries for the whole list.
+    ``created`` tells that the releases have no classifiers yet. Returns
+    whether anything changed. """
+    through = Release.classifiers.through
+
+    wanted = set()
+    for release in releases:
+        for name in release.package_info.getlist('classifier'):
+            wanted.add((release.pk, name))
+
+    current = {}
+    if not created and releases:
+        for pk, release_id, name in through.objects.filter(
+                release__in=[release.pk for release in releases]) \
+                .values_list('pk', 'release', 'classifier'):
+            current[(release_id, name)] = pk
+
+    stale = [pk for row, pk in current.iteritems() if row not in wanted]
+    missing = sorted(row for row in wanted if row not in current)
+    if not stale and not missing:
+        return False
+
+    if stale:
+        through.objects.filter(pk__in=stale).delete()
+    if missing:
+        names = set(name for release_id, name in missing)
+        known = set(Classifier.objects.filter(name__in=names)
+                                      .values_list('name', flat=True))
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        if names - known:
+            cursor.executemany('INSERT INTO %s (%s) VALUES (%%s)' % (
+                qn(Classifier._meta.db_table), qn('name')),
+                [(name,) for name in sorted(names - known)])
+        cursor.executemany('INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (
+            qn(through._meta.db_table), qn('release_id'),
+            qn('classifier_id')), missing)
+        transaction.commit_unless_managed()
+
+    from djangopypi import classifiers
+    classifiers.invalidate()
+    return True
+
+def sync_dependencies(releases, created=False):
+    """ Make the ``Dependency`` rows of each of ``releases`` match the
+    ``requires`` and ``requires_dist`` fields of its ``package_info``, with a
+    constant number of queries for the whole list. Returns whether anything
+    changed. """
+    wanted = {}
+    for release in releases:
+        rows = set()
+        for field in DEPENDENCY_FIELDS:
+            rows.update(parse_requirements(release.package_info.getlist(field)))
+        wanted[release.pk] = rows
+
+    current = dict((pk, set()) for pk in wanted)
+    if not created and releases:
+        for release_id, name, specifier, marker in Dependency.objects.filter(
+                release__in=wanted.keys()) \
+                .values_list('release', 'name', 'specifier', 'marker'):
+            current[release_id].add((name, specifier, marker))
+
+    changed = [pk for pk in wanted if wanted[pk] != current[pk]]
+    if not changed:
+        return False
+
+    stale = [pk for pk in changed if current[pk]]
+    if stale:
+        Dependency.objects.filter(release__in=stale).delete()
+    rows = [(pk, name, specifier, marker) for pk in sorted(changed)
+            for name, specifier, marker in sorted(wanted[pk])]
+    if rows:
+        qn = connection.ops.quote_name
+        connection.cursor().executemany(
+            'INSERT INTO %s (%s, %s, %s, %s) VALUES (%%s, %%s, %%s, %%s)' % (
+                qn(Dependency._meta.db_table), qn('release_id'), qn('name'),
+                qn('specifier'), qn('marker')), rows)
+        transaction.commit_unless_managed()
+
+    from djangopypi import dependencies
+    dependencies.invalidate()
+    return True
+
+def parse_requirements(values):
+    """ ``(name, specifier, marker)`` for each valid requirement of
+    ``values`` """
+    for value in values:
+        requirement = parse_requirement(value)
+        if requirement is not None:
+            name, specifier, marker = requirement
+            yield name, specifier[:255], marker[:255]
+
+DEPENDENCY_FIELDS = ('requires', 'requires_dist')
+
+class ReleaseDescription(models.Model):
+    """ The long description of a release, which is only needed on its own
+    page and is kept out of the release table for that reason """
+    release = models.OneToOneField(Release, primary_key=True, editable=False,
+                                   related_name='long_description')
+    text = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = _(u"release description")
+        verbose_name_plural = _(u"release descriptions")
+
+    def __unicode__(self):
+        return unicode(self.release)
+
+class Dependency(models.Model):
+    """ A parsed ``Requires`` or ``Requires-Dist`` entry of a release """
+    release = models.ForeignKey(Release, related_name='dependencies',
+                                editable=False)
+    name = models.CharField(max_length=255, db_index=True)
+    specifier = models.CharField(max_length=255, blank=True)
+    marker = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        verbose_name = _(u"dependency")
+        verbose_name_plural = _(u"dependencies")
+
+    def __unicode__(self):
+        return u'%s %s' % (self.name, self.specifier)
+
+class FileNameTaken(Exception):
+    """ The storage holds a file of the name of a new distribution, which
+    belongs to no distribution """
+
+    def __init__(self, filename):
+        Exception.__init__(self, filename)
+        self.filename = filename
+
+    def __str__(self):
+        return 'A file named %s is already stored.' % (self.filename,)
+
 class Distribution(models.Model):
     release = models.ForeignKey(Release, related_name="distributions",
                                 editable=False)
@@ -175,10 +432,28 @@ class Distribution(models.Model):
     signature = models.TextField(blank=True)
     created = models.DateTimeField(auto_now_add=True, editable=False)
     uploader = models.ForeignKey(User, editable=False)
+    mirror_url = models.CharField(max_length=512, blank=True, editable=False)
+    # The compatibility tags of wheels, from their file name
+    python_tag = models.CharField(max_length=64, blank=True, editable=False,
+                                  db_index=True)
+    abi_tag = models.CharField(max_length=64, blank=True, editable=False,
+                               db_index=True)
+    platform_tag = models.CharField(max_length=255, blank=True,
+                                    editable=False, db_index=True)
+    # The sha256 of the core metadata file served at <url>.metadata (see
+    # djangopypi.coremetadata), empty when there is none
+    metadata_sha256 = models.CharField(max_length=64, blank=True,
+                                       editable=False)
+    # The base name of the file, which every lookup of a file by name uses
+    filename = models.CharField(max_length=255, unique=True, editable=False)
 
-    @property
-    def filename(self):
-        return os.path.basename(self.content.name)
+    def __init__(self, *args, **kwargs):
+        super(Distribution, self).__init__(*args, **kwargs)
+        # The file the row points to, so that saving only reads the metadata
+        # of a file that is new or replaced
+        self._stored_content = None
+        if self.pk is not None and 'content' in self.__dict__:
+            self._stored_content = self.content.name
 
     @property
     def display_filetype(self):
@@ -197,18 +472,97 @@ class Distribution(models.Model):
     class Meta:
         verbose_name = _(u"distribution")
         verbose_name_plural = _(u"distributions")
-        unique_together = ("release", "filetype", "pyversion")
+        unique_together = ("release", "filetype", "pyversion", "python_tag",
+                           "abi_tag", "platform_tag")
 
     def __unicode__(self):
         return self.filename
+
+    def save(self, *args, **kwargs):
+        committed = False
+        if self.content and not self.content._committed:
+            # The file is published under the name it was uploaded with.
+            # The storage renames it when a file of that name is left over
+            # from a distribution that was not saved, which must not be
+            # published under another name.
+            name = os.path.basename(self._meta.get_field('content')
+                                    .generate_filename(self, self.content.name))
+            # The file itself is given to the storage, which then moves
+            # uploaded and staged files rather than copying them
+            self.content.save(self.content.name, self.content.file,
+                              save=False)
+            if os.path.basename(self.content.name) != name:
+                self.content.storage.delete(self.content.name)
+                raise FileNameTaken(name)
+            self.filename = name
+            committed = True
+        if not self.filename:
+            self.filename = os.path.basename(self.content.name)
+        tags = wheels.parse_filename(self.filename)
+        if tags is not None:
+            self.filetype = 'bdist_wheel'
+            self.python_tag = tags['python_tag']
+            self.abi_tag = tags['abi_tag']
+            self.platform_tag = tags['platform_tag']
+        metadata = None
+        if self.content and (committed or
+                             self.content.name != self._stored_content):
+            metadata = coremetadata.read_distribution(self)
+            self.metadata_sha256 = metadata is not None and \
+                                   coremetadata.digest(metadata) or ''
+        super(Distribution, self).save(*args, **kwargs)
+        self._stored_content = self.content.name
+        if metadata is not None:
+            coremetadata.store(self, metadata)
     
     def delete(self,*args,**kwargs):
+        try:
+            coremetadata.delete(self)
+        except:
+            pass
         try:
             self.content.delete()
         except:
             pass
         super(Distribution,self).delete(*args,**kwargs)
 
+def new_session_id():
+    return uuid.uuid4().hex
+
+class UploadSession(models.Model):
+    """ A file being uploaded in chunks, staged by ``djangopypi.uploads``
+    until it is committed as a distribution """
+    id = models.CharField(max_length=32, primary_key=True,
+                          default=new_session_id, editable=False)
+    user = models.ForeignKey(User, editable=False)
+    filename = models.CharField(max_length=255, editable=False)
+    # The size and md5 announced by the client, checked on commit
+    size = models.BigIntegerField(null=True, blank=True, editable=False)
+    md5_digest = models.CharField(max_length=32, blank=True, editable=False)
+    # The number of bytes received, where the next chunk starts
+    offset = models.BigIntegerField(default=0, editable=False)
+    # The fields of the upload, as a JSON object of lists
+    fields = models.TextField(editable=False)
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+    updated = models.DateTimeField(auto_now=True, editable=False,
+                                   db_index=True)
+
+    class Meta:
+        verbose_name = _(u'upload session')
+        verbose_name_plural = _(u'upload sessions')
+
+    def __unicode__(self):
+        return self.filename
+
+    def get_fields(self):
+        data = MultiValueDict()
+        for key, values in json.loads(self.fields).iteritems():
+            data.setlist(key, values)
+        return data
+
+    def set_fields(self, data):
+        self.fields = json.dumps(dict(data.lists()))
+
 class Review(models.Model):
     release = models.ForeignKey(Release, related_name="reviews")
     rating = models.PositiveSmallIntegerField(blank=True)
@@ -218,10 +572,97 @@ class Review(models.Model):
         verbose_name = _(u'release review')
         verbose_name_plural = _(u'release reviews')
 
+class DistributionDownloads(models.Model):
+    """ The number of times a distribution was downloaded on a day, written
+    in bulk by ``djangopypi.downloads`` """
+    distribution = models.ForeignKey(Distribution, related_name='downloads',
+                                     editable=False)
+    day = models.DateField(editable=False, db_index=True)
+    count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        verbose_name = _(u'distribution downloads')
+        verbose_name_plural = _(u'distribution downloads')
+        unique_together = ('distribution', 'day')
+        ordering = ['-day']
+
+    def __unicode__(self):
+        return u'%s %s' % (self.distribution, self.day)
+
 @receiver(user_logged_in)
 def log_authentication(sender, request, user, *args, **kwargs):
-    logger = logging.getLogger('djangopypi.auth_logger')
-    logger.info('user: %s authenticated' % user.username)
+    from djangopypi import events
+    events.emit('login', request, user=user.username)
+
+@receiver(post_save, sender=Package)
+@receiver(post_delete, sender=Package)
+def invalidate_package_caches(sender, instance, created=False, *args, **kwargs):
+    from djangopypi import deferred, documents, export, simple
+    deferred.on_commit(documents.invalidate_package, instance.name)
+    deferred.on_commit(simple.invalidate)
+    deferred.on_commit(simple.invalidate, instance.name)
+    # A new package has no releases, and its permissions are added after
+    # this signal, so leave it to the release to export it.
+    if not created:
+        deferred.on_commit(export.export_package, instance.name)
+
+@receiver(m2m_changed, sender=Package.download_permissions.through)
+def invalidate_index_caches(sender, instance, action, reverse, pk_set,
+                            *args, **kwargs):
+    from djangopypi import deferred, export, simple
+    if not action.startswith('post_'):
+        return
+    deferred.on_commit(simple.invalidate)
+    if not reverse:
+        deferred.on_commit(export.export_package, instance.name)
+    else:
+        for name in pk_set or ():
+            deferred.on_commit(export.export_package, name)
+
+@receiver(post_save, sender=Release)
+@receiver(post_delete, sender=Release)
+def invalidate_release_caches(sender, instance, *args, **kwargs):
+    from djangopypi import classifiers, deferred, dependencies, documents, \
+                           export, simple
+    deferred.on_commit(classifiers.invalidate)
+    deferred.on_commit(dependencies.invalidate)
+    deferred.on_commit(documents.invalidate_release, instance.package_id,
+                       instance.version)
+    deferred.on_commit(simple.invalidate, instance.package_id)
+    deferred.on_commit(export.export_package, instance.package_id)
+
+@receiver(post_save, sender=Distribution)
+@receiver(post_delete, sender=Distribution)
+def invalidate_distribution_caches(sender, instance, *args, **kwargs):
+    from djangopypi import deferred, documents, export, simple
+    try:
+        release = instance.release
+    except Release.DoesNotExist:
+        return
+    deferred.on_commit(documents.invalidate_release, release.package_id,
+                       release.version)
+    deferred.on_commit(simple.invalidate, release.package_id)
+    deferred.on_commit(export.export_package, release.package_id)
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set,
+                                *args, **kwargs):
+    from djangopypi import permissions
+    if not reverse:
+        if action.startswith('post_'):
+            permissions.invalidate_user(instance.pk)
+    elif action == 'pre_clear':
+        # The members of the group are gone once it has been cleared
+        for pk in instance.user_set.values_list('pk', flat=True):
+            permissions.invalidate_user(pk)
+    elif action.startswith('post_'):
+        for pk in pk_set or ():
+            permissions.invalidate_user(pk)
+
+@receiver(post_save, sender=User)
+def invalidate_user_scope(sender, instance, *args, **kwargs):
+    from djangopypi import permissions
+    permissions.invalidate_user(instance.pk)
 
 try:
     from south.modelsinspector import add_introspection_rules
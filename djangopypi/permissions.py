@@ -0,0 +1,87 @@
+""" Download permission checks.
+
+Which packages a user may download only depends on whether they are a
+superuser and on the groups they are in, so the set of package names is
+computed once per such scope and cached until packages or their download
+permissions change. Only a cache shared by every worker, e.g. memcached, sees
+those changes everywhere: with a per-process cache the sets are computed for
+every request instead.
+
+Whether a package may be downloaded is always checked in the database, so a
+revoked permission takes effect at once whatever the cache. """
+from django.core.cache import cache
+from django.db.models.query import Q
+
+from djangopypi import conf, metrics, simple, singleflight
+from djangopypi.models import Package
+from djangopypi.singleflight import shared_cache
+
+def user_packages(user):
+    ''' Return a list of packages that the user has permission to download '''
+    if user.is_superuser:
+        return Package.objects.all()
+    else:
+        return Package.objects.filter(
+            Q(download_permissions=None) |
+            Q(allow_authenticated=True) |
+            Q(download_permissions__in=user.groups.all())
+        ).distinct()
+
+def anonymous_packages():
+    ''' Packages any site visitor can download '''
+    return Package.objects.filter(download_permissions=None,
+                                  allow_authenticated=False)
+
+def _scope_key(user_id):
+    return 'djangopypi:scope:%s' % (user_id,)
+
+def user_scope(user):
+    """ A name shared by all users that can download the same packages """
+    if user is None:
+        return 'anonymous'
+    if user.is_superuser:
+        return 'all'
+
+    def build():
+        return 'groups-%s' % '.'.join(
+            str(pk) for pk in sorted(user.groups.values_list('pk', flat=True)))
+
+    if not shared_cache():
+        return build()
+    key = _scope_key(user.pk)
+    scope = cache.get(key)
+    metrics.cache_access(key, scope is not None)
+    if scope is None:
+        scope = build()
+        cache.set(key, scope, conf.PERMISSION_CACHE_TIMEOUT)
+    return scope
+
+def invalidate_user(user_id):
+    cache.delete(_scope_key(user_id))
+
+def allowed_packages(user):
+    """ The names of the packages ``user`` (None for anonymous visitors) may
+    download, as a frozenset """
+    key = 'djangopypi:allowed:%s:%s' % (simple.generation(None),
+                                        user_scope(user))
+
+    def build():
+        if user is None:
+            packages = anonymous_packages()
+        else:
+            packages = user_packages(user)
+        return frozenset(packages.values_list('name', flat=True))
+
+    return singleflight.cached(key, build, conf.PERMISSION_CACHE_TIMEOUT)
+
+def is_anonymous(package):
+    """ Whether anybody, logged in or not, may download ``package`` """
+    return not package.allow_authenticated and \
+           not package.download_permissions.exists()
+
+def can_download(user, package):
+    if user is not None and user.is_superuser:
+        return True
+    if user is None:
+        return is_anonymous(package)
+    return user_packages(user).filter(pk=package.pk).exists()
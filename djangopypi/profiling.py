@@ -0,0 +1,192 @@
+""" Statistical profiling of slow requests.
+
+``ProfilingMiddleware`` (see ``djangopypi.middleware``) profiles a random
+``PROFILE_SAMPLE_RATE`` share of the requests. One thread per process samples
+the stack of each thread handling such a request every ``PROFILE_INTERVAL``
+seconds, and the queries of the request are recorded along with their
+durations. Nothing else is measured, so the request itself only pays for
+the bookkeeping of its queries, and requests that are not sampled pay
+nothing.
+
+Profiles of requests that took ``PROFILE_THRESHOLD`` seconds or more are
+written to ``PROFILE_ROOT`` as a pair of files: ``<name>.folded`` holds the
+collapsed stacks, one ``frame;frame;frame count`` line per stack, as read by
+``flamegraph.pl`` and speedscope, and ``<name>.json`` the request, its
+duration and its queries. Only the last ``PROFILE_MAX_PROFILES`` profiles are
+kept. """
+from __future__ import with_statement
+
+import os
+import re
+import sys
+import tempfile
+import thread
+import threading
+import time
+
+from django.utils import simplejson as json
+
+from djangopypi import conf
+
+FOLDED_SUFFIX = '.folded'
+INFO_SUFFIX = '.json'
+
+# Longest text kept of the parameters of a query
+PARAMS_LENGTH = 500
+
+_labels = {}
+
+def _label(code):
+    """ How a frame running ``code`` appears in stacks """
+    try:
+        return _labels[code]
+    except KeyError:
+        label = _labels[code] = '%s (%s:%d)' % (
+            code.co_name, code.co_filename, code.co_firstlineno)
+        return label
+
+def collapse(frame):
+    """ The stack ending in ``frame``, outermost frame first, as a collapsed
+    stack line without its count """
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code).replace(';', ':'))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+class Sampler(object):
+    """ Samples the stacks of the threads running a ``Profile``, from a
+    thread that is only started once something is profiled and sleeps while
+    nothing is """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, ident, profile):
+        with self._lock:
+            self._profiles[ident] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='djangopypi-sampler')
+                self._thread.daemon = True
+                self._thread.start()
+        self._wakeup.set()
+
+    def remove(self, ident):
+        with self._lock:
+            self._profiles.pop(ident, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                profiles = self._profiles.items()
+                if not profiles:
+                    self._wakeup.clear()
+            if not profiles:
+                self._wakeup.wait()
+                continue
+            frames = sys._current_frames()
+            for ident, profile in profiles:
+                frame = frames.get(ident)
+                if frame is not None:
+                    profile.add_sample(collapse(frame))
+            del frames, frame
+            time.sleep(conf.PROFILE_INTERVAL)
+
+SAMPLER = Sampler()
+
+class Profile(object):
+    """ The stack samples and queries of the request handled by a thread """
+
+    def __init__(self, sampler=None):
+        self.sampler = sampler or SAMPLER
+        self.stacks = {}
+        self.samples = 0
+        self.queries = []
+        self.started = None
+        self.duration = None
+
+    def start(self):
+        self.ident = thread.get_ident()
+        self.started = time.time()
+        self.sampler.add(self.ident, self)
+
+    def stop(self):
+        self.sampler.remove(self.ident)
+        self.duration = time.time() - self.started
+
+    def add_sample(self, stack):
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.samples += 1
+
+    def add_query(self, sql, params, duration):
+        if len(self.queries) < conf.PROFILE_MAX_QUERIES:
+            self.queries.append({
+                'start': round(time.time() - duration - self.started, 6),
+                'time': round(duration, 6),
+                'sql': sql,
+                'params': repr(params)[:PARAMS_LENGTH],
+            })
+
+    def collapsed(self):
+        """ The collapsed stacks, most sampled first """
+        return ''.join('%s %d\n' % (stack, count) for stack, count in
+                       sorted(self.stacks.iteritems(),
+                              key=lambda item: (-item[1], item[0])))
+
+def _write(path, content):
+    """ Write a file at once, so that nothing ever reads half of it """
+    directory = os.path.dirname(path)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        os.write(fd, content)
+    finally:
+        os.close(fd)
+    os.rename(temporary, path)
+
+def profile_name(profile, endpoint):
+    """ Names sort by the time the request started """
+    return '%s-%06d-%s-%d' % (
+        time.strftime('%Y%m%dT%H%M%S', time.gmtime(profile.started)),
+        int(profile.started % 1 * 1000000),
+        re.sub(r'[^\w.-]+', '_', endpoint), os.getpid())
+
+def save(profile, request, response, root=None):
+    """ Write ``profile`` to ``root``, defaulting to ``PROFILE_ROOT``, and
+    remove the oldest profiles beyond ``PROFILE_MAX_PROFILES``. Returns the
+    path of the profile, without a suffix. """
+    root = root or conf.PROFILE_ROOT
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    endpoint = getattr(request, 'metrics_endpoint', 'other')
+    path = os.path.join(root, profile_name(profile, endpoint))
+    _write(path + FOLDED_SUFFIX, profile.collapsed())
+    _write(path + INFO_SUFFIX, json.dumps({
+        'method': request.method,
+        'path': request.get_full_path(),
+        'endpoint': endpoint,
+        'status': response.status_code,
+        'started': profile.started,
+        'duration': profile.duration,
+        'interval': conf.PROFILE_INTERVAL,
+        'samples': profile.samples,
+        'queries': profile.queries,
+        'query_time': sum(query['time'] for query in profile.queries),
+    }, indent=2))
+    prune(root, conf.PROFILE_MAX_PROFILES)
+    return path
+
+def prune(root, keep):
+    """ Remove all but the ``keep`` most recent profiles in ``root`` """
+    names = sorted(name[:-len(INFO_SUFFIX)] for name in os.listdir(root)
+                   if name.endswith(INFO_SUFFIX))
+    for name in names[:max(len(names) - keep, 0)]:
+        for suffix in (FOLDED_SUFFIX, INFO_SUFFIX):
+            try:
+                os.remove(os.path.join(root, name + suffix))
+            except OSError:
+                pass
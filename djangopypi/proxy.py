@@ -0,0 +1,273 @@
+""" Pull-through caching of packages that are missing from the local index.
+
+When ``PROXY_MISSING`` is enabled, the simple page of a package that does not
+exist locally is fetched from ``PROXY_BASE_URL`` once, and its links are
+stored as ``Package``, ``Release`` and ``Distribution`` rows marked with the
+upstream URL they came from. The files themselves are fetched the first time
+they are downloaded. Mirrored packages are revalidated against the upstream
+index once ``PROXY_TTL`` has passed, and keep being served from the local
+copy when the upstream index cannot be reached. Packages the upstream index
+does not know are remembered for ``PROXY_NEGATIVE_TTL``, so that requests for
+them do not each go upstream. """
+from __future__ import with_statement
+
+import hashlib
+import logging
+import os
+import posixpath
+import re
+import tempfile
+import urllib
+import urllib2
+import urlparse
+from datetime import datetime, timedelta
+from HTMLParser import HTMLParser, HTMLParseError
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from djangopypi import conf, deferred, singleflight, wheels
+from djangopypi.requirements import normalize_name
+from djangopypi.models import Package, Release, Distribution
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSIONS = (
+    ('.tar.gz', 'sdist'),
+    ('.tar.bz2', 'sdist'),
+    ('.tgz', 'sdist'),
+    ('.zip', 'sdist'),
+    ('.egg', 'bdist_egg'),
+    ('.whl', 'bdist_wheel'),
+)
+
+EGG_PYVERSION_RE = re.compile(r'-py(\d\.\d+)(-.*)?$')
+
+class ProxyError(Exception):
+    """ The upstream index could not be reached or returned garbage """
+
+class LinkParser(HTMLParser):
+    def __init__(self, base_url):
+        HTMLParser.__init__(self)
+        self.base_url = base_url
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            href = dict(attrs).get('href')
+            if href:
+                self.links.append(urlparse.urljoin(self.base_url, href))
+
+def parse_links(page, base_url):
+    """ Return ``(url, filename, md5_digest)`` for every link of a simple
+    page """
+    parser = LinkParser(base_url)
+    try:
+        parser.feed(page)
+        parser.close()
+    except HTMLParseError, e:
+        raise ProxyError('Could not parse %s: %s' % (base_url, e))
+
+    links = []
+    for link in parser.links:
+        url, fragment = urlparse.urldefrag(link)
+        filename = urllib.unquote(posixpath.basename(
+            urlparse.urlparse(url).path))
+        md5_digest = ''
+        if fragment.startswith('md5='):
+            md5_digest = fragment[4:]
+        links.append((url, filename, md5_digest))
+    return links
+
+def split_filename(filename, package_name):
+    """ Return ``(version, filetype, pyversion)`` for the file name of a
+    distribution of ``package_name``, or None if it is not one """
+    for extension, filetype in ARCHIVE_EXTENSIONS:
+        if filename.lower().endswith(extension):
+            base = filename[:-len(extension)]
+            break
+    else:
+        return None
+
+    if filetype == 'bdist_wheel':
+        tags = wheels.parse_filename(filename)
+        if tags is None or \
+           normalize_name(tags['name']) != normalize_name(package_name):
+            return None
+        return tags['version'], filetype, tags['python_tag']
+
+    prefix = '[-_.]+'.join(re.escape(part) for part in
+                           re.split(r'[-_.]+', package_name))
+    match = re.match(r'(?i)^%s-(.+)$' % prefix, base)
+    if not match:
+        return None
+    version, pyversion = match.group(1), ''
+
+    if filetype == 'bdist_egg':
+        egg = EGG_PYVERSION_RE.search(version)
+        if egg:
+            version, pyversion = version[:egg.start()], egg.group(1)
+    return version, filetype, pyversion
+
+def fetch(url):
+    try:
+        return urllib2.urlopen(url, timeout=conf.PROXY_TIMEOUT)
+    except urllib2.HTTPError:
+        raise
+    except (urllib2.URLError, IOError), e:
+        raise ProxyError('Could not fetch %s: %s' % (url, e))
+
+def mirror_user():
+    user, created = User.objects.get_or_create(username=conf.PROXY_USER)
+    if created:
+        user.set_unusable_password()
+        user.save()
+    return user
+
+def is_fresh(package):
+    return (package.mirror_checked is not None and
+            datetime.now() - package.mirror_checked <
+            timedelta(seconds=conf.PROXY_TTL))
+
+@deferred.commit_on_success
+def _store_links(name, url, links):
+    package, created = Package.objects.get_or_create(name=name, defaults={
+        'mirror_url': url,
+        'auto_hide': False,
+    })
+    Package.objects.filter(pk=package.pk).update(mirror_checked=datetime.now())
+
+    releases = dict((r.version, r) for r in package.releases.all())
+    existing = set(Distribution.objects.filter(release__package=package)
+                   .values_list('release', 'filetype', 'pyversion',
+                                'python_tag', 'abi_tag', 'platform_tag'))
+
+    field = Distribution._meta.get_field('content')
+    # File names are unique across packages
+    existing.update(Distribution.objects.filter(filename__in=[
+        os.path.basename(field.generate_filename(None, filename))
+        for link, filename, md5_digest in links])
+        .values_list('filename', flat=True))
+
+    uploader = None
+    for link, filename, md5_digest in links:
+        parts = split_filename(filename, name)
+        if parts is None:
+            continue
+        version, filetype, pyversion = parts
+        tags = wheels.parse_filename(filename) or {}
+        key = (filetype, pyversion) + tuple(
+            tags.get(tag, '') for tag in
+            ('python_tag', 'abi_tag', 'platform_tag'))
+        path = field.generate_filename(None, filename)
+        if os.path.basename(path) in existing:
+            continue
+
+        release = releases.get(version)
+        if release is None:
+            release = Release.objects.create(package=package, version=version,
+                                             package_info={})
+            releases[version] = release
+
+        if (release.pk,) + key in existing:
+            logger.debug('Not mirroring %s: %s already has a %s file' % (
+                filename, release, filetype))
+            continue
+
+        if uploader is None:
+            uploader = mirror_user()
+        Distribution.objects.create(release=release, content=path,
+                                    md5_digest=md5_digest, filetype=filetype,
+                                    pyversion=pyversion, uploader=uploader,
+                                    mirror_url=link)
+        existing.add(os.path.basename(path))
+        existing.add((release.pk,) + key)
+
+    return Package.objects.get(pk=package.pk)
+
+def sync_package(name):
+    """ Fetch the upstream simple page of ``name`` and store its links. Returns
+    the local package, or None if the upstream index does not know it. """
+    url = '%s/%s/' % (conf.PROXY_BASE_URL.rstrip('/'), name)
+    try:
+        page = fetch(url).read()
+    except urllib2.HTTPError, e:
+        if e.code == 404:
+            return None
+        raise ProxyError('Could not fetch %s: %s' % (url, e))
+
+    return _store_links(name, url, parse_links(page, url))
+
+def lookup(name):
+    """ Return the local package for ``name``, pulling it from the upstream
+    index first when it is missing, or revalidating it when it is a stale
+    mirror. Returns None if the package does not exist anywhere. """
+    def local():
+        try:
+            return Package.objects.get(name=name)
+        except Package.DoesNotExist:
+            return None
+
+    package = local()
+    if package is not None and (not package.is_mirror or is_fresh(package)):
+        return package
+    missing_key = 'djangopypi:proxy:missing:%s' % name
+    if package is None and cache.get(missing_key):
+        return None
+
+    with singleflight.lock('djangopypi:proxy:package:%s' % name):
+        package = local()
+        if package is not None and (not package.is_mirror or
+                                    is_fresh(package)):
+            return package
+        if package is None and cache.get(missing_key):
+            return None
+        try:
+            synced = sync_package(name)
+            if synced is None and package is None:
+                cache.set(missing_key, True, conf.PROXY_NEGATIVE_TTL)
+            # Keep serving what we have if the package is gone upstream
+            return synced or package
+        except ProxyError, e:
+            if package is None:
+                raise
+            logger.warning('Serving stale mirror of %s: %s' % (name, e))
+            return package
+
+def fetch_distribution(dist):
+    """ Download the file of a mirrored distribution into storage, unless an
+    earlier request already did """
+    path = dist.content.storage.path(dist.content.name)
+    with singleflight.lock('djangopypi:proxy:file:%s' % dist.pk):
+        if os.path.exists(path):
+            return
+
+        try:
+            response = fetch(dist.mirror_url)
+        except urllib2.HTTPError, e:
+            raise ProxyError('Could not fetch %s: %s' % (dist.mirror_url, e))
+
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        digest = hashlib.md5()
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                for block in iter(lambda: response.read(1024 * 1024), ''):
+                    digest.update(block)
+                    f.write(block)
+            finally:
+                f.close()
+            if dist.md5_digest and digest.hexdigest() != dist.md5_digest:
+                raise ProxyError('md5 mismatch for %s' % (dist.mirror_url,))
+            os.chmod(tmp, 0644)
+            os.rename(tmp, path)
+        except:
+            os.unlink(tmp)
+            raise
+
+        if not dist.md5_digest:
+            dist.md5_digest = digest.hexdigest()
+            dist.save()
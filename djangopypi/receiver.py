@@ -0,0 +1,297 @@
+""" A server for uploads, which receives request bodies without tying up a
+worker of the application server. One thread reads every connection with
+asyncore, spooling each body to a temporary file, and only the complete
+requests are handed to Django, by ``RECEIVER_THREADS`` threads. A client
+sending its upload slowly then costs a socket and a file, rather than a
+worker that pip requests are waiting for.
+
+``manage.py receive_uploads`` runs it, sharing the settings and database of
+the site. The web server in front routes the upload requests to it, i.e. the
+POST requests of the root of the index and the requests of ``uploads/``, and
+every other request to the application server. Responses are built in
+memory, which suits those of uploads but not downloads. """
+from __future__ import with_statement
+
+import BaseHTTPServer
+import Queue
+import asynchat
+import asyncore
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib
+
+from djangopypi import conf
+
+# The largest request line and headers
+MAX_HEADER_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+def status_line(code):
+    return '%d %s' % (code, BaseHTTPServer.BaseHTTPRequestHandler
+                                          .responses[code][0])
+
+class Waker(asyncore.file_dispatcher):
+    """ Wakes the loop up from another thread """
+
+    def __init__(self, map):
+        read_fd, self.write_fd = os.pipe()
+        asyncore.file_dispatcher.__init__(self, read_fd, map=map)
+        # The dispatcher reads from a duplicate
+        os.close(read_fd)
+
+    def wake(self):
+        os.write(self.write_fd, 'x')
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        self.recv(4096)
+
+    def close(self):
+        asyncore.file_dispatcher.close(self)
+        os.close(self.write_fd)
+
+class Channel(asynchat.async_chat):
+    """ A connection, reading a single request and writing its response """
+
+    def __init__(self, receiver, sock, address):
+        asynchat.async_chat.__init__(self, sock, map=receiver.map)
+        self.receiver = receiver
+        self.address = address
+        self.header = []
+        self.header_size = 0
+        self.environ = None
+        self.body = None
+        self.handed = False
+        self.active = time.time()
+        self.set_terminator('\r\n\r\n')
+
+    def readable(self):
+        # Nothing is read once the request was handed to a worker
+        return not self.handed and asynchat.async_chat.readable(self)
+
+    def collect_incoming_data(self, data):
+        self.active = time.time()
+        if self.body is not None:
+            self.body.write(data)
+            return
+        self.header.append(data)
+        self.header_size += len(data)
+        if self.header_size > MAX_HEADER_SIZE:
+            self.error(413)
+
+    def found_terminator(self):
+        if self.handed:
+            return
+        if self.environ is None:
+            self.start(''.join(self.header))
+        else:
+            self.ready()
+
+    def start(self, header):
+        lines = header.split('\r\n')
+        try:
+            method, target, protocol = lines[0].split()
+        except ValueError:
+            return self.error(400)
+        environ = self.receiver.environ(self.address)
+        for line in lines[1:]:
+            try:
+                name, value = line.split(':', 1)
+            except ValueError:
+                return self.error(400)
+            key = name.strip().upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            environ[key] = value.strip()
+        path, query = (target.split('?', 1) + [''])[:2]
+        environ.update({
+            'REQUEST_METHOD': method.upper(),
+            'PATH_INFO': urllib.unquote(path),
+            'QUERY_STRING': query,
+            'SERVER_PROTOCOL': protocol,
+        })
+
+        # Bodies of unknown length would have to be read by Django
+        if 'HTTP_TRANSFER_ENCODING' in environ:
+            return self.error(411)
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return self.error(400)
+        if length < 0:
+            return self.error(400)
+        if length > self.receiver.max_body:
+            return self.error(413)
+        if environ.get('HTTP_EXPECT', '').lower() == '100-continue':
+            self.push('HTTP/1.1 100 Continue\r\n\r\n')
+
+        self.environ = environ
+        self.body = tempfile.TemporaryFile(dir=self.receiver.spool)
+        if length:
+            self.set_terminator(length)
+        else:
+            self.ready()
+
+    def ready(self):
+        self.handed = True
+        self.body.seek(0)
+        self.environ['wsgi.input'] = self.body
+        self.receiver.requests.put(self)
+
+    def respond(self, status, headers, body):
+        """ Write the response, from the thread of the loop """
+        if not self.connected:
+            return self.close()
+        names = set(name.lower() for name, value in headers)
+        if 'content-length' not in names:
+            headers = headers + [('Content-Length', str(len(body)))]
+        self.push(''.join(
+            ['HTTP/1.1 %s\r\n' % (status,)] +
+            ['%s: %s\r\n' % (name, value) for name, value in headers] +
+            ['Connection: close\r\n\r\n', body]))
+        self.close_when_done()
+
+    def error(self, code):
+        self.handed = True
+        self.respond(status_line(code), [('Content-Type', 'text/plain')],
+                     status_line(code))
+
+    def handle_error(self):
+        logger.exception('Error on the connection of %s', self.address[0])
+        self.close()
+
+    def close(self):
+        asynchat.async_chat.close(self)
+        if self.body is not None and not self.handed:
+            self.body.close()
+
+class Receiver(asyncore.dispatcher):
+    """ Listens on ``host`` and ``port``, and serves the requests with the
+    WSGI application ``app``, the Django handler by default """
+
+    def __init__(self, host, port, app=None, threads=None, max_body=None,
+                 timeout=None, spool=None):
+        self.map = {}
+        asyncore.dispatcher.__init__(self, map=self.map)
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.listen(128)
+        self.address = self.socket.getsockname()
+        if app is None:
+            from django.core.handlers.wsgi import WSGIHandler
+            app = WSGIHandler()
+        self.app = app
+        self.threads = threads or conf.RECEIVER_THREADS
+        self.max_body = max_body or conf.RECEIVER_MAX_BODY
+        self.timeout = timeout or conf.RECEIVER_TIMEOUT
+        self.spool = spool or conf.RECEIVER_SPOOL_ROOT
+        self.requests = Queue.Queue()
+        self.responses = Queue.Queue()
+        self.waker = Waker(self.map)
+        self.running = False
+
+    def environ(self, address):
+        return {
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': self.address[0],
+            'SERVER_PORT': str(self.address[1]),
+            'REMOTE_ADDR': address[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            Channel(self, *pair)
+
+    def call(self, environ):
+        """ The status, headers and body of the response of the application
+        to ``environ`` """
+        response = []
+        body = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [status, headers]
+            return body.append
+
+        result = self.app(environ, start_response)
+        try:
+            for data in result:
+                body.append(data)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response[0], list(response[1]), ''.join(body)
+
+    def work(self):
+        while True:
+            channel = self.requests.get()
+            if channel is None:
+                return
+            try:
+                result = self.call(channel.environ)
+            except Exception:
+                logger.exception('Error handling %s %s',
+                                 channel.environ['REQUEST_METHOD'],
+                                 channel.environ['PATH_INFO'])
+                result = (status_line(500), [('Content-Type', 'text/plain')],
+                          status_line(500))
+            finally:
+                channel.body.close()
+            self.responses.put((channel, result))
+            self.waker.wake()
+
+    def serve(self):
+        """ Serve requests until ``stop`` is called """
+        workers = [threading.Thread(target=self.work,
+                                    name='djangopypi-receiver')
+                   for i in range(self.threads)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        self.running = True
+        try:
+            while self.running:
+                asyncore.loop(timeout=1, map=self.map, count=1)
+                while True:
+                    try:
+                        channel, result = self.responses.get_nowait()
+                    except Queue.Empty:
+                        break
+                    channel.respond(*result)
+                self.expire()
+        finally:
+            for worker in workers:
+                self.requests.put(None)
+            for worker in workers:
+                worker.join()
+            for dispatcher in self.map.values():
+                dispatcher.close()
+
+    def expire(self):
+        """ Close the connections that sent nothing for ``timeout`` seconds
+        while their request was being read """
+        limit = time.time() - self.timeout
+        for channel in self.map.values():
+            if isinstance(channel, Channel) and not channel.handed and \
+               channel.active < limit:
+                channel.close()
+
+    def stop(self):
+        """ Stop serving, from any thread """
+        self.running = False
+        self.waker.wake()
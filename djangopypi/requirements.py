@@ -0,0 +1,28 @@
+""" Parsing of the requirement strings found in package metadata, such as
+``Requires-Dist: foo[bar] (>=1.0); python_version < "3"``. """
+import re
+
+REQUIREMENT_RE = re.compile(r'''
+    ^\s*(?P<name>[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)
+    \s*(?:\[(?P<extras>[^\]]*)\])?
+    \s*(?P<specifier>[^;]*?)
+    \s*(?:;\s*(?P<marker>.*?))?\s*$
+''', re.VERBOSE)
+
+def normalize_name(name):
+    """ The PEP 503 normalized form of a project name """
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+def parse_requirement(text):
+    """ Split a requirement into ``(name, specifier, marker)``, with the name
+    normalized and the parentheses of the older metadata format removed.
+    Returns None for strings that are not requirements. """
+    match = REQUIREMENT_RE.match(text)
+    if not match:
+        return None
+    specifier = match.group('specifier').strip()
+    if specifier.startswith('(') and specifier.endswith(')'):
+        specifier = specifier[1:-1].strip()
+    specifier = re.sub(r'\s+', '', specifier)
+    return (normalize_name(match.group('name')), specifier,
+            (match.group('marker') or '').strip())
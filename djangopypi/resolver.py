@@ -0,0 +1,207 @@
+""" Resolution of a list of requirements to pinned releases and their files,
+so that a client can download exactly what it needs from one response instead
+of walking the simple index package by package.
+
+Each process keeps an index of the releases, files and dependencies of the
+packages it has resolved, with their versions parsed once. A package is only
+reloaded when the generation of its simple page moves on (see
+``djangopypi.simple``), so the index is exactly as fresh as the simple pages.
+
+Resolution is greedy: every package gets the highest version that satisfies
+all the requirements on it from the request and from the other pinned
+releases, preferring final releases, until the pins no longer change.
+Releases without files, registered but never uploaded, are never pinned. It does
+not backtrack, so it can report a conflict that pip would get around by
+trying older versions of the packages causing it. Requirements that only
+apply to an extra are not followed, and environment markers are ignored. """
+import os
+import threading
+
+from djangopypi import simple, versions
+from djangopypi.dependencies import is_optional
+from djangopypi.models import Package, Release, Distribution, Dependency
+from djangopypi.requirements import normalize_name, parse_requirement
+
+MAX_ROUNDS = 100
+
+class ResolutionError(Exception):
+    pass
+
+class InvalidRequirement(ResolutionError):
+    pass
+
+class Candidate(object):
+    """ A release as seen by the resolver """
+    __slots__ = ('version', 'files', 'requirements')
+
+    def __init__(self, version):
+        self.version = version
+        self.files = []
+        self.requirements = []
+
+class VersionIndex(object):
+    """ The releases of each package, highest version first, loaded in bulk
+    and kept until the package changes """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = (None, {})
+        self._packages = {}
+
+    def package_name(self, name):
+        """ The package named ``name`` once normalized, or None """
+        generation = simple.generation(None)
+        if self._names[0] != generation:
+            names = dict((normalize_name(n), n) for n in
+                         Package.objects.values_list('name', flat=True))
+            self._names = (generation, names)
+        return self._names[1].get(name)
+
+    def candidates(self, packages):
+        """ The ``Candidate`` list of each of ``packages``, as a dict """
+        generations = simple.generations(packages)
+        with self._lock:
+            stale = [name for name in packages if
+                     self._packages.get(name, (None,))[0] != generations[name]]
+            if stale:
+                for name, candidates in self._load(stale).iteritems():
+                    self._packages[name] = (generations[name], candidates)
+            return dict((name, self._packages[name][1]) for name in packages)
+
+    def _load(self, packages):
+        by_package = dict((name, []) for name in packages)
+        by_pk = {}
+        for pk, package, version in Release.objects \
+                .filter(package__in=packages) \
+                .values_list('pk', 'package', 'version'):
+            candidate = by_pk[pk] = Candidate(versions.parse(version))
+            by_package[package].append(candidate)
+
+        storage = Distribution._meta.get_field('content').storage
+        for release, path, md5_digest in Distribution.objects \
+                .filter(release__package__in=packages).order_by('id') \
+                .values_list('release', 'content', 'md5_digest'):
+            by_pk[release].files.append((os.path.basename(path),
+                                         storage.url(path), md5_digest))
+
+        for release, name, specifier, marker in Dependency.objects \
+                .filter(release__package__in=packages) \
+                .values_list('release', 'name', 'specifier', 'marker'):
+            if not is_optional(marker):
+                by_pk[release].requirements.append((name, specifier))
+
+        for candidates in by_package.itervalues():
+            candidates.sort(key=lambda c: c.version, reverse=True)
+        return by_package
+
+INDEX = VersionIndex()
+
+def parse_requirements(text):
+    """ ``(name, specifier)`` for each line of a requirements list, skipping
+    blank lines and comments """
+    requirements = []
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        parsed = parse_requirement(line)
+        if parsed is None:
+            raise InvalidRequirement('Invalid requirement: %s' % (line,))
+        try:
+            versions.parse_specifier(parsed[1])
+        except versions.InvalidSpecifier:
+            raise InvalidRequirement('Invalid specifier: %s' % (line,))
+        requirements.append(parsed[:2])
+    return requirements
+
+def _satisfies(version, specifiers, prereleases):
+    for specifier in specifiers:
+        try:
+            if not versions.matches(specifier, version, prereleases):
+                return False
+        except versions.InvalidSpecifier:
+            return False
+    return True
+
+def best_candidate(candidates, specifiers):
+    """ The highest of ``candidates`` with files that satisfies
+    ``specifiers``, a final release when there is one, or None """
+    for prereleases in (False, True):
+        for candidate in candidates:
+            if candidate.files and \
+               _satisfies(candidate.version, specifiers, prereleases):
+                return candidate
+    return None
+
+def _describe(constraints):
+    return ', '.join('%s (from %s)' % (specifier or 'any version',
+                                       source or 'the request')
+                     for specifier, source in constraints)
+
+def resolve(requirements, allowed=None, index=None):
+    """ Pin the ``(name, specifier)`` requirements and everything they
+    depend on. Returns ``(package, version, files)`` for every package, sorted
+    by name, with ``files`` a list of ``(filename, url, md5_digest)``.
+
+    Only the packages in ``allowed`` are considered when it is given. Raises
+    ``ResolutionError`` when a package is missing or no version of it
+    satisfies all the requirements on it. """
+    if index is None:
+        index = INDEX
+    constraints = {}
+    for name, specifier in requirements:
+        constraints.setdefault(name, []).append((specifier, None))
+    pinned = {}
+    packages = {}
+    pending = set(constraints)
+    budget = MAX_ROUNDS * (len(pending) + 1)
+
+    # Packages whose constraints changed are picked again a level at a time,
+    # so that the candidates of a whole level are loaded together.
+    while pending:
+        for name in pending:
+            if name not in packages and constraints.get(name):
+                package = index.package_name(name)
+                if package is None or (allowed is not None and
+                                       package not in allowed):
+                    raise ResolutionError(
+                        'No package named %s, required by %s' % (
+                            name, _describe(constraints[name])))
+                packages[name] = package
+        candidates = index.candidates([packages[name] for name in pending
+                                       if constraints.get(name)])
+
+        changed = set()
+        for name in pending:
+            if constraints.get(name):
+                package = packages[name]
+                candidate = best_candidate(
+                    candidates[package],
+                    [specifier for specifier, source in constraints[name]])
+                if candidate is None:
+                    raise ResolutionError('No version of %s matches %s' % (
+                        package, _describe(constraints[name])))
+            else:
+                candidate = None
+            previous = pinned.get(name)
+            if candidate is previous:
+                continue
+
+            budget -= 1
+            if budget < 0:
+                raise ResolutionError('The requirements did not settle')
+            if previous is not None:
+                for dependency, specifier in previous.requirements:
+                    constraints[dependency].remove((specifier, name))
+                    changed.add(dependency)
+                del pinned[name]
+            if candidate is not None:
+                pinned[name] = candidate
+                for dependency, specifier in candidate.requirements:
+                    constraints.setdefault(dependency, []).append(
+                        (specifier, name))
+                    changed.add(dependency)
+        pending = changed
+
+    return [(packages[name], pinned[name].version.string, pinned[name].files)
+            for name in sorted(pinned, key=lambda name: packages[name])]
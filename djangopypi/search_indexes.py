@@ -13,8 +13,7 @@ if 'haystack' in settings.INSTALLED_APPS:
         text = CharField(document=True, use_template=True, null=True, stored=False,
                          template_name='djangopypi/haystack/package_text.txt')
         author = MultiValueField(stored=False, null=True)
-        classifier = MultiValueField(stored=False, null=True,
-                                     model_attr='latest__classifiers')
+        classifier = MultiValueField(stored=False, null=True)
         summary = CharField(stored=False, null=True,
                             model_attr='latest__summary')
         description = CharField(stored=False, null=True,
@@ -34,5 +33,10 @@ if 'haystack' in settings.INSTALLED_APPS:
                     if info.get(field):
                         output.append(info.get(field))
             return output
+
+        def prepare_classifier(self, obj):
+            if obj.latest:
+                return obj.latest.package_info.getlist('classifier')
+            return []
     
     site.register(Package, PackageSearchIndex)
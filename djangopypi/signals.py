@@ -9,9 +9,10 @@ def autohide_new_release_handler(sender, instance, created, *args, **kwargs):
     if not created or not instance.package.auto_hide:
         return
     
-    for release in instance.package.releases.exclude(pk=instance.pk).filter(hidden=False):
-        release.hidden = True
-        release.save()
+    # A single update whatever the number of releases; the caches of the
+    # package are dropped for the new release anyway
+    instance.package.releases.exclude(pk=instance.pk).filter(hidden=False) \
+                             .update(hidden=True)
     
     if instance.hidden:
         instance.hidden = False
@@ -0,0 +1,214 @@
+""" The simple repository API used by installers (PEP 503), and its JSON
+serialization (PEP 691).
+
+The JSON bodies are written straight from ``values_list`` rows rather than
+model instances and templates, since the simple pages are by far the most
+requested ones and only need a handful of columns.
+
+Rendered pages are cached precompressed, gzip always and brotli when the
+``brotli`` module is installed, so compression is paid once per change rather
+than once per request. Cache keys carry a generation number that the signal
+receivers in ``djangopypi.models`` bump when packages, releases or
+distributions change, once the transaction changing them has committed (see
+``djangopypi.deferred``): a page rebuilt meanwhile from the previous rows is
+left under the previous generation. """
+import hashlib
+import time
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import simplejson as json
+
+from djangopypi import conf, singleflight
+from djangopypi.http import conditional_response
+from djangopypi.models import Distribution
+
+JSON_CONTENT_TYPE = 'application/vnd.pypi.simple.v1+json'
+HTML_CONTENT_TYPE = 'text/html'
+
+API_VERSION = '1.0'
+
+_HTML_TYPES = ('application/vnd.pypi.simple.v1+html',
+               'application/vnd.pypi.simple.latest+html', 'text/html', '*/*')
+_JSON_TYPES = (JSON_CONTENT_TYPE, 'application/vnd.pypi.simple.latest+json')
+
+def negotiate(request):
+    """ Pick the content type to answer a simple API request with, from the
+    Accept header. HTML wins ties and is the default, as older installers do
+    not send an Accept header at all. """
+    html_q = json_q = 0.0
+    accept = request.META.get('HTTP_ACCEPT', '')
+    if not accept.strip():
+        return HTML_CONTENT_TYPE
+
+    for item in accept.split(','):
+        params = item.split(';')
+        media_type = params[0].strip().lower()
+        q = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type in _JSON_TYPES:
+            json_q = max(json_q, q)
+        elif media_type in _HTML_TYPES:
+            html_q = max(html_q, q)
+
+    if json_q > html_q:
+        return JSON_CONTENT_TYPE
+    return HTML_CONTENT_TYPE
+
+def _dumps(data):
+    return json.dumps(data, separators=(',', ':'))
+
+def index_json(names):
+    """ The JSON project list for an iterable of package names """
+    return _dumps({
+        'meta': {'api-version': API_VERSION},
+        'projects': [{'name': name} for name in names],
+    })
+
+def distribution_rows(package):
+    """ ``(path, filename, md5_digest, requires_python, metadata_sha256)``
+    for every file of a package """
+    return Distribution.objects.filter(release__package=package) \
+                               .order_by('-release__sort_key', 'id') \
+                               .values_list('content', 'filename',
+                                            'md5_digest',
+                                            'release__requires_python',
+                                            'metadata_sha256')
+
+def detail_json(package_name, rows):
+    """ The JSON file list of a package, from ``distribution_rows`` """
+    storage = Distribution._meta.get_field('content').storage
+    files = []
+    for path, filename, md5_digest, requires_python, metadata_sha256 in rows:
+        entry = {'filename': filename,
+                 'url': storage.url(path),
+                 'hashes': {}}
+        if md5_digest:
+            entry['hashes']['md5'] = md5_digest
+        if requires_python:
+            entry['requires-python'] = requires_python
+        if metadata_sha256:
+            # The key was renamed by PEP 714, older installers know the first
+            entry['dist-info-metadata'] = entry['core-metadata'] = \
+                {'sha256': metadata_sha256}
+        files.append(entry)
+
+    return _dumps({
+        'meta': {'api-version': API_VERSION},
+        'name': package_name,
+        'files': files,
+    })
+
+def _generation_key(name):
+    return 'djangopypi:simple:generation:%s' % (name,)
+
+def generation(name):
+    """ The current generation of the index (``name`` is None) or of a
+    package's page """
+    key = _generation_key(name or ':index')
+    value = cache.get(key)
+    if value is None:
+        # Start from the clock so an evicted counter never goes back to a
+        # generation that still has pages cached.
+        cache.add(key, int(time.time() * 1000), conf.SIMPLE_CACHE_TIMEOUT)
+        value = cache.get(key)
+    return value
+
+def generations(names):
+    """ The generations of the pages of several packages, as a dict, fetched
+    from the cache in one go """
+    found = cache.get_many([_generation_key(name) for name in names])
+    result = {}
+    for name in names:
+        value = found.get(_generation_key(name))
+        result[name] = generation(name) if value is None else value
+    return result
+
+def invalidate(name=None):
+    """ Bump the generation of the index (``name`` is None) or of the page of
+    a package """
+    key = _generation_key(name or ':index')
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+def index_key(scope, content_type, template_name):
+    """ Users in the same permission scope (see ``djangopypi.permissions``)
+    share cached index pages """
+    return 'djangopypi:simple:index:%s:%s:%s:%s' % (
+        generation(None), scope, content_type, template_name)
+
+def detail_key(package_name, content_type, template_name):
+    return 'djangopypi:simple:%s:%s:%s:%s' % (
+        package_name, generation(package_name), content_type, template_name)
+
+def compress(content):
+    """ Return the cached form of a page: its ETag and compressed bodies """
+    if isinstance(content, unicode):
+        content = content.encode(settings.DEFAULT_CHARSET)
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    artifact = {
+        'etag': hashlib.md5(content).hexdigest(),
+        'gzip': compressor.compress(content) + compressor.flush(),
+    }
+    if brotli is not None:
+        artifact['br'] = brotli.compress(content)
+    return artifact
+
+def accepted_encoding(request, artifact):
+    """ The best encoding of ``artifact`` the client accepts """
+    accepted = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        params = item.split(';')
+        q = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[params[0].strip().lower()] = q
+
+    for encoding in ('br', 'gzip'):
+        if encoding in artifact and accepted.get(encoding, 0) > 0:
+            return encoding
+    return 'identity'
+
+def serve(request, key, build, content_type):
+    """ Serve the page cached under ``key``, calling ``build`` to render it
+    when it is missing """
+    artifact = singleflight.cached(key, lambda: compress(build()),
+                                   conf.SIMPLE_CACHE_TIMEOUT)
+
+    encoding = accepted_encoding(request, artifact)
+    if encoding == 'identity':
+        content = zlib.decompress(artifact['gzip'], 16 + zlib.MAX_WBITS)
+        etag = '"%s"' % artifact['etag']
+    else:
+        content = artifact[encoding]
+        etag = '"%s-%s"' % (artifact['etag'], encoding)
+
+    if content_type == HTML_CONTENT_TYPE:
+        content_type = '%s; charset=%s' % (content_type,
+                                           settings.DEFAULT_CHARSET)
+    response = conditional_response(request, etag, content, content_type)
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    if response.status_code == 200:
+        response['Content-Length'] = str(len(content))
+    response['Vary'] = 'Accept, Accept-Encoding'
+    return response
@@ -0,0 +1,120 @@
+""" Coalescing of concurrent cache misses.
+
+When a popular package changes, every worker misses the cache for it at the
+same moment. ``cached`` makes sure only one of them rebuilds the value: threads
+of the same process queue on a per-key lock, and workers in other processes
+see a short lease in the shared cache and wait for the value to appear instead
+of building it themselves. A worker that waits longer than ``COALESCE_WAIT``
+seconds gives up and builds the value anyway, so a crashed leader can never
+block a page for longer than that.
+
+Values are only cached when every worker shares the cache, see
+``shared_cache``: a worker could not see the others drop the values they
+changed from a cache of its own. """
+from __future__ import with_statement
+
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from djangopypi import conf, metrics
+
+POLL_INTERVAL = 0.05
+
+# The lock of each key held or waited for, with the number of threads using
+# it, dropped by the last one
+_locks = {}
+_locks_guard = threading.Lock()
+
+@contextmanager
+def _local_lock(key):
+    # Builds take the locks of other keys, e.g. the permissions of a page, so
+    # keys sharing a lock could deadlock
+    with _locks_guard:
+        entry = _locks.get(key)
+        if entry is None:
+            entry = _locks[key] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[key]
+
+def shared_cache():
+    """ Whether every worker uses the same cache, so that dropping an entry
+    reaches all of them: ``SHARED_CACHE``, or when it is None, whether the
+    cache backend is not a per-process one """
+    if conf.SHARED_CACHE is not None:
+        return conf.SHARED_CACHE
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+def _lease_key(key):
+    return '%s:lease' % (key,)
+
+def _acquire_lease(key, ready=None):
+    """ Wait for the lease on ``key``. Returns True when it was acquired, False
+    when ``ready`` reported the work as done or the wait timed out. """
+    deadline = time.time() + conf.COALESCE_WAIT
+    while not cache.add(_lease_key(key), 1, conf.COALESCE_LEASE):
+        if ready is not None and ready():
+            return False
+        if time.time() > deadline:
+            return False
+        time.sleep(POLL_INTERVAL)
+    return True
+
+@contextmanager
+def lock(key):
+    """ Hold ``key`` against other threads of this process and, for up to
+    ``COALESCE_WAIT`` seconds, against other workers sharing the cache """
+    with _local_lock(key):
+        leased = _acquire_lease(key)
+        try:
+            yield
+        finally:
+            if leased:
+                cache.delete(_lease_key(key))
+
+def cached(key, build, timeout):
+    """ Return the value cached under ``key``, calling ``build`` to compute it
+    when it is missing. Concurrent callers missing the same key wait for the
+    one building it rather than building it too. ``build`` must not return
+    None. Without a shared cache, ``build`` is called every time. """
+    if not shared_cache():
+        return build()
+    value = cache.get(key)
+    metrics.cache_access(key, value is not None)
+    if value is not None:
+        return value
+
+    with _local_lock(key):
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+        found = []
+        def ready():
+            found[:] = [cache.get(key)]
+            return found[0] is not None
+
+        leased = _acquire_lease(key, ready)
+        try:
+            if found and found[0] is not None:
+                return found[0]
+            # The previous holder of the lease may have just stored it
+            value = cache.get(key)
+            if value is None:
+                value = build()
+                cache.set(key, value, timeout)
+            return value
+        finally:
+            if leased:
+                cache.delete(_lease_key(key))
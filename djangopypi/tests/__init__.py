@@ -5,9 +5,30 @@ import StringIO
 from djangopypi.models import Package, Release
 from django.test.client import Client
 from django.core.urlresolvers import reverse
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, Group
 from django.http import HttpRequest
 
+from djangopypi.tests.documents import *
+from djangopypi.tests.simple import *
+from djangopypi.tests.export import *
+from djangopypi.tests.proxy import *
+from djangopypi.tests.singleflight import *
+from djangopypi.tests.metadata import *
+from djangopypi.tests.classifiers import *
+from djangopypi.tests.versions import *
+from djangopypi.tests.dependencies import *
+from djangopypi.tests.resolver import *
+from djangopypi.tests.wheels import *
+from djangopypi.tests.coremetadata import *
+from djangopypi.tests.archives import *
+from djangopypi.tests.benchmark import *
+from djangopypi.tests.downloads import *
+from djangopypi.tests.events import *
+from djangopypi.tests.upload import *
+from djangopypi.tests.metrics import *
+from djangopypi.tests.profiling import *
+from djangopypi.tests.receiver import *
+
 def create_post_data(action):
     data = {
             ":action": action,
@@ -103,15 +124,21 @@ class TestSearch(unittest.TestCase):
     def setUp(self):
         self.dummy_user = User.objects.create(username='krill', password='12345',
                                  email='krill@opera.com')
+        self.group = Group.objects.create(name='krill')
+        self.dummy_user.groups.add(self.group)
         self.pkg = Package.objects.create(name='foo')
-        self.pkg.owners.add(self.dummy_user)
+        self.pkg.owners.add(self.group)
+        self.release = Release.objects.create(package=self.pkg, version='1.0',
+            package_info={'summary': [create_post_data('submit')['summary']]})
     
     def tearDown(self):
+        self.release.delete()
         self.pkg.delete()
+        self.group.delete()
         self.dummy_user.delete()
     
     def test_search_for_package(self):
-        response = client.post(reverse('djangopypi-search'), {'query': 'foo'})
+        response = client.post(reverse('djangopypi-search'), {'q': 'foo'})
         self.assertTrue("The quick brown fox jumps over the lazy dog." in response.content)
         
 class TestSimpleView(unittest.TestCase):
@@ -188,13 +215,16 @@ class TestXmlRpc(unittest.TestCase):
         self.dummy_file = ContentFile("gibberish")
         self.dummy_user = User.objects.create(username='bobby', password='tables',
                                  email='bobby@tables.com')
+        self.group = Group.objects.create(name='bobby')
+        self.dummy_user.groups.add(self.group)
         self.pkg = Package.objects.create(name='foo')
-        self.pkg.owners.add(self.dummy_user)
+        self.pkg.owners.add(self.group)
         self.release = Release.objects.create(package=self.pkg, version="1.0")
     
     def tearDown(self):
         self.release.delete()
         self.pkg.delete()
+        self.group.delete()
         self.dummy_user.delete()
     
     def test_list_package(self):
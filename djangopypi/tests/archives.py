@@ -0,0 +1,103 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from StringIO import StringIO
+
+from django.test import TestCase
+
+from djangopypi import archives
+
+PKG_INFO = 'Metadata-Version: 1.1\nName: foo\nVersion: 1.0\n' \
+           'Requires: bar\n'
+
+def zip_archive(members):
+    content = StringIO()
+    archive = zipfile.ZipFile(content, 'w')
+    for name, data in members:
+        archive.writestr(name, data)
+    archive.close()
+    return content.getvalue()
+
+def tar_archive(members):
+    content = StringIO()
+    archive = tarfile.open(fileobj=content, mode='w:gz')
+    for name, data in members:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        archive.addfile(info, StringIO(data))
+    archive.close()
+    return content.getvalue()
+
+class TestReadMetadata(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, filename, content):
+        path = os.path.join(self.directory, filename)
+        f = open(path, 'wb')
+        f.write(content)
+        f.close()
+        return path
+
+    def test_zip_sdist(self):
+        content = zip_archive([('foo-1.0/foo.egg-info/PKG-INFO', 'nested'),
+                               ('foo-1.0/PKG-INFO', PKG_INFO)])
+        self.assertEqual(archives.read_metadata(StringIO(content),
+                                                'foo-1.0.zip'), PKG_INFO)
+        # Memory-mapped when read from disk
+        self.assertEqual(archives.read_file(self.write('foo-1.0.zip',
+                                                       content)), PKG_INFO)
+
+    def test_egg_and_wheel(self):
+        egg = zip_archive([('foo/__init__.py', ''),
+                           ('EGG-INFO/PKG-INFO', PKG_INFO)])
+        self.assertEqual(archives.read_metadata(StringIO(egg),
+                                                'foo-1.0-py2.7.egg'), PKG_INFO)
+        wheel = zip_archive([('foo/PKG-INFO', 'not this one'),
+                             ('foo-1.0.dist-info/METADATA', PKG_INFO)])
+        self.assertEqual(archives.read_metadata(
+            StringIO(wheel), 'foo-1.0-py2-none-any.whl'), PKG_INFO)
+
+    def test_tarball_prefers_top_level(self):
+        content = tar_archive([('foo-1.0/foo.egg-info/PKG-INFO',
+                                PKG_INFO.replace('1.0', '0.9')),
+                               ('foo-1.0/PKG-INFO', PKG_INFO)])
+        self.assertEqual(archives.read_metadata(StringIO(content),
+                                                'foo-1.0.tar.gz'), PKG_INFO)
+
+        content = tar_archive([('foo-1.0/foo.egg-info/PKG-INFO', PKG_INFO)])
+        self.assertEqual(archives.read_metadata(StringIO(content),
+                                                'foo-1.0.tar.gz'), PKG_INFO)
+
+    def test_tarball_stops_at_pkg_info(self):
+        content = tar_archive([('foo-1.0/PKG-INFO', PKG_INFO),
+                               ('foo-1.0/data', os.urandom(100000))])
+        # Whatever comes after PKG-INFO is never decompressed
+        truncated = content[:len(content) // 2] + 'garbage'
+        self.assertEqual(archives.read_metadata(StringIO(truncated),
+                                                'foo-1.0.tar.gz'), PKG_INFO)
+
+    def test_missing(self):
+        content = tar_archive([('foo-1.0/setup.py', '')])
+        self.assertEqual(archives.read_metadata(StringIO(content),
+                                                'foo-1.0.tar.gz'), None)
+        self.assertEqual(archives.read_metadata(StringIO('gibberish'),
+                                                'foo-1.0.zip'), None)
+        self.assertEqual(archives.read_metadata(StringIO(''),
+                                                'foo-1.0.exe'), None)
+
+    def test_pkginfo_classes(self):
+        path = self.write('foo-1.0.tar.gz',
+                          tar_archive([('foo-1.0/PKG-INFO', PKG_INFO)]))
+        dist = archives.get_metadata(path)
+        self.assertTrue(isinstance(dist, archives.SDist))
+        self.assertEqual((dist.name, dist.version, dist.requires),
+                         ('foo', '1.0', ['bar']))
+
+        path = self.write('bar-1.0.tar.gz', tar_archive([]))
+        self.assertEqual(archives.get_metadata(path), None)
+        self.assertRaises(ValueError, archives.SDist, path)
@@ -0,0 +1,50 @@
+import copy
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from djangopypi import benchmark
+from djangopypi.models import Package, Release
+
+class TestBenchmark(TestCase):
+
+    def test_run_and_compare(self):
+        with benchmark.isolated_storage():
+            dataset = benchmark.seed(packages=20, max_releases=5, groups=3)
+            report = benchmark.run(dataset, repeat=1)
+        self.assertEqual((dataset['packages'], dataset['max_releases']),
+                         (20, 5))
+        self.assertEqual(sorted(report['scenarios']),
+                         sorted(scenario[0]
+                                for scenario in benchmark.SCENARIOS))
+        for name, result in report['scenarios'].iteritems():
+            self.assertEqual(result['status'], 200, name)
+        self.assertEqual(benchmark.compare(report, report), [])
+
+        slower = copy.deepcopy(report)
+        slower['scenarios']['search']['queries'] += 1
+        slower['scenarios']['rss']['min_time_ms'] += 100
+        self.assertEqual(len(benchmark.compare(slower, report)), 2)
+        self.assertEqual(benchmark.compare(report, slower), [])
+
+    def test_releases(self):
+        dataset = benchmark.seed_releases(count=25, per_package=10)
+        self.assertEqual(Release.objects.count(), 25)
+        self.assertEqual(Package.objects.count(), 3)
+        report = benchmark.run_releases(dataset, repeat=1)
+        self.assertEqual(sorted(report['loads']), sorted(
+            name for name, read in benchmark.RELEASE_LOADS))
+
+    def test_archives(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        corpus = benchmark.archive_corpus(directory, count=2,
+                                          member_size=1024, modules=3)
+        self.assertEqual(len(corpus), 2 * len(benchmark.ARCHIVE_KINDS))
+        report = benchmark.run_archives(corpus, repeat=1)
+        self.assertEqual(sorted(report['readers']), ['archives', 'pkginfo'])
+        for times in report['readers'].values():
+            self.assertEqual(sorted(times), sorted(
+                ['total'] + [kind for kind, suffix in
+                             benchmark.ARCHIVE_KINDS]))
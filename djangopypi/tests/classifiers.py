@@ -0,0 +1,89 @@
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from djangopypi import conf
+from djangopypi.models import Release, Classifier, sync_classifiers
+from djangopypi.tests.utils import create_user, create_release
+
+DJANGO = 'Framework :: Django'
+PYTHON = 'Programming Language :: Python'
+
+class TestClassifierBrowser(TestCase):
+
+    def setUp(self):
+        # The cached values are what is tested
+        self.addCleanup(setattr, conf, 'SHARED_CACHE', conf.SHARED_CACHE)
+        conf.SHARED_CACHE = True
+        self.group = Group.objects.create(name='staff')
+        self.user = create_user('reader')
+        self.client.login(username='reader', password='secret')
+        create_release('foo', '1.0', {'classifier': [DJANGO, PYTHON]})
+        create_release('foo', '1.1', {'classifier': [DJANGO]})
+        create_release('bar', '1.0', {'classifier': [PYTHON]})
+        create_release('secret', '1.0', {'classifier': [DJANGO]},
+                       groups=[self.group])
+
+    def test_counts(self):
+        response = self.client.get(reverse('djangopypi-classifier-index'))
+        self.assertEqual(response.status_code, 200)
+        # foo 1.0 was hidden by the release of foo 1.1
+        self.assertEqual([(c['name'], c['packages'])
+                          for c in response.context['classifier_list']],
+                         [(DJANGO, 1), (PYTHON, 1)])
+
+    def test_counts_cached(self):
+        url = reverse('djangopypi-classifier-index')
+        self.client.get(url)
+        # Only the session and the user remain, the permission scope of the
+        # user is cached too
+        self.assertNumQueries(2, self.client.get, url)
+
+        self.user.groups.add(self.group)
+        response = self.client.get(url)
+        self.assertEqual(response.context['classifier_list'][0]['packages'],
+                         2)
+
+        create_release('bar', '1.1', {'classifier': [DJANGO]})
+        response = self.client.get(url)
+        self.assertEqual(response.context['classifier_list'][0]['packages'],
+                         3)
+
+    def test_details(self):
+        response = self.client.get(reverse('djangopypi-classifier',
+                                           kwargs={'classifier': DJANGO}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p.name for p in response.context['package_list']],
+                         ['foo'])
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(reverse('djangopypi-classifier-index'))
+        self.assertEqual(response.status_code, 302)
+
+class TestClassifierSync(TestCase):
+
+    def test_bulk_sync(self):
+        releases = [create_release('pkg%d' % i, '1.0') for i in range(10)]
+        for i, release in enumerate(releases):
+            release.package_info.setlist('classifier',
+                                         [DJANGO, 'Topic :: Thing %d' % i])
+        # The current rows, the known classifiers and the two inserts
+        self.assertNumQueries(4, sync_classifiers, releases)
+        self.assertEqual(Classifier.objects.get(name=DJANGO).releases.count(),
+                         10)
+        topics = Classifier.objects.filter(name__startswith='Topic :: Thing')
+        self.assertEqual(sorted(topics.values_list('name', flat=True)),
+                         sorted('Topic :: Thing %d' % i for i in range(10)))
+        for topic in topics:
+            self.assertEqual([r.package_id for r in topic.releases.all()],
+                             ['pkg%s' % topic.name.split()[-1]])
+        self.assertFalse(sync_classifiers(releases))
+
+    def test_backfill(self):
+        release = create_release('foo', '1.0', {'classifier': [DJANGO]})
+        release.classifiers.clear()
+        call_command('backfill_classifiers')
+        self.assertEqual([c.name for c in release.classifiers.all()],
+                         [DJANGO])
@@ -0,0 +1,118 @@
+import os
+import tarfile
+import zipfile
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.template.loader import render_to_string
+from django.test import TestCase
+from django.utils import simplejson as json
+
+from djangopypi import coremetadata, simple
+from djangopypi.models import Distribution
+from djangopypi.tests.utils import create_release, create_distribution
+
+METADATA = 'Metadata-Version: %s\nName: foo\nVersion: 1.0\n' \
+           'Requires-Dist: bar (>=1.0)\n'
+
+def wheel(metadata):
+    content = StringIO()
+    archive = zipfile.ZipFile(content, 'w')
+    archive.writestr('foo/__init__.py', '')
+    archive.writestr('foo-1.0.dist-info/METADATA', metadata)
+    archive.close()
+    return content.getvalue()
+
+def sdist(metadata):
+    content = StringIO()
+    archive = tarfile.open(fileobj=content, mode='w:gz')
+    for name, data in (('foo-1.0/PKG-INFO', metadata),
+                       ('foo-1.0/setup.py', '')):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        archive.addfile(info, StringIO(data))
+    archive.close()
+    return content.getvalue()
+
+class TestCoreMetadata(TestCase):
+
+    def setUp(self):
+        self.release = create_release('foo', '1.0')
+
+    def create(self, filename, content, **kwargs):
+        dist = create_distribution(self.release, filename, content, **kwargs)
+        self.addCleanup(dist.delete)
+        return dist
+
+    def test_wheel(self):
+        dist = self.create('foo-1.0-py2-none-any.whl', wheel(METADATA % '2.1'))
+        self.assertEqual(dist.metadata_sha256,
+                         coremetadata.digest(METADATA % '2.1'))
+
+        response = self.client.get(dist.content.url + '.metadata')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(open(coremetadata.metadata_path(dist.content.path))
+                         .read(), METADATA % '2.1')
+
+        files = json.loads(simple.detail_json(
+            'foo', simple.distribution_rows('foo')))['files']
+        self.assertEqual(files[0]['core-metadata'],
+                         {'sha256': dist.metadata_sha256})
+        html = render_to_string('djangopypi/package_detail_simple.html',
+                                {'package': self.release.package})
+        self.assertTrue('data-dist-info-metadata="sha256=%s"' %
+                        dist.metadata_sha256 in html)
+
+    def test_sdist(self):
+        # Only metadata 2.2 and later describes the built package reliably
+        legacy = self.create('foo-1.0.tar.gz', sdist(METADATA % '1.2'))
+        self.assertEqual(legacy.metadata_sha256, '')
+        self.assertEqual(self.client.get(legacy.content.url + '.metadata')
+                                    .status_code, 404)
+
+        static = self.create('foo-1.0.tgz', sdist(METADATA % '2.2'),
+                             filetype='bdist_dumb')
+        self.assertEqual(static.metadata_sha256,
+                         coremetadata.digest(METADATA % '2.2'))
+
+    def test_not_an_archive(self):
+        dist = self.create('foo-1.0-py2-none-any.whl', 'gibberish')
+        self.assertEqual(dist.metadata_sha256, '')
+
+    def test_read_once(self):
+        dist = self.create('foo-1.0.tar.gz', sdist(METADATA % '1.2'))
+        reads = []
+        read_distribution = coremetadata.read_distribution
+        self.addCleanup(setattr, coremetadata, 'read_distribution',
+                        read_distribution)
+        coremetadata.read_distribution = lambda dist: reads.append(dist) or \
+                                         read_distribution(dist)
+
+        # Saving a file that has no metadata does not read it again
+        dist.comment = 'changed'
+        dist.save()
+        Distribution.objects.get(pk=dist.pk).save()
+        self.assertEqual(reads, [])
+
+        replaced = Distribution.objects.get(pk=dist.pk)
+        replaced.content = 'f/foo-1.0-py2-none-any.whl'
+        replaced.save()
+        self.assertEqual(reads, [replaced])
+
+    def test_delete(self):
+        dist = create_distribution(self.release, 'foo-1.0-py2-none-any.whl',
+                                   wheel(METADATA % '2.1'))
+        path = coremetadata.metadata_path(dist.content.path)
+        self.assertTrue(os.path.exists(path))
+        dist.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_extract_command(self):
+        dist = self.create('foo-1.0-py2-none-any.whl', wheel(METADATA % '2.1'))
+        coremetadata.delete(dist)
+        Distribution.objects.update(metadata_sha256='')
+        call_command('extract_metadata')
+        self.assertEqual(Distribution.objects.get(pk=dist.pk).metadata_sha256,
+                         coremetadata.digest(METADATA % '2.1'))
+        self.assertTrue(os.path.exists(
+            coremetadata.metadata_path(dist.content.path)))
@@ -0,0 +1,73 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import simplejson as json
+
+from djangopypi import conf, dependencies
+from djangopypi.models import Release
+from djangopypi.tests.utils import create_release
+
+class TestDependencyIndex(TestCase):
+
+    def setUp(self):
+        # The cached values are what is tested
+        self.addCleanup(setattr, conf, 'SHARED_CACHE', conf.SHARED_CACHE)
+        conf.SHARED_CACHE = True
+        self.app = create_release('app', '1.0', {'requires_dist': [
+            'Lib-Foo (>=1.0,<2)', 'bar', 'docs-tool; extra == "docs"']})
+        self.old = create_release('old-app', '0.1', {'requires': ['lib_foo']})
+        create_release('lib-foo', '1.0', {'requires_dist': ['baz>=2']})
+        create_release('lib-foo', '1.5', {'requires_dist': ['baz>=3']})
+        create_release('lib-foo', '2.0', {'requires_dist': ['qux']})
+        create_release('lib-foo', '2.1b1')
+        create_release('baz', '3.0', {'requires_dist': ['app']})
+
+    def test_requires_indexed(self):
+        self.assertEqual(list(self.old.dependencies.values_list('name',
+                                                                flat=True)),
+                         ['lib-foo'])
+
+    def test_dependents(self):
+        self.assertEqual([row[:2] for row in dependencies.dependents('LIB.foo')],
+                         [('app', '1.0'), ('old-app', '0.1')])
+        self.assertEqual([row[:2] for row in
+                          dependencies.dependents('lib-foo', '2.0')],
+                         [('old-app', '0.1')])
+
+    def test_closure(self):
+        # Follows lib-foo 1.5, the highest version below 2, then baz 3.0
+        # which depends back on app. docs-tool is only needed for an extra.
+        self.assertEqual(dependencies.closure(self.app),
+                         [('bar', None), ('baz', '3.0'), ('lib-foo', '1.5')])
+
+    def test_closure_memoized(self):
+        dependencies.closure(self.app)
+        self.assertNumQueries(0, dependencies.closure, self.app)
+
+        # The closure of lib-foo 2.0 is reused when walking from old-app
+        dependencies.closure(Release.objects.get(package='lib-foo',
+                                                 version='2.0'))
+        self.assertEqual(dependencies.closure(self.old),
+                         [('lib-foo', '2.0'), ('qux', None)])
+
+    def test_invalidated(self):
+        self.assertEqual(dependencies.closure(self.app)[-1],
+                         ('lib-foo', '1.5'))
+        create_release('lib-foo', '1.9')
+        self.assertEqual(dependencies.closure(self.app)[-1],
+                         ('lib-foo', '1.9'))
+
+    def test_api(self):
+        response = self.client.get(reverse('djangopypi-package-dependents',
+                                           kwargs={'package': 'lib-foo'}),
+                                   {'version': '1.2'})
+        self.assertEqual([d['name'] for d in
+                          json.loads(response.content)['dependents']],
+                         ['app', 'old-app'])
+
+        response = self.client.get(reverse('djangopypi-release-dependencies',
+                                           kwargs={'package': 'app',
+                                                   'version': '1.0'}))
+        document = json.loads(response.content)
+        self.assertEqual(len(document['requires']), 3)
+        self.assertEqual([d['name'] for d in document['closure']],
+                         ['bar', 'baz', 'lib-foo'])
@@ -0,0 +1,81 @@
+from django.contrib.auth.models import Group
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import simplejson as json
+
+from djangopypi import conf
+from djangopypi.tests.utils import create_user, basic_auth_header, \
+                                   create_release, create_distribution
+
+class TestJSONDocuments(TestCase):
+
+    def setUp(self):
+        # The cached values are what is tested
+        self.addCleanup(setattr, conf, 'SHARED_CACHE', conf.SHARED_CACHE)
+        conf.SHARED_CACHE = True
+        self.release = create_release('foo', '1.0', {
+            'summary': ['The quick brown fox'],
+            'classifier': ['Framework :: Django',
+                           'Programming Language :: Python'],
+        })
+        self.dist = create_distribution(self.release, 'foo-1.0.tar.gz')
+
+    def tearDown(self):
+        self.dist.delete()
+
+    def get_json(self, url, **extra):
+        response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response, json.loads(response.content)
+
+    def test_package_document(self):
+        response, document = self.get_json(reverse('djangopypi-package-json',
+                                                   kwargs={'package': 'foo'}))
+        self.assertEqual(document['info']['summary'], 'The quick brown fox')
+        self.assertEqual(document['info']['classifiers'],
+                         ['Framework :: Django',
+                          'Programming Language :: Python'])
+        self.assertEqual(document['releases'].keys(), ['1.0'])
+        self.assertEqual(document['urls'][0]['filename'], 'foo-1.0.tar.gz')
+        self.assertEqual(document['urls'][0]['size'], len('gibberish'))
+
+    def test_release_document(self):
+        response, document = self.get_json(reverse('djangopypi-release-json',
+            kwargs={'package': 'foo', 'version': '1.0'}))
+        self.assertEqual(document['info']['version'], '1.0')
+        self.assertEqual([u['filename'] for u in document['urls']],
+                         ['foo-1.0.tar.gz'])
+
+    def test_not_modified(self):
+        url = reverse('djangopypi-package-json', kwargs={'package': 'foo'})
+        response, document = self.get_json(url)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_served_from_cache(self):
+        url = reverse('djangopypi-package-json', kwargs={'package': 'foo'})
+        self.get_json(url)
+        # Only the package lookup and its download permissions remain
+        self.assertNumQueries(2, self.client.get, url)
+
+    def test_invalidated_on_change(self):
+        url = reverse('djangopypi-package-json', kwargs={'package': 'foo'})
+        self.get_json(url)
+        create_release('foo', '1.1')
+        response, document = self.get_json(url)
+        self.assertEqual(sorted(document['releases'].keys()), ['1.0', '1.1'])
+
+    def test_download_permissions(self):
+        group = Group.objects.create(name='private')
+        self.release.package.download_permissions.add(group)
+        url = reverse('djangopypi-package-json', kwargs={'package': 'foo'})
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        create_user('outsider')
+        response = self.client.get(url,
+            HTTP_AUTHORIZATION=basic_auth_header('outsider'))
+        self.assertEqual(response.status_code, 403)
+
+        create_user('insider', groups=[group])
+        self.get_json(url, HTTP_AUTHORIZATION=basic_auth_header('insider'))
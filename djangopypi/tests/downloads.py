@@ -0,0 +1,139 @@
+import datetime
+import xmlrpclib
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import simplejson as json
+
+from djangopypi import conf, downloads
+from djangopypi.models import DistributionDownloads
+from djangopypi.tests.utils import create_release, create_distribution
+
+class TestDownloadCounts(TestCase):
+
+    def setUp(self):
+        self.release = create_release('foo', '1.0')
+        self.dist = create_distribution(self.release, 'foo-1.0.tar.gz')
+        self.other = create_distribution(self.release, 'foo-1.0.zip',
+                                         filetype='sdist', pyversion='2.7')
+        downloads.reset()
+        self.addCleanup(downloads.reset)
+        self.addCleanup(cache.clear)
+
+    def tearDown(self):
+        self.dist.delete()
+        self.other.delete()
+
+    def set_conf(self, **values):
+        for name, value in values.iteritems():
+            self.addCleanup(setattr, conf, name, getattr(conf, name))
+            setattr(conf, name, value)
+
+    def download(self, dist):
+        response = self.client.get(reverse('djangopypi-download',
+                                           kwargs={'path': dist.path}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_counted_in_memory(self):
+        self.set_conf(DOWNLOAD_COUNTER='memory')
+        self.download(self.dist)
+        self.download(self.dist)
+        self.download(self.other)
+        self.assertFalse(DistributionDownloads.objects.exists())
+        self.assertEqual(downloads.flush(), 3)
+        self.assertEqual(downloads.totals([self.dist.pk, self.other.pk]),
+                         {self.dist.pk: 2, self.other.pk: 1})
+        self.assertEqual(downloads.flush(), 0)
+
+    def test_counted_in_cache(self):
+        self.set_conf(DOWNLOAD_COUNTER='cache')
+        self.download(self.dist)
+        self.download(self.dist)
+        self.assertEqual(downloads.flush(), 2)
+        self.download(self.dist)
+        self.assertEqual(downloads.flush(), 1)
+        self.assertEqual(downloads.totals([self.dist.pk]), {self.dist.pk: 3})
+
+    def test_sweep_of_counters_left_by_other_workers(self):
+        self.set_conf(DOWNLOAD_COUNTER='cache')
+        self.download(self.other)
+        # As if counted by a worker that exited since
+        downloads.reset()
+        self.assertEqual(downloads.flush(), 0)
+        self.assertEqual(downloads.sweep(), 1)
+        self.assertEqual(downloads.totals([self.other.pk]),
+                         {self.other.pk: 1})
+
+    def test_disabled(self):
+        self.set_conf(DOWNLOAD_COUNTER=None)
+        self.download(self.dist)
+        self.assertEqual(downloads.flush(), 0)
+
+    def test_metadata_is_not_a_download(self):
+        self.set_conf(DOWNLOAD_COUNTER='memory')
+        self.client.get(reverse('djangopypi-download',
+                                kwargs={'path': self.dist.path + '.metadata'}))
+        self.assertEqual(downloads.flush(), 0)
+
+    def test_flushed_after_request_when_due(self):
+        self.set_conf(DOWNLOAD_COUNTER='memory', DOWNLOAD_FLUSH_SIZE=2)
+        self.download(self.dist)
+        self.assertEqual(downloads.totals([self.dist.pk]), {self.dist.pk: 0})
+        self.download(self.other)
+        self.assertEqual(downloads.totals([self.dist.pk, self.other.pk]),
+                         {self.dist.pk: 1, self.other.pk: 1})
+
+    def test_write_adds_to_existing_days(self):
+        today = datetime.date.today()
+        yesterday = today - datetime.timedelta(days=1)
+        downloads.write({(self.dist.pk, today): 2, (self.dist.pk, yesterday): 1})
+        # In bulk: the distributions, the existing rows, one update and one
+        # insert
+        self.assertNumQueries(4, downloads.write,
+                              {(self.dist.pk, today): 3,
+                               (self.other.pk, today): 1})
+        self.assertEqual(dict(DistributionDownloads.objects.filter(
+            distribution=self.dist).values_list('day', 'count')),
+            {today: 5, yesterday: 1})
+
+    def test_counts_of_deleted_distributions_are_dropped(self):
+        self.assertEqual(downloads.write({(self.dist.pk + 100,
+                                           datetime.date.today()): 1}), 0)
+
+    def test_recent(self):
+        today = datetime.date(2012, 3, 31)
+        downloads.write({(self.dist.pk, today): 1,
+                         (self.other.pk, today - datetime.timedelta(days=3)): 2,
+                         (self.dist.pk, today - datetime.timedelta(days=10)): 4,
+                         (self.dist.pk, today - datetime.timedelta(days=40)): 8})
+        self.assertEqual(downloads.recent([self.dist.pk, self.other.pk],
+                                          today=today),
+                         {'last_day': 1, 'last_week': 3, 'last_month': 7})
+
+    def test_exposed(self):
+        downloads.write({(self.dist.pk, datetime.date.today()): 5})
+        response = self.client.post(reverse('djangopypi-release-index'),
+            xmlrpclib.dumps(('foo', '1.0'), 'release_urls'),
+            content_type='text/xml')
+        urls = xmlrpclib.loads(response.content)[0][0]
+        self.assertEqual(sorted((url['filename'], url['downloads'])
+                                for url in urls),
+                         [('foo-1.0.tar.gz', 5), ('foo-1.0.zip', 0)])
+
+        response = self.client.get(reverse('djangopypi-release-json',
+            kwargs={'package': 'foo', 'version': '1.0'}))
+        document = json.loads(response.content)
+        self.assertEqual(document['info']['downloads']['last_day'], 5)
+        self.assertEqual(dict((url['filename'], url['downloads'])
+                              for url in document['urls']),
+                         {'foo-1.0.tar.gz': 5, 'foo-1.0.zip': 0})
+
+    def test_documents_invalidated_by_flush(self):
+        self.set_conf(DOWNLOAD_COUNTER='memory')
+        url = reverse('djangopypi-package-json', kwargs={'package': 'foo'})
+        self.client.get(url)
+        self.download(self.dist)
+        downloads.flush()
+        document = json.loads(self.client.get(url).content)
+        self.assertEqual(document['info']['downloads']['last_month'], 1)
@@ -0,0 +1,120 @@
+import Queue
+import os
+import shutil
+import sys
+import tempfile
+import time
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from djangopypi import conf, events
+from djangopypi.tests.utils import create_user, basic_auth_header, \
+                                   create_release, create_distribution, \
+                                   post_distutils
+
+class TestEvents(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.set_conf(EVENT_ROOT=self.root, EVENT_SINKS=('jsonl', 'sqlite'),
+                      EVENT_FLUSH_INTERVAL=0)
+        events.reset()
+        self.addCleanup(events.reset)
+
+    def set_conf(self, **values):
+        for name, value in values.iteritems():
+            self.addCleanup(setattr, conf, name, getattr(conf, name))
+            setattr(conf, name, value)
+
+    def query(self, **criteria):
+        events.flush()
+        return events.query(**criteria)
+
+    def test_written_to_every_sink(self):
+        events.emit('download', user='alice', package='foo', version='1.0',
+                    filename='foo-1.0.tar.gz')
+        events.emit('download', user='bob', package='bar', version='2.0')
+        events.flush()
+        for query in (events._query_sqlite, events._query_jsonl):
+            found = query(self.root, None, None, None, {'package': 'foo'})
+            self.assertEqual([(e['event'], e['user'], e['filename'])
+                              for e in found],
+                             [('download', 'alice', 'foo-1.0.tar.gz')])
+
+    def test_extra_fields(self):
+        events.emit('upload_refused', package='foo', reason='No version')
+        self.assertEqual(self.query(event='upload_refused')[0]['reason'],
+                         'No version')
+
+    def test_time_range(self):
+        events.emit('login', user='alice')
+        now = time.time()
+        self.assertEqual(len(self.query(since=now - 60)), 1)
+        self.assertEqual(self.query(until=now - 60), [])
+
+    def test_unknown_field(self):
+        self.assertRaises(ValueError, events.query, reason='No version')
+
+    def test_queue_full(self):
+        # A full queue that the writer does not read
+        self.addCleanup(setattr, events, '_queue', events._queue)
+        events._queue = Queue.Queue(1)
+        events._queue.put({})
+        events.emit('login', user='alice')
+        self.assertEqual(events.dropped[0], 1)
+        events._queue.get()
+        events._queue.task_done()
+
+    def test_rotation(self):
+        # Every write fills the file
+        self.set_conf(EVENT_SINKS=('jsonl',), EVENT_ROTATE_SIZE=10)
+        for user in ('alice', 'bob', 'carol'):
+            events.emit('login', user=user)
+            events.flush()
+        self.assertEqual(len(events.jsonl_files(self.root)), 3)
+        self.assertEqual([e['user'] for e in events.query(event='login')],
+                         ['alice', 'bob', 'carol'])
+
+    def test_rotated_files_are_pruned(self):
+        self.set_conf(EVENT_SINKS=('jsonl',), EVENT_KEEP_DAYS=1)
+        old = os.path.join(self.root, 'events.20120101T000000-000000.jsonl')
+        open(old, 'w').write('{}\n')
+        os.utime(old, (0, 0))
+        events.emit('login', user='alice')
+        events.flush()
+        self.assertFalse(os.path.exists(old))
+
+    def test_download(self):
+        release = create_release('foo', '1.0')
+        dist = create_distribution(release, 'foo-1.0.tar.gz')
+        self.addCleanup(dist.delete)
+        self.client.get(reverse('djangopypi-download',
+                                kwargs={'path': dist.path}),
+                        REMOTE_ADDR='10.0.0.1')
+        found = self.query(event='download', package='foo')
+        self.assertEqual([(e.get('user'), e['version'], e['address'])
+                          for e in found], [(None, '1.0', '10.0.0.1')])
+
+    def test_refused_upload(self):
+        create_user('alice')
+        post_distutils(self.client, [(':action', 'file_upload'),
+                                     ('name', 'foo')],
+                       HTTP_AUTHORIZATION=basic_auth_header('alice'))
+        self.assertEqual([e['user'] for e in self.query(event='login')],
+                         ['alice'])
+        refused = self.query(event='upload_refused')
+        self.assertEqual(refused[0]['user'], 'alice')
+        self.assertTrue('one group' in refused[0]['reason'])
+
+    def test_query_command(self):
+        events.emit('download', user='alice', package='foo')
+        events.flush()
+        self.addCleanup(setattr, sys, 'stdout', sys.stdout)
+        sys.stdout = StringIO()
+        call_command('query_events', self.root, package='foo')
+        self.assertTrue(sys.stdout.getvalue().endswith(
+            ' event: download user: alice package: foo\n'))
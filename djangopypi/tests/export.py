@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import Group
+from django.test import TestCase
+from django.utils import simplejson as json
+
+from djangopypi import conf, deferred
+from djangopypi.export import Exporter
+from djangopypi.models import Package
+from djangopypi.tests.utils import create_release, create_distribution
+
+class TestStaticExport(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.exporter = Exporter(self.root)
+        self.private = Group.objects.create(name='private')
+        self.release = create_release('foo', '1.0')
+        self.dists = [create_distribution(self.release, 'foo-1.0.tar.gz')]
+        create_release('secret', '1.0', groups=[self.private])
+
+    def tearDown(self):
+        conf.STATIC_EXPORT_ROOT = None
+        for dist in self.dists:
+            dist.delete()
+        shutil.rmtree(self.root)
+
+    def read(self, *path):
+        return open(os.path.join(self.root, 'simple', *path)).read()
+
+    def test_export(self):
+        exported, removed = self.exporter.export()
+        self.assertEqual(exported, ['foo'])
+        self.assertTrue('foo-1.0.tar.gz' in self.read('foo', 'index.html'))
+        self.assertEqual(json.loads(self.read('index.json'))['projects'],
+                         [{'name': 'foo'}])
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'simple',
+                                                     'secret')))
+
+    def test_only_changed_packages_written(self):
+        self.exporter.export()
+        self.assertEqual(self.exporter.export(), ([], []))
+
+        self.dists.append(create_distribution(self.release, 'foo-1.0.zip',
+                                              filetype='bdist_dumb'))
+        self.assertEqual(self.exporter.export(), (['foo'], []))
+        self.assertTrue('foo-1.0.zip' in self.read('foo', 'index.html'))
+
+    def test_home_page_change_written(self):
+        self.exporter.export()
+        self.release.package_info['home_page'] = 'http://example.com/foo'
+        self.release.save()
+        self.assertEqual(self.exporter.export(), (['foo'], []))
+        self.assertTrue('http://example.com/foo' in
+                        self.read('foo', 'index.html'))
+
+    def test_removed_when_made_private(self):
+        self.exporter.export()
+        self.release.package.download_permissions.add(self.private)
+        self.assertEqual(self.exporter.export(), ([], ['foo']))
+        self.assertEqual(json.loads(self.read('index.json'))['projects'], [])
+
+    def test_incremental_export(self):
+        conf.STATIC_EXPORT_ROOT = self.root
+        self.dists.append(create_distribution(self.release, 'foo-1.0.zip',
+                                              filetype='bdist_dumb'))
+        self.assertTrue('foo-1.0.zip' in self.read('foo', 'index.html'))
+        self.assertTrue('foo' in self.read('index.html'))
+
+        self.release.package.download_permissions.add(self.private)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'simple',
+                                                     'foo')))
+
+    def test_incremental_export_after_commit(self):
+        conf.STATIC_EXPORT_ROOT = self.root
+        page = os.path.join(self.root, 'simple', 'foo', 'index.html')
+
+        @deferred.commit_on_success
+        def upload():
+            self.dists.append(create_distribution(
+                self.release, 'foo-1.0.zip', filetype='bdist_dumb'))
+            self.assertFalse(os.path.exists(page))
+
+        upload()
+        self.assertTrue('foo-1.0.zip' in self.read('foo', 'index.html'))
+
+    def test_unsafe_names_skipped(self):
+        for name in ('..', '../escape'):
+            create_release(name, '1.0')
+        self.assertEqual(self.exporter.export(), (['foo'], []))
+        self.assertEqual(os.listdir(self.root), ['simple'])
+        self.assertEqual(json.loads(self.read('index.json'))['projects'],
+                         [{'name': 'foo'}])
+
+        # Made private, removing them removes nothing
+        conf.STATIC_EXPORT_ROOT = self.root
+        Package.objects.get(name='..').download_permissions.add(self.private)
+        self.exporter.remove_packages(['..', '../escape'])
+        self.assertTrue('foo-1.0.tar.gz' in self.read('foo', 'index.html'))
@@ -0,0 +1,130 @@
+from django.test import TestCase
+from django.utils.datastructures import MultiValueDict
+
+from djangopypi.models import Release, ReleaseDescription, Classifier
+from djangopypi.requirements import parse_requirement
+from djangopypi.tests.utils import create_release
+
+class TestParseRequirement(TestCase):
+
+    def test_plain(self):
+        self.assertEqual(parse_requirement('Foo'), ('foo', '', ''))
+
+    def test_parenthesized_specifier(self):
+        self.assertEqual(parse_requirement('zope.interface (>=3.6, <4)'),
+                         ('zope-interface', '>=3.6,<4', ''))
+
+    def test_extras_and_marker(self):
+        self.assertEqual(parse_requirement('Foo_Bar[baz]>=1.0; '
+                                           'python_version < "3"'),
+                         ('foo-bar', '>=1.0', 'python_version < "3"'))
+
+    def test_invalid(self):
+        self.assertEqual(parse_requirement('>=1.0'), None)
+
+class TestMetadataColumns(TestCase):
+
+    def setUp(self):
+        self.release = create_release('foo', '1.0', {
+            'summary': ['Foo things'],
+            'author': ['Someone'],
+            'license': ['BSD'],
+            'requires_python': ['>=2.6'],
+            'description': ['A long description'],
+            'classifier': ['Framework :: Django',
+                           'Programming Language :: Python'],
+            'requires_dist': ['Bar (>=1.0)', 'baz; sys_platform == "win32"'],
+        })
+
+    def test_columns(self):
+        release = Release.objects.get(pk=self.release.pk)
+        self.assertEqual(release.summary, 'Foo things')
+        self.assertEqual(release.author, 'Someone')
+        self.assertEqual(release.license, 'BSD')
+        self.assertEqual(release.requires_python, '>=2.6')
+        self.assertEqual(list(Release.objects.filter(license='BSD')),
+                         [release])
+
+    def test_description_kept_apart(self):
+        release = Release.objects.get(pk=self.release.pk)
+        self.assertFalse('description' in release.package_info)
+        self.assertEqual(release.description, 'A long description')
+        self.assertEqual(ReleaseDescription.objects.get(release=release).text,
+                         'A long description')
+
+    def test_classifiers(self):
+        self.assertEqual(list(self.release.classifiers.values_list('name',
+                                                                   flat=True)),
+                         ['Framework :: Django',
+                          'Programming Language :: Python'])
+        self.assertEqual(list(Classifier.objects.get(name='Framework :: Django')
+                              .releases.all()), [self.release])
+
+    def test_dependencies(self):
+        self.assertEqual(sorted(self.release.dependencies.values_list(
+                             'name', 'specifier', 'marker')),
+                         [('bar', '>=1.0', ''),
+                          ('baz', '', 'sys_platform == "win32"')])
+
+    def test_metadata_update(self):
+        release = Release.objects.get(pk=self.release.pk)
+        release.package_info = MultiValueDict({
+            'summary': ['Other things'],
+            'description': ['Shorter'],
+            'classifier': ['Framework :: Django'],
+        })
+        release.save()
+
+        release = Release.objects.get(pk=self.release.pk)
+        self.assertEqual(release.summary, 'Other things')
+        self.assertEqual(release.author, '')
+        self.assertEqual(release.description, 'Shorter')
+        self.assertEqual(release.classifiers.count(), 1)
+        self.assertEqual(release.dependencies.count(), 0)
+
+    def test_unchanged_save(self):
+        release = Release.objects.get(pk=self.release.pk)
+        # The auto-hide handler looks up the package and the stored release,
+        # then the update; the metadata was not read, so neither were the
+        # classifiers and dependencies
+        self.assertNumQueries(4, release.save)
+        # The classifier and dependency comparisons find nothing to write
+        release = Release.objects.get(pk=self.release.pk)
+        release.package_info
+        self.assertNumQueries(6, release.save)
+
+class TestLazyPackageInfo(TestCase):
+
+    def setUp(self):
+        self.release = create_release('foo', '1.0', {'summary': ['Foo'],
+                                                     'keywords': ['foo bar']})
+        self.field = Release._meta.get_field('package_info')
+
+    def test_decoded_on_access(self):
+        release = Release.objects.get(pk=self.release.pk)
+        self.assertFalse(self.field.is_loaded(release))
+        self.assertEqual(release.package_info['summary'], 'Foo')
+        self.assertTrue(self.field.is_loaded(release))
+
+    def test_saved_undecoded(self):
+        release = Release.objects.get(pk=self.release.pk)
+        release.hidden = True
+        release.save()
+        self.assertFalse(self.field.is_loaded(release))
+        release = Release.objects.get(pk=self.release.pk)
+        self.assertTrue(release.hidden)
+        self.assertEqual(release.package_info.getlist('keywords'),
+                         ['foo bar'])
+
+    def test_changes_saved(self):
+        release = Release.objects.get(pk=self.release.pk)
+        release.package_info['summary'] = 'Bar'
+        release.save()
+        self.assertEqual(Release.objects.get(pk=self.release.pk)
+                         .package_info['summary'], 'Bar')
+
+    def test_deferred(self):
+        release = Release.objects.defer('package_info').get(pk=self.release.pk)
+        release.save()
+        self.assertEqual(Release.objects.get(pk=self.release.pk)
+                         .package_info['summary'], 'Foo')
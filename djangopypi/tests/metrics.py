@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from djangopypi import conf, metrics
+from djangopypi.tests.utils import create_user, create_release, \
+                                   basic_auth_header
+
+class TestMetrics(TestCase):
+
+    def setUp(self):
+        # The cached values are what is tested
+        self.addCleanup(setattr, conf, 'SHARED_CACHE', conf.SHARED_CACHE)
+        conf.SHARED_CACHE = True
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        # The test client loads the middleware on its first request
+        self.addCleanup(setattr, settings, 'MIDDLEWARE_CLASSES',
+                        settings.MIDDLEWARE_CLASSES)
+        settings.MIDDLEWARE_CLASSES = tuple(settings.MIDDLEWARE_CLASSES) + (
+            'djangopypi.middleware.MetricsMiddleware',)
+        create_user('reader', groups=[Group.objects.create(name='staff')])
+        create_release('foo', '1.0')
+
+    def get_simple(self):
+        return self.client.get(reverse('djangopypi-package-simple',
+                                       kwargs={'package': 'foo'}),
+                               HTTP_AUTHORIZATION=basic_auth_header('reader'))
+
+    def test_requests_recorded(self):
+        response = self.get_simple()
+        self.get_simple()
+        first, second = metrics.recent()
+        self.assertEqual((first['endpoint'], first['method'],
+                          first['status'], first['path']),
+                         ('packages.simple_details', 'GET', 200,
+                          '/simple/foo/'))
+        self.assertEqual(first['bytes'], len(response.content))
+        # The second one was served from the cache
+        self.assertTrue(first['queries'] > second['queries'] > 0)
+
+        text = metrics.prometheus()
+        for line in (
+            'djangopypi_requests_total{endpoint="packages.simple_details",'
+            'method="GET",status="200"} 2',
+            'djangopypi_request_duration_seconds_count'
+            '{endpoint="packages.simple_details"} 2',
+            'djangopypi_db_queries_bucket'
+            '{endpoint="packages.simple_details",le="+Inf"} 2',
+            'djangopypi_cache_requests_total{cache="simple",result="hit"} 1',
+            'djangopypi_cache_requests_total{cache="simple",result="miss"} 1',
+        ):
+            self.assertTrue(line in text.splitlines(), line)
+
+    def test_xmlrpc_labelled(self):
+        self.client.post(reverse('djangopypi-release-index'),
+                         "<?xml version='1.0'?><methodCall><methodName>"
+                         "list_packages</methodName></methodCall>",
+                         content_type='text/xml')
+        self.assertEqual(metrics.recent()[0]['endpoint'],
+                         'xmlrpc.list_packages')
+
+    def test_access(self):
+        self.get_simple()
+        url = reverse('djangopypi-metrics')
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        self.addCleanup(setattr, conf, 'METRICS_ALLOWED_IPS',
+                        conf.METRICS_ALLOWED_IPS)
+        conf.METRICS_ALLOWED_IPS = ('127.0.0.1',)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+        conf.METRICS_ALLOWED_IPS = ()
+        response = self.client.get(
+            reverse('djangopypi-metrics-recent'),
+            {'endpoint': 'packages.simple_details'},
+            HTTP_AUTHORIZATION=basic_auth_header('reader'))
+        self.assertEqual(response.status_code, 401)
+
+        admin = create_user('staffer')
+        admin.is_staff = True
+        admin.save()
+        response = self.client.get(
+            reverse('djangopypi-metrics-recent'),
+            {'endpoint': 'packages.simple_details'},
+            HTTP_AUTHORIZATION=basic_auth_header('staffer'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.count('"endpoint"'), 1)
+
+    def test_histogram(self):
+        histogram = metrics.Histogram((1, 5, 10))
+        for value in (0, 1, 3, 7, 20):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()),
+                         [(1, 2), (5, 3), (10, 4)])
+        self.assertEqual((histogram.count, histogram.sum), (5, 31))
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import simplejson as json
+
+from djangopypi import conf, profiling
+from djangopypi.tests.utils import create_user, create_release, \
+                                   basic_auth_header
+
+def busy(seconds):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        pass
+
+class TestProfile(TestCase):
+
+    def test_sampling(self):
+        profile = profiling.Profile()
+        profile.start()
+        busy(0.1)
+        profile.stop()
+        self.assertTrue(profile.samples > 5, profile.samples)
+        self.assertTrue(profile.duration >= 0.1)
+        # The outermost frame comes first
+        line = profile.collapsed().splitlines()[0]
+        stack, count = line.rsplit(' ', 1)
+        self.assertTrue(stack.split(';')[-1].startswith('busy ('), stack)
+        self.assertTrue(int(count) > 0)
+
+        samples = profile.samples
+        busy(0.05)
+        self.assertEqual(profile.samples, samples)
+
+    def test_prune(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        for name in ('a', 'b', 'c'):
+            for suffix in (profiling.FOLDED_SUFFIX, profiling.INFO_SUFFIX):
+                open(os.path.join(root, name + suffix), 'w').close()
+        profiling.prune(root, 1)
+        self.assertEqual(sorted(os.listdir(root)),
+                         ['c' + profiling.FOLDED_SUFFIX,
+                          'c' + profiling.INFO_SUFFIX])
+
+class TestProfilingMiddleware(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        for name, value in (('PROFILE_ROOT', self.root),
+                            ('PROFILE_SAMPLE_RATE', 1.0),
+                            ('PROFILE_THRESHOLD', 0)):
+            self.addCleanup(setattr, conf, name, getattr(conf, name))
+            setattr(conf, name, value)
+        # The test client loads the middleware on its first request
+        self.addCleanup(setattr, settings, 'MIDDLEWARE_CLASSES',
+                        settings.MIDDLEWARE_CLASSES)
+        settings.MIDDLEWARE_CLASSES = tuple(settings.MIDDLEWARE_CLASSES) + (
+            'djangopypi.middleware.ProfilingMiddleware',)
+        create_user('reader', groups=[Group.objects.create(name='staff')])
+        create_release('foo', '1.0')
+
+    def get_simple(self):
+        return self.client.get(reverse('djangopypi-package-simple',
+                                       kwargs={'package': 'foo'}),
+                               HTTP_AUTHORIZATION=basic_auth_header('reader'))
+
+    def test_slow_request_saved(self):
+        self.assertEqual(self.get_simple().status_code, 200)
+        names = sorted(os.listdir(self.root))
+        self.assertEqual(len(names), 2)
+        self.assertTrue(names[0].endswith(
+            '-packages.simple_details-%d.folded' % (os.getpid(),)), names)
+        info = json.load(open(os.path.join(self.root, names[1])))
+        self.assertEqual((info['path'], info['status']), ('/simple/foo/', 200))
+        self.assertTrue(info['queries'])
+        self.assertTrue(all(query['sql'] for query in info['queries']))
+
+    def test_fast_request_dropped(self):
+        conf.PROFILE_THRESHOLD = 60
+        self.get_simple()
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_bounded(self):
+        self.addCleanup(setattr, conf, 'PROFILE_MAX_PROFILES',
+                        conf.PROFILE_MAX_PROFILES)
+        conf.PROFILE_MAX_PROFILES = 2
+        for i in range(4):
+            self.get_simple()
+        self.assertEqual(len(os.listdir(self.root)), 4)
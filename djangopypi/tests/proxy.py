@@ -0,0 +1,165 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from BaseHTTPServer import HTTPServer
+from SimpleHTTPServer import SimpleHTTPRequestHandler
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from djangopypi import conf
+from djangopypi.models import Package, Distribution
+from djangopypi.proxy import split_filename
+from djangopypi.tests.utils import create_user, basic_auth_header
+
+class UpstreamIndex(object):
+    """ A stand-in upstream index serving a temporary directory over HTTP """
+
+    def __init__(self):
+        self.root = tempfile.mkdtemp()
+        self.requests = []
+        index = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            def translate_path(self, path):
+                index.requests.append(path)
+                return os.path.join(index.root, path.split('?')[0].lstrip('/'))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+
+    def add_file(self, package, filename, content):
+        for path in (os.path.join(self.root, 'simple', package),
+                     os.path.join(self.root, 'files')):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        open(os.path.join(self.root, 'files', filename), 'wb').write(content)
+        index = open(os.path.join(self.root, 'simple', package, 'index.html'),
+                     'a')
+        index.write('<a href="../../files/%s#md5=%s">%s</a><br/>\n' % (
+            filename, hashlib.md5(content).hexdigest(), filename))
+        index.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.root)
+
+class TestSplitFilename(TestCase):
+
+    def test_sdist(self):
+        self.assertEqual(split_filename('Foo_Bar-1.0.tar.gz', 'foo-bar'),
+                         ('1.0', 'sdist', ''))
+
+    def test_egg(self):
+        self.assertEqual(split_filename('foo-1.0-py2.7-linux.egg', 'foo'),
+                         ('1.0', 'bdist_egg', '2.7'))
+
+    def test_wheel(self):
+        self.assertEqual(split_filename('Foo_Bar-1.0-py2.py3-none-any.whl',
+                                        'foo-bar'),
+                         ('1.0', 'bdist_wheel', 'py2.py3'))
+
+    def test_other_package(self):
+        self.assertEqual(split_filename('foobar-1.0.zip', 'foo'), None)
+        self.assertEqual(split_filename('foobar-1.0-py2-none-any.whl', 'foo'),
+                         None)
+
+class TestPullThroughProxy(TestCase):
+
+    def setUp(self):
+        self.upstream = UpstreamIndex()
+        self.upstream.add_file('foo', 'foo-1.0.tar.gz', 'foo 1.0 contents')
+        self.settings = (conf.PROXY_MISSING, conf.PROXY_BASE_URL)
+        conf.PROXY_MISSING = True
+        conf.PROXY_BASE_URL = '%s/simple' % self.upstream.url
+        create_user('reader')
+        self.auth = basic_auth_header('reader')
+
+    def tearDown(self):
+        conf.PROXY_MISSING, conf.PROXY_BASE_URL = self.settings
+        for dist in Distribution.objects.all():
+            dist.delete()
+        self.upstream.close()
+
+    def simple_page(self, name='foo'):
+        return self.client.get(reverse('djangopypi-package-simple',
+                                       kwargs={'package': name}),
+                               HTTP_AUTHORIZATION=self.auth)
+
+    def test_mirrors_missing_package(self):
+        response = self.simple_page()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('foo-1.0.tar.gz' in response.content)
+        self.assertTrue(Package.objects.get(name='foo').is_mirror)
+
+        dist = Distribution.objects.get(release__package='foo')
+        self.assertFalse(dist.content.storage.exists(dist.path))
+        response = self.client.get(dist.content.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(open(dist.content.path).read(), 'foo 1.0 contents')
+
+    def test_served_locally_within_ttl(self):
+        self.simple_page()
+        self.simple_page()
+        self.assertEqual(self.upstream.requests, ['/simple/foo/'])
+
+    def test_revalidated_after_ttl(self):
+        self.simple_page()
+        self.upstream.add_file('foo', 'foo-1.1.tar.gz', 'foo 1.1 contents')
+        Package.objects.filter(name='foo').update(
+            mirror_checked=datetime.now() - timedelta(days=1))
+        self.assertTrue('foo-1.1.tar.gz' in self.simple_page().content)
+
+    def test_stale_mirror_served_when_upstream_is_down(self):
+        self.simple_page()
+        Package.objects.filter(name='foo').update(
+            mirror_checked=datetime.now() - timedelta(days=1))
+        conf.PROXY_BASE_URL = 'http://127.0.0.1:1/simple'
+        response = self.simple_page()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('foo-1.0.tar.gz' in response.content)
+
+    def test_mirrors_wheels(self):
+        for platform in ('linux_x86_64', 'win32'):
+            self.upstream.add_file('foo', 'foo-1.0-cp27-none-%s.whl' % (
+                platform,), 'foo 1.0 %s wheel' % (platform,))
+        self.upstream.add_file('foo', 'foo-1.0-cp27-none-linux_x86_64.whl',
+                               'listed twice')
+        response = self.simple_page()
+        self.assertTrue('foo-1.0-cp27-none-win32.whl' in response.content)
+        self.assertEqual(sorted(Distribution.objects
+                                .filter(filetype='bdist_wheel')
+                                .values_list('pyversion', 'platform_tag')),
+                         [('cp27', 'linux_x86_64'), ('cp27', 'win32')])
+
+    def test_unknown_package(self):
+        self.addCleanup(cache.delete, 'djangopypi:proxy:missing:bar')
+        self.assertEqual(self.simple_page('bar').status_code, 404)
+
+    def test_unknown_package_remembered(self):
+        self.addCleanup(cache.delete, 'djangopypi:proxy:missing:bar')
+        self.simple_page('bar')
+        self.assertEqual(self.simple_page('bar').status_code, 404)
+        self.assertEqual(self.upstream.requests, ['/simple/bar/'])
+
+        cache.delete('djangopypi:proxy:missing:bar')
+        self.simple_page('bar')
+        self.assertEqual(len(self.upstream.requests), 2)
+
+    def test_anonymous_clients_do_not_mirror(self):
+        response = self.client.get(reverse('djangopypi-package-simple',
+                                           kwargs={'package': 'foo'}))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.upstream.requests, [])
+        self.assertFalse(Package.objects.filter(name='foo').exists())
@@ -0,0 +1,85 @@
+import socket
+import threading
+import time
+
+from django.test import TestCase
+
+from djangopypi.receiver import Receiver
+
+def echo(environ, start_response):
+    """ Answers with the method, path and body of the request """
+    body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return ['%s %s %s' % (environ['REQUEST_METHOD'], environ['PATH_INFO'],
+                          body)]
+
+class TestReceiver(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.receiver = Receiver('127.0.0.1', 0, app=self.app, threads=2,
+                                 max_body=1000, timeout=1)
+        thread = threading.Thread(target=self.receiver.serve)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.receiver.stop)
+
+    def app(self, environ, start_response):
+        self.calls.append(environ['PATH_INFO'])
+        return echo(environ, start_response)
+
+    def connect(self):
+        sock = socket.create_connection(self.receiver.address, timeout=5)
+        self.addCleanup(sock.close)
+        return sock
+
+    def read(self, sock):
+        data = []
+        for block in iter(lambda: sock.recv(4096), ''):
+            data.append(block)
+        return ''.join(data)
+
+    def test_slow_body(self):
+        sock = self.connect()
+        sock.sendall('POST /pypi/?a=1 HTTP/1.1\r\nContent-Length: 10\r\n\r\n'
+                     'hello')
+        time.sleep(0.2)
+        # Nothing is handed to the application before the whole body came
+        self.assertEqual(self.calls, [])
+        sock.sendall('world')
+        response = self.read(sock)
+        self.assertTrue(response.startswith('HTTP/1.1 200 OK\r\n'))
+        self.assertTrue(response.endswith('\r\n\r\nPOST /pypi/ helloworld'))
+
+    def test_other_requests_are_served_meanwhile(self):
+        slow = self.connect()
+        slow.sendall('POST /pypi/ HTTP/1.1\r\nContent-Length: 10\r\n\r\nab')
+        sock = self.connect()
+        sock.sendall('GET /simple/ HTTP/1.1\r\n\r\n')
+        self.assertTrue(self.read(sock).endswith('GET /simple/ '))
+
+    def test_continue(self):
+        sock = self.connect()
+        sock.sendall('PUT /uploads/ HTTP/1.1\r\nContent-Length: 3\r\n'
+                     'Expect: 100-continue\r\n\r\n')
+        self.assertEqual(sock.recv(4096), 'HTTP/1.1 100 Continue\r\n\r\n')
+        sock.sendall('abc')
+        self.assertTrue(self.read(sock).endswith('PUT /uploads/ abc'))
+
+    def test_too_large(self):
+        sock = self.connect()
+        sock.sendall('POST /pypi/ HTTP/1.1\r\nContent-Length: 1001\r\n\r\n')
+        self.assertTrue(self.read(sock).startswith('HTTP/1.1 413 '))
+        self.assertEqual(self.calls, [])
+
+    def test_chunked(self):
+        sock = self.connect()
+        sock.sendall('POST /pypi/ HTTP/1.1\r\n'
+                     'Transfer-Encoding: chunked\r\n\r\n')
+        self.assertTrue(self.read(sock).startswith('HTTP/1.1 411 '))
+
+    def test_idle_connection_is_closed(self):
+        sock = self.connect()
+        sock.sendall('POST /pypi/ HTTP/1.1\r\nContent-Length: 10\r\n\r\n')
+        self.assertEqual(self.read(sock), '')
+        self.assertEqual(self.calls, [])
@@ -0,0 +1,97 @@
+from django.contrib.auth.models import Group
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import simplejson as json
+
+from djangopypi import resolver
+from djangopypi.models import Release
+from djangopypi.tests.utils import create_release, create_distribution, \
+                                   create_user, basic_auth_header
+
+class TestResolver(TestCase):
+
+    def setUp(self):
+        self.app = create_release('app', '1.0', {'requires_dist': [
+            'lib-foo (>=1.0,<2)', 'docs-tool; extra == "docs"']})
+        create_release('lib-foo', '1.0', {'requires_dist': ['baz>=2']})
+        self.lib = create_release('lib-foo', '1.5', {'requires_dist':
+                                                     ['baz>=3']})
+        create_release('lib-foo', '2.0')
+        create_release('baz', '2.0')
+        create_release('baz', '3.0')
+        create_release('baz', '3.1b1')
+        for release in Release.objects.all():
+            self.add_file(release)
+        self.dist = self.lib.distributions.get()
+
+    def add_file(self, release):
+        dist = create_distribution(release, '%s-%s.tar.gz' % (
+            release.package_id, release.version))
+        self.addCleanup(dist.delete)
+        return dist
+
+    def resolve(self, text, allowed=None, index=None):
+        return resolver.resolve(resolver.parse_requirements(text), allowed,
+                                index or resolver.VersionIndex())
+
+    def test_resolve(self):
+        pins = self.resolve('app\n# comment\n\nBaz!=3.0\n')
+        self.assertEqual([pin[:2] for pin in pins],
+                         [('app', '1.0'), ('baz', '3.1b1'),
+                          ('lib-foo', '1.5')])
+        self.assertEqual([[filename for filename, url, md5_digest in pin[2]]
+                          for pin in pins],
+                         [['app-1.0.tar.gz'], ['baz-3.1b1.tar.gz'],
+                          ['lib-foo-1.5.tar.gz']])
+        self.assertEqual(pins[2][2], [('lib-foo-1.5.tar.gz', self.dist.content.url,
+                                       self.dist.md5_digest)])
+
+    def test_releases_without_files_skipped(self):
+        create_release('lib-foo', '1.9')
+        create_release('baz', '4.0')
+        self.assertEqual([pin[:2] for pin in self.resolve('app')],
+                         [('app', '1.0'), ('baz', '3.0'), ('lib-foo', '1.5')])
+        create_release('docs-tool', '1.0')
+        self.assertRaises(resolver.ResolutionError, self.resolve, 'docs-tool')
+
+    def test_conflict(self):
+        self.assertRaises(resolver.ResolutionError, self.resolve, 'app\nbaz<3')
+        self.assertRaises(resolver.ResolutionError, self.resolve, 'missing')
+        self.assertRaises(resolver.ResolutionError, self.resolve, 'app',
+                          allowed=frozenset(['app', 'lib-foo']))
+        self.assertRaises(resolver.InvalidRequirement, self.resolve, 'app>=x y')
+
+    def test_index_reused(self):
+        index = resolver.VersionIndex()
+        self.resolve('app', index=index)
+        self.assertNumQueries(0, self.resolve, 'app', index=index)
+
+        self.add_file(create_release('lib-foo', '1.9'))
+        self.assertEqual(self.resolve('app', index=index)[-1][:2],
+                         ('lib-foo', '1.9'))
+
+    def test_view(self):
+        url = reverse('djangopypi-resolve')
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+        response = self.client.post(url, 'app', content_type='text/plain')
+        self.assertEqual([pin['name'] for pin in
+                          json.loads(response.content)['pins']],
+                         ['app', 'baz', 'lib-foo'])
+        response = self.client.post(url, {'requirements': 'baz<2'})
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(url, {'requirements': 'baz>=x y'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_view_permissions(self):
+        group = Group.objects.create(name='private')
+        self.add_file(create_release('secret', '1.0', groups=[group]))
+        create_user('alice', groups=[group])
+        url = reverse('djangopypi-resolve')
+
+        response = self.client.post(url, 'secret', content_type='text/plain')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(url, 'secret', content_type='text/plain',
+                                    HTTP_AUTHORIZATION=basic_auth_header('alice'))
+        self.assertEqual(json.loads(response.content)['pins'][0]['version'],
+                         '1.0')
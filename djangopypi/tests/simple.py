@@ -0,0 +1,160 @@
+import zlib
+
+from django.core.urlresolvers import reverse
+from django.http import HttpRequest
+from django.test import TestCase
+from django.utils import simplejson as json
+
+from djangopypi import conf, deferred, simple
+from djangopypi.models import Distribution
+from djangopypi.tests.utils import create_user, basic_auth_header, \
+                                   create_release, create_distribution
+
+PIP_ACCEPT = ('application/vnd.pypi.simple.v1+json, '
+              'application/vnd.pypi.simple.v1+html; q=0.1, '
+              'text/html; q=0.01')
+
+class TestNegotiation(TestCase):
+
+    def negotiate(self, accept=None):
+        request = HttpRequest()
+        if accept is not None:
+            request.META['HTTP_ACCEPT'] = accept
+        return simple.negotiate(request)
+
+    def test_default_is_html(self):
+        self.assertEqual(self.negotiate(), simple.HTML_CONTENT_TYPE)
+        self.assertEqual(self.negotiate('*/*'), simple.HTML_CONTENT_TYPE)
+
+    def test_json_preferred(self):
+        self.assertEqual(self.negotiate(PIP_ACCEPT), simple.JSON_CONTENT_TYPE)
+
+    def test_quality_values(self):
+        self.assertEqual(self.negotiate('application/vnd.pypi.simple.v1+json;'
+                                        'q=0.2, text/html'),
+                         simple.HTML_CONTENT_TYPE)
+
+class TestSimpleJSON(TestCase):
+
+    def setUp(self):
+        create_user('reader')
+        self.auth = basic_auth_header('reader')
+        self.dist = create_distribution(create_release('foo', '1.0'),
+                                        'foo-1.0.tar.gz', md5_digest='abc')
+
+    def tearDown(self):
+        self.dist.delete()
+
+    def test_index(self):
+        response = self.client.get(reverse('djangopypi-package-index-simple'),
+                                   HTTP_ACCEPT=PIP_ACCEPT,
+                                   HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response['Content-Type'], simple.JSON_CONTENT_TYPE)
+        self.assertEqual(json.loads(response.content)['projects'],
+                         [{'name': 'foo'}])
+
+    def test_details(self):
+        response = self.client.get(reverse('djangopypi-package-simple',
+                                           kwargs={'package': 'foo'}),
+                                   HTTP_ACCEPT=PIP_ACCEPT,
+                                   HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response['Content-Type'], simple.JSON_CONTENT_TYPE)
+        self.assertTrue('Accept' in response['Vary'])
+        document = json.loads(response.content)
+        self.assertEqual(document['name'], 'foo')
+        self.assertEqual(document['files'], [{
+            'filename': 'foo-1.0.tar.gz',
+            'url': '/packages/f/foo-1.0.tar.gz',
+            'hashes': {'md5': 'abc'},
+        }])
+
+    def test_html_still_served(self):
+        response = self.client.get(reverse('djangopypi-package-simple',
+                                           kwargs={'package': 'foo'}),
+                                   HTTP_AUTHORIZATION=self.auth)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+        self.assertTrue('foo-1.0.tar.gz' in response.content)
+
+class TestCompressedPages(TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, conf, 'SHARED_CACHE', conf.SHARED_CACHE)
+        conf.SHARED_CACHE = True
+        create_user('reader')
+        self.auth = basic_auth_header('reader')
+        self.release = create_release('foo', '1.0')
+        self.dist = create_distribution(self.release, 'foo-1.0.tar.gz')
+        self.url = reverse('djangopypi-package-simple',
+                           kwargs={'package': 'foo'})
+
+    def tearDown(self):
+        for dist in self.release.distributions.all():
+            dist.delete()
+
+    def get(self, url, **extra):
+        return self.client.get(url, HTTP_AUTHORIZATION=self.auth, **extra)
+
+    def test_gzip(self):
+        response = self.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = zlib.decompress(response.content, 16 + zlib.MAX_WBITS)
+        self.assertTrue('foo-1.0.tar.gz' in content)
+
+    def test_identity(self):
+        response = self.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertTrue('foo-1.0.tar.gz' in response.content)
+
+    def test_index_compressed(self):
+        response = self.get(reverse('djangopypi-package-index-simple'),
+                            HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = zlib.decompress(response.content, 16 + zlib.MAX_WBITS)
+        self.assertTrue('>foo</a>' in content)
+
+    def test_invalidated_on_upload(self):
+        self.get(self.url)
+        create_distribution(self.release, 'foo-1.0.zip', filetype='bdist_dumb')
+        self.assertTrue('foo-1.0.zip' in self.get(self.url).content)
+
+    def test_index_invalidated_on_new_package(self):
+        url = reverse('djangopypi-package-index-simple')
+        self.get(url)
+        create_release('bar', '1.0')
+        self.assertTrue('>bar</a>' in self.get(url).content)
+
+    def test_invalidated_after_commit(self):
+        self.get(self.url)
+        generation = simple.generation('foo')
+
+        @deferred.commit_on_success
+        def upload():
+            create_distribution(self.release, 'foo-1.0.zip',
+                                filetype='bdist_dumb')
+            # Pages rebuilt before the commit stay under this generation
+            self.assertEqual(simple.generation('foo'), generation)
+
+        upload()
+        self.assertNotEqual(simple.generation('foo'), generation)
+        self.assertTrue('foo-1.0.zip' in self.get(self.url).content)
+
+    def test_rollback_not_invalidated(self):
+        generation = simple.generation('foo')
+
+        @deferred.commit_on_success
+        def upload():
+            create_distribution(self.release, 'foo-1.0.zip',
+                                filetype='bdist_dumb')
+            raise ValueError()
+
+        self.assertRaises(ValueError, upload)
+        self.assertEqual(simple.generation('foo'), generation)
+
+    def test_not_cached_without_shared_cache(self):
+        conf.SHARED_CACHE = None
+        self.get(self.url, HTTP_ACCEPT=simple.JSON_CONTENT_TYPE)
+        # Changed without signals, as by another worker
+        Distribution.objects.filter(pk=self.dist.pk).update(md5_digest='f' * 32)
+        response = self.get(self.url, HTTP_ACCEPT=simple.JSON_CONTENT_TYPE)
+        self.assertEqual(json.loads(response.content)['files'][0]['hashes'],
+                         {'md5': 'f' * 32})
@@ -0,0 +1,197 @@
+import threading
+import time
+
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db.models.signals import post_save
+from django.test import TestCase
+
+from djangopypi import conf, documents, permissions, simple, singleflight
+from djangopypi.models import Distribution
+from djangopypi.tests.utils import create_user, basic_auth_header, \
+                                   create_release, create_distribution, \
+                                   post_distutils
+
+class TestSingleFlight(TestCase):
+
+    def setUp(self):
+        # The cached values are what is tested
+        self.addCleanup(setattr, conf, 'SHARED_CACHE', conf.SHARED_CACHE)
+        conf.SHARED_CACHE = True
+        self.key = 'djangopypi:test:singleflight:%s' % time.time()
+        self.builds = []
+
+    def tearDown(self):
+        cache.delete_many([self.key, singleflight._lease_key(self.key)])
+
+    def build(self):
+        self.builds.append(threading.current_thread().name)
+        return 'built'
+
+    def test_thundering_herd(self):
+        release = create_release('foo', '1.0', {'summary': ['Foo']})
+        dist = create_distribution(release, 'foo-1.0.tar.gz')
+        self.addCleanup(dist.delete)
+        package = release.package
+        results = []
+
+        def follower():
+            results.append(singleflight.cached(self.key, self.build, 60))
+
+        threads = [threading.Thread(target=follower) for i in range(20)]
+
+        def leader():
+            # Followers can only use the cache, sqlite's in memory database
+            # is not shared between threads.
+            for thread in threads:
+                thread.start()
+            time.sleep(0.2)
+            return documents.build_package_document(package)
+
+        with self.assertNumQueries(6):
+            value = singleflight.cached(self.key, leader, 60)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.builds, [])
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(result == value for result in results))
+        # The lock of the key went away with its last user
+        self.assertFalse(self.key in singleflight._locks)
+
+    def test_waits_for_other_worker(self):
+        # Another process holds the lease and fills in the value later
+        cache.add(singleflight._lease_key(self.key), 1, 60)
+        def other_worker():
+            time.sleep(0.2)
+            cache.set(self.key, 'from other worker', 60)
+            cache.delete(singleflight._lease_key(self.key))
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+
+        value = singleflight.cached(self.key, self.build, 60)
+        thread.join()
+        self.assertEqual(value, 'from other worker')
+        self.assertEqual(self.builds, [])
+
+    def test_stale_lease_expires(self):
+        cache.add(singleflight._lease_key(self.key), 1, 60)
+        old_wait = conf.COALESCE_WAIT
+        conf.COALESCE_WAIT = 0.1
+        try:
+            value = singleflight.cached(self.key, self.build, 60)
+        finally:
+            conf.COALESCE_WAIT = old_wait
+        self.assertEqual(value, 'built')
+        self.assertEqual(len(self.builds), 1)
+
+class TestCachedPermissions(TestCase):
+
+    def setUp(self):
+        # The cached values are what is tested
+        self.addCleanup(setattr, conf, 'SHARED_CACHE', conf.SHARED_CACHE)
+        conf.SHARED_CACHE = True
+        self.group = Group.objects.create(name='staff')
+        self.user = create_user('reader')
+        create_release('public', '1.0')
+        create_release('private', '1.0', groups=[self.group])
+        self.url = reverse('djangopypi-package-simple',
+                           kwargs={'package': 'private'})
+        self.auth = basic_auth_header('reader')
+
+    def get(self):
+        return self.client.get(self.url, HTTP_AUTHORIZATION=self.auth)
+
+    def test_group_change_invalidates(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.user.groups.add(self.group)
+        self.assertEqual(self.get().status_code, 200)
+        self.group.user_set.clear()
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_revoked_in_another_worker(self):
+        self.user.groups.add(self.group)
+        self.assertEqual(self.get().status_code, 200)
+        # Sends no signal, like a change made by another process
+        self.user.groups.through.objects.filter(user=self.user).delete()
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_warm_page(self):
+        self.user.groups.add(self.group)
+        self.assertEqual(self.get().status_code, 200)
+        # The user for basic auth, the package and whether the user may
+        # download it are queried, the page comes from the cache
+        self.assertNumQueries(3, self.get)
+
+    def test_allowed_packages(self):
+        self.assertEqual(permissions.allowed_packages(None),
+                         frozenset(['public']))
+        self.assertEqual(permissions.allowed_packages(self.user),
+                         frozenset(['public']))
+        self.user.groups.add(self.group)
+        self.assertEqual(permissions.allowed_packages(self.user),
+                         frozenset(['public', 'private']))
+
+class TestPageReadDuringUpload(TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, conf, 'SHARED_CACHE', conf.SHARED_CACHE)
+        conf.SHARED_CACHE = True
+        group = Group.objects.create(name='uploaders')
+        group.permissions.add(Permission.objects.get(
+            codename='add_package', content_type__app_label='djangopypi'))
+        create_user('alice', groups=[group])
+        self.auth = basic_auth_header('alice')
+        release = create_release('foo', '1.0')
+        release.package.owners.add(group)
+        create_distribution(release, 'foo-1.0.tar.gz')
+        self.url = reverse('djangopypi-package-simple',
+                           kwargs={'package': 'foo'})
+
+    def tearDown(self):
+        for dist in Distribution.objects.all():
+            dist.delete()
+
+    def get(self):
+        return self.client.get(self.url, HTTP_AUTHORIZATION=self.auth)
+
+    def test_stale_page_not_kept(self):
+        before = self.get().content
+        self.assertTrue('foo-1.0.tar.gz' in before)
+        results = []
+
+        def reader():
+            # Other workers do not see the uncommitted file: a herd of them
+            # rebuilds the page from the committed rows
+            key = simple.detail_key('foo', simple.HTML_CONTENT_TYPE,
+                                    'djangopypi/package_detail_simple.html')
+            results.append(singleflight.cached(
+                key, lambda: simple.compress(before),
+                conf.SIMPLE_CACHE_TIMEOUT))
+
+        def concurrent_reads(sender, instance, **kwargs):
+            cache.delete(simple.detail_key(
+                'foo', simple.HTML_CONTENT_TYPE,
+                'djangopypi/package_detail_simple.html'))
+            threads = [threading.Thread(target=reader) for i in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        post_save.connect(concurrent_reads, sender=Distribution)
+        try:
+            response = post_distutils(self.client,
+                [(':action', 'file_upload'), ('name', 'foo'),
+                 ('version', '1.0'), ('metadata_version', '1.0'),
+                 ('filetype', 'bdist_dumb'), ('pyversion', '')],
+                'foo-1.0.zip', 'gibberish', HTTP_AUTHORIZATION=self.auth)
+        finally:
+            post_save.disconnect(concurrent_reads, sender=Distribution)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(results), 5)
+
+        content = self.get().content
+        self.assertTrue('foo-1.0.tar.gz' in content)
+        self.assertTrue('foo-1.0.zip' in content)
@@ -0,0 +1,377 @@
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from django.contrib.auth.models import Group, Permission
+from django.core.files.base import ContentFile, File
+from django.core.urlresolvers import reverse
+from django.test import TestCase, TransactionTestCase
+from django.utils import simplejson as json
+
+from djangopypi import conf, uploads
+from djangopypi.models import Package, Release, Distribution, UploadSession, \
+                              FileNameTaken
+from djangopypi.tests.utils import create_user, basic_auth_header, \
+                                   create_release, create_distribution, \
+                                   post_distutils
+
+class TestUpload(TestCase):
+
+    def setUp(self):
+        self.group = Group.objects.create(name='uploaders')
+        self.group.permissions.add(Permission.objects.get(
+            codename='add_package', content_type__app_label='djangopypi'))
+        self.user = create_user('alice', groups=[self.group])
+        self.auth = basic_auth_header('alice')
+
+    def tearDown(self):
+        for dist in Distribution.objects.all():
+            dist.delete()
+
+    def upload(self, name='foo', version='1.0', filename=None, **extra):
+        fields = [(':action', 'file_upload'), ('name', name),
+                  ('version', version), ('metadata_version', '1.0'),
+                  ('summary', 'Foo'), ('filetype', 'sdist'),
+                  ('pyversion', '')]
+        fields += extra.items()
+        if filename is None:
+            filename = '%s-%s.tar.gz' % (name, version)
+        return post_distutils(self.client, fields, filename, 'gibberish',
+                              HTTP_AUTHORIZATION=self.auth)
+
+    def test_new_package(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 200)
+        package = Package.objects.get(name='foo')
+        self.assertEqual(list(package.owners.all()), [self.group])
+        self.assertEqual(list(package.download_permissions.all()),
+                         [self.group])
+        self.assertTrue('uploaders' in response.content)
+        dist = Distribution.objects.get()
+        self.assertEqual(dist.filename, 'foo-1.0.tar.gz')
+        self.assertEqual(dist.uploader, self.user)
+        self.assertEqual(dist.release.package_info['summary'], 'Foo')
+
+    def test_already_uploaded(self):
+        self.upload()
+        response = self.upload()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Distribution.objects.count(), 1)
+
+    def test_second_file_of_the_same_type(self):
+        self.upload()
+        response = self.upload(filename='foo-1.0.zip')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue('A sdist file' in response.content)
+        self.assertEqual(Distribution.objects.count(), 1)
+        storage = Distribution._meta.get_field('content').storage
+        self.assertFalse(storage.exists('f/foo-1.0.zip'))
+
+    def test_file_left_over(self):
+        storage = Distribution._meta.get_field('content').storage
+        storage.save('f/foo-1.0.zip', ContentFile('left over'))
+        self.addCleanup(storage.delete, 'f/foo-1.0.zip')
+        response = self.upload(filename='foo-1.0.zip', filetype='bdist_dumb')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue('A file named foo-1.0.zip is already stored'
+                        in response.content)
+        self.assertFalse(Distribution.objects.exists())
+        self.assertEqual(storage.listdir('f')[1], ['foo-1.0.zip'])
+
+    def test_not_an_owner(self):
+        other = Group.objects.create(name='others')
+        create_release('foo', '1.0').package.owners.add(other)
+        response = self.upload(version='2.0')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(
+            response.content, "'alice' is in the group 'uploaders', only "
+            "members of 'others' can upload new versions of this package.")
+        self.assertFalse(Release.objects.filter(version='2.0').exists())
+
+    def test_missing_version_changes_nothing(self):
+        response = self.upload(version='')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Package.objects.exists())
+
+    def test_missing_name(self):
+        for fields in ([], [('name', '  ')]):
+            response = post_distutils(self.client,
+                [(':action', 'file_upload'), ('version', '1.0')] + fields,
+                'foo-1.0.tar.gz', 'gibberish', HTTP_AUTHORIZATION=self.auth)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.content, 'No package name specified.')
+        self.assertFalse(Package.objects.exists())
+
+    def test_query_budget(self):
+        self.upload(version='1.0')
+        for version in ('2.0', '3.0'):
+            # The session and user of the basic authentication, the group
+            # and its permissions, the package, its owners, the release, the
+            # file name, the new release, hiding the older ones, and the file
+            with self.assertNumQueries(10):
+                response = self.upload(version=version)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Release.objects.filter(hidden=False)
+                                     .values_list('version', flat=True)),
+                         ['3.0'])
+
+    def test_register(self):
+        response = post_distutils(self.client,
+            [(':action', 'submit'), ('name', 'foo'), ('version', '1.0'),
+             ('metadata_version', '1.0'), ('summary', 'Foo')],
+            HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.content, 'release registered')
+        self.assertEqual(Release.objects.get().package_info['summary'], 'Foo')
+
+    def test_standard_multipart(self):
+        content = StringIO('gibberish')
+        content.name = 'foo-1.0.tar.gz'
+        response = self.client.post(reverse('djangopypi-release-index'), {
+            ':action': 'file_upload', 'name': 'foo', 'version': '1.0',
+            'metadata_version': '1.0', 'filetype': 'sdist',
+            'content': content}, HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Distribution.objects.get().content.read(),
+                         'gibberish')
+
+class TestBatchUpload(TransactionTestCase):
+
+    def setUp(self):
+        self.group = Group.objects.create(name='uploaders')
+        self.group.permissions.add(Permission.objects.get(
+            codename='add_package', content_type__app_label='djangopypi'))
+        self.user = create_user('alice', groups=[self.group])
+        self.auth = basic_auth_header('alice')
+        self.files = [('foo-1.0-py2-none-%s.whl' % (platform,),
+                       'built for %s' % (platform,))
+                      for platform in ('linux_x86_64', 'win32', 'any')]
+
+    def tearDown(self):
+        for dist in Distribution.objects.all():
+            dist.delete()
+
+    def upload(self, files, *fields):
+        fields = [(':action', 'batch_upload'), ('name', 'foo'),
+                  ('version', '1.0'), ('metadata_version', '1.0'),
+                  ('summary', 'Foo'), ('filetype', 'bdist_wheel'),
+                  ('pyversion', '2.7')] + list(fields)
+        return post_distutils(self.client, fields, files=files,
+                              HTTP_AUTHORIZATION=self.auth)
+
+    def test_upload(self):
+        response = self.upload(self.files)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('Added new package foo' in response.content)
+        dists = Distribution.objects.order_by('filename')
+        self.assertEqual([(d.filename, d.platform_tag, d.release.version)
+                          for d in dists],
+                         [('foo-1.0-py2-none-any.whl', 'any', '1.0'),
+                          ('foo-1.0-py2-none-linux_x86_64.whl',
+                           'linux_x86_64', '1.0'),
+                          ('foo-1.0-py2-none-win32.whl', 'win32', '1.0')])
+        for dist in dists:
+            self.assertEqual(dist.md5_digest, hashlib.md5(
+                dict(self.files)[dist.filename]).hexdigest())
+
+    def test_fields_per_file(self):
+        self.upload(self.files, ('comment', 'a'), ('comment', 'b'),
+                    ('comment', 'c'))
+        self.assertEqual(dict(Distribution.objects.values_list('filename',
+                                                               'comment')),
+                         dict(zip([f for f, c in self.files], 'abc')))
+
+    def test_wrong_number_of_fields(self):
+        response = self.upload(self.files, ('comment', 'a'), ('comment', 'b'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Package.objects.exists())
+
+    def test_one_file_already_uploaded(self):
+        self.upload(self.files[:1])
+        response = self.upload(self.files)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Distribution.objects.count(), 1)
+
+    def test_wrong_digest_uploads_nothing(self):
+        response = self.upload(self.files, *[('md5_digest', hashlib.md5(
+            content).hexdigest()) for filename, content in self.files[:2]] +
+            [('md5_digest', '0' * 32)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Package.objects.exists())
+
+    def test_conflicting_files_are_removed(self):
+        # The same tags under two names
+        response = self.upload([('foo-1.0-py2-none-any.whl', 'a'),
+                                ('foo-1.0-2-py2-none-any.whl', 'b')])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Distribution.objects.exists())
+        self.assertFalse(Package.objects.exists())
+        storage = Distribution._meta.get_field('content').storage
+        self.assertEqual(storage.listdir('f')[1], [])
+
+class TestFilenames(TestCase):
+
+    def setUp(self):
+        self.release = create_release('foo', '1.0')
+        self.dist = create_distribution(self.release, 'foo-1.0.tar.gz')
+        self.addCleanup(self.dist.delete)
+
+    def download(self, path):
+        return self.client.get(reverse('djangopypi-download',
+                                       kwargs={'path': path}))
+
+    def test_set_on_create(self):
+        self.assertEqual(Distribution.objects.filter(
+            filename='foo-1.0.tar.gz').get(), self.dist)
+
+    def test_not_renamed_by_the_storage(self):
+        # The file is still there, but its row is gone
+        Distribution.objects.filter(pk=self.dist.pk).delete()
+        dist = Distribution(release=self.release, filetype='sdist',
+                            uploader=self.dist.uploader,
+                            content=File(ContentFile('other'),
+                                         'foo-1.0.tar.gz'))
+        self.assertRaises(FileNameTaken, dist.save)
+        self.assertEqual(os.listdir(os.path.dirname(self.dist.content.path)),
+                         ['foo-1.0.tar.gz'])
+
+    def test_download_lookup(self):
+        self.assertEqual(self.download(self.dist.path).status_code, 200)
+        self.assertEqual(self.download('x/' + self.dist.filename).status_code,
+                         404)
+
+    def test_download_of_file_named_by_path(self):
+        Distribution.objects.filter(pk=self.dist.pk) \
+                            .update(filename=self.dist.path)
+        self.assertEqual(self.download(self.dist.path).status_code, 200)
+
+class TestResumableUpload(TestCase):
+
+    def setUp(self):
+        self.group = Group.objects.create(name='uploaders')
+        self.group.permissions.add(Permission.objects.get(
+            codename='add_package', content_type__app_label='djangopypi'))
+        self.user = create_user('alice', groups=[self.group])
+        self.auth = basic_auth_header('alice')
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.addCleanup(setattr, conf, 'UPLOAD_STAGING_ROOT',
+                        conf.UPLOAD_STAGING_ROOT)
+        conf.UPLOAD_STAGING_ROOT = root
+        self.content = 'x' * 1000 + 'y' * 500
+
+    def tearDown(self):
+        for dist in Distribution.objects.all():
+            dist.delete()
+
+    def start(self, **fields):
+        data = {'name': 'foo', 'version': '1.0', 'metadata_version': '1.0',
+                'filetype': 'sdist', 'filename': 'foo-1.0.tar.gz',
+                'size': len(self.content),
+                'md5_digest': hashlib.md5(self.content).hexdigest()}
+        data.update(fields)
+        response = self.client.post(reverse('djangopypi-upload-start'), data,
+                                    HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.status_code, 201)
+        return json.loads(response.content)
+
+    def put(self, session, first, last):
+        return self.client.put(session['url'], self.content[first:last + 1],
+                               content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE='bytes %d-%d/%d' % (
+                                   first, last, len(self.content)),
+                               HTTP_AUTHORIZATION=self.auth)
+
+    def commit(self, session):
+        return self.client.post(session['commit_url'],
+                                HTTP_AUTHORIZATION=self.auth)
+
+    def test_upload(self):
+        session = self.start()
+        self.assertEqual(json.loads(self.put(session, 0, 999).content)
+                         ['offset'], 1000)
+        self.put(session, 1000, 1499)
+        response = self.commit(session)
+        self.assertEqual(response.status_code, 200)
+        dist = Distribution.objects.get()
+        self.assertEqual(dist.filename, 'foo-1.0.tar.gz')
+        self.assertEqual(dist.content.read(), self.content)
+        self.assertEqual(dist.md5_digest, hashlib.md5(self.content)
+                                                 .hexdigest())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(conf.UPLOAD_STAGING_ROOT), [])
+
+    def test_resume(self):
+        session = self.start()
+        self.put(session, 0, 999)
+        response = self.put(session, 500, 1499)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content)['offset'], 1000)
+        self.put(session, 1000, 1499)
+        self.assertEqual(self.commit(session).status_code, 200)
+
+    def test_chunks_received_by_another_process(self):
+        session = self.start()
+        self.put(session, 0, 999)
+        uploads._digests.clear()
+        self.put(session, 1000, 1499)
+        self.assertEqual(self.commit(session).status_code, 200)
+        self.assertEqual(Distribution.objects.get().md5_digest,
+                         hashlib.md5(self.content).hexdigest())
+
+    def test_wrong_digest(self):
+        session = self.start(md5_digest='0' * 32)
+        self.put(session, 0, 1499)
+        self.assertEqual(self.commit(session).status_code, 400)
+        self.assertFalse(Distribution.objects.exists())
+
+    def test_incomplete(self):
+        session = self.start()
+        self.put(session, 0, 999)
+        self.assertEqual(self.commit(session).status_code, 400)
+        self.assertFalse(Package.objects.exists())
+
+    def test_conflict_is_refused(self):
+        release = create_release('foo', '1.0')
+        release.package.owners.add(self.group)
+        create_distribution(release, 'foo-1.0.zip')
+        session = self.start()
+        self.put(session, 0, 1499)
+        response = self.commit(session)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue('A sdist file' in response.content)
+        self.assertEqual(Distribution.objects.count(), 1)
+        # Still staged, but the client knows not to retry
+        self.assertEqual(os.listdir(conf.UPLOAD_STAGING_ROOT),
+                         [UploadSession.objects.get().pk])
+
+    def test_file_left_over(self):
+        storage = Distribution._meta.get_field('content').storage
+        storage.save('f/foo-1.0.tar.gz', ContentFile('left over'))
+        self.addCleanup(storage.delete, 'f/foo-1.0.tar.gz')
+        session = self.start()
+        self.put(session, 0, 1499)
+        response = self.commit(session)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue('already stored' in response.content)
+        self.assertEqual(storage.listdir('f')[1], ['foo-1.0.tar.gz'])
+
+    def test_checked_on_start(self):
+        create_release('foo', '1.0').package.owners.add(
+            Group.objects.create(name='others'))
+        response = self.client.post(reverse('djangopypi-upload-start'), {
+            'name': 'foo', 'version': '1.0', 'filename': 'foo-1.0.tar.gz'},
+            HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_clean(self):
+        session = self.start()
+        self.put(session, 0, 999)
+        UploadSession.objects.update(
+            updated=datetime.datetime.now() - datetime.timedelta(days=2))
+        os.utime(uploads.staged_path(UploadSession.objects.get()), (0, 0))
+        self.assertEqual(uploads.clean(), 1)
+        self.assertEqual(os.listdir(conf.UPLOAD_STAGING_ROOT), [])
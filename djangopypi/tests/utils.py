@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User, Group
+from django.core.files.base import ContentFile
+from django.core.urlresolvers import reverse
+
+from djangopypi.models import Package, Release, Distribution
+
+def create_user(username, password='secret', groups=()):
+    user = User.objects.create_user(username, '%s@example.com' % username,
+                                    password)
+    for group in groups:
+        user.groups.add(group)
+    return user
+
+def basic_auth_header(username, password='secret'):
+    return 'Basic %s' % ('%s:%s' % (username, password)).encode('base64').strip()
+
+def create_release(name, version, package_info=None, groups=()):
+    package, created = Package.objects.get_or_create(name=name)
+    for group in groups:
+        package.download_permissions.add(group)
+    return Release.objects.create(package=package, version=version,
+                                  package_info=package_info or {})
+
+def create_distribution(release, filename, content='gibberish', uploader=None,
+                        **kwargs):
+    if uploader is None:
+        uploader = User.objects.get_or_create(username='uploader')[0]
+    dist = Distribution(release=release, uploader=uploader,
+                        filetype=kwargs.pop('filetype', 'sdist'), **kwargs)
+    dist.content.save(filename, ContentFile(content), save=False)
+    dist.save()
+    return dist
+
+BOUNDARY = '--------------GHSKFJDLGDS7543FJKLFHRE75642756743254'
+
+def post_distutils(client, fields, filename=None, content='', files=(),
+                   **extra):
+    """ POST ``fields``, a list of ``(key, value)``, and the file
+    ``filename``, or ``files``, a list of ``(filename, content)``, to the
+    index, encoded like distutils does """
+    parts = ['\n--%s\nContent-Disposition: form-data; name="%s"\n\n%s' % (
+        BOUNDARY, key, value) for key, value in fields]
+    if filename is not None:
+        files = [(filename, content)]
+    for filename, content in files:
+        parts.append('\n--%s\nContent-Disposition: form-data; '
+                     'name="content"; filename="%s"\n\n%s' % (
+                         BOUNDARY, filename, content))
+    parts.append('\n--%s--\n' % (BOUNDARY,))
+    return client.post(reverse('djangopypi-release-index'), ''.join(parts),
+                       content_type='multipart/form-data; boundary=%s' % (
+                           BOUNDARY,), **extra)
@@ -0,0 +1,97 @@
+import os
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from djangopypi import simple
+from djangopypi.feeds import ReleaseFeed
+from djangopypi.models import Package, Release
+from djangopypi.tests.utils import create_release, create_distribution
+from djangopypi.versions import parse, matches, InvalidSpecifier
+
+class TestVersionOrdering(TestCase):
+
+    def test_pep440_order(self):
+        ordered = ['1.0-foo', '1.0.dev1', '1.0a1', '1.0a2.dev1', '1.0b1',
+                   '1.0rc1', '1.0', '1.0+local', '1.0.post1.dev1', '1.0.post1',
+                   '1.1', '1.10', '2!0.1']
+        self.assertEqual([v.string for v in
+                          sorted(map(parse, reversed(ordered)))], ordered)
+
+    def test_sort_key(self):
+        ordered = ['foo', '1.0.dev1', '1.0a1', '1.0a2.dev1', '1.0rc1', '1.0',
+                   '1.0+abc', '1.0+abc.5', '1.0+abc5', '1.0+5', '1.0.post1',
+                   '1.0.1', '1.1', '1.10', '20120817', '2!0.1']
+        self.assertEqual(sorted(reversed(ordered),
+                                key=lambda v: parse(v).sort_key), ordered)
+        self.assertEqual(parse('1.0').sort_key, parse('1.0.0').sort_key)
+
+        # Collations may ignore punctuation, or order it after digits
+        for version in ordered + ['foo-1.0_rc~1', u'1.0-\xe9']:
+            self.assertTrue(parse(version).sort_key.isalnum(), version)
+        legacy = ['foo', 'foo.bar', 'foo1', 'foo.1.1', 'foobar']
+        self.assertEqual(sorted(reversed(legacy),
+                                key=lambda v: parse(v).sort_key), legacy)
+
+    def test_equivalent_forms(self):
+        self.assertEqual(parse('1.0'), parse('1.0.0'))
+        self.assertEqual(parse('1.0alpha1'), parse('1.0a1'))
+        self.assertEqual(parse('1.0-1'), parse('1.0.post1'))
+
+class TestSpecifiers(TestCase):
+
+    def test_ranges(self):
+        self.assertTrue(matches('>=1.0,<2', '1.5'))
+        self.assertFalse(matches('>=1.0,<2', '2.0'))
+        self.assertTrue(matches('', '0.1'))
+
+    def test_exclusive_ordering(self):
+        self.assertFalse(matches('<2', '2.0a1'))
+        self.assertTrue(matches('<2', '1.9a1'))
+        self.assertFalse(matches('>1.0', '1.0.post1'))
+
+    def test_compatible_release(self):
+        self.assertTrue(matches('~=1.4.2', '1.4.9'))
+        self.assertFalse(matches('~=1.4.2', '1.5'))
+
+    def test_wildcards(self):
+        self.assertTrue(matches('==1.*', '1.9'))
+        self.assertFalse(matches('==1.*', '2.0'))
+        self.assertTrue(matches('!=1.*', '2.0'))
+
+    def test_prereleases(self):
+        self.assertFalse(matches('>=1.0', '2.0b1', prereleases=False))
+        self.assertTrue(matches('>=2.0b1', '2.0b2', prereleases=False))
+
+    def test_invalid(self):
+        self.assertRaises(InvalidSpecifier, matches, '>=foo bar', '1.0')
+
+class TestReleaseOrdering(TestCase):
+
+    def setUp(self):
+        self.package = Package.objects.create(name='foo', auto_hide=False)
+        for version in ('1.9', '1.10', '1.10rc1', '1.2'):
+            create_release('foo', version)
+
+    def test_latest(self):
+        self.assertEqual(self.package.latest.version, '1.10')
+        self.assertEqual([r.version for r in self.package.releases.all()],
+                         ['1.10', '1.10rc1', '1.9', '1.2'])
+        self.assertEqual([r.version for r in
+                          ReleaseFeed().items(self.package)][:2],
+                         ['1.10', '1.10rc1'])
+
+    def test_simple_page(self):
+        for release in Release.objects.all():
+            dist = create_distribution(release, 'foo-%s.tar.gz' %
+                                       release.version)
+            self.addCleanup(dist.delete)
+        self.assertEqual([os.path.basename(row[0]) for row in
+                          simple.distribution_rows('foo')],
+                         ['foo-1.10.tar.gz', 'foo-1.10rc1.tar.gz',
+                          'foo-1.9.tar.gz', 'foo-1.2.tar.gz'])
+
+    def test_backfill(self):
+        Release.objects.update(sort_key='')
+        call_command('backfill_sort_keys')
+        self.assertEqual(self.package.latest.version, '1.10')
@@ -0,0 +1,63 @@
+from django.core.urlresolvers import reverse
+from django.template.loader import render_to_string
+from django.test import TestCase
+from django.utils import simplejson as json
+
+from djangopypi import simple, wheels
+from djangopypi.tests.utils import create_release, create_distribution
+
+class TestWheelFilenames(TestCase):
+
+    def test_parse(self):
+        self.assertEqual(wheels.parse_filename(
+            'foo_bar-1.0-2-cp27-cp27mu-manylinux1_x86_64.whl'),
+            {'name': 'foo_bar', 'version': '1.0', 'build': '2',
+             'python_tag': 'cp27', 'abi_tag': 'cp27mu',
+             'platform_tag': 'manylinux1_x86_64'})
+        self.assertEqual(wheels.parse_filename(
+            'foo-1.0-py2.py3-none-any.whl')['python_tag'], 'py2.py3')
+
+    def test_not_wheels(self):
+        self.assertEqual(wheels.parse_filename('foo-1.0.tar.gz'), None)
+        self.assertEqual(wheels.parse_filename('foo-1.0-any.whl'), None)
+
+class TestWheelDistributions(TestCase):
+
+    def setUp(self):
+        self.release = create_release('foo', '1.0',
+                                      {'requires_python': ['>=2.6, <3']})
+        self.dists = [
+            create_distribution(self.release,
+                                'foo-1.0-cp27-cp27mu-linux_x86_64.whl',
+                                pyversion='cp27'),
+            create_distribution(self.release,
+                                'foo-1.0-cp27-cp27m-macosx_10_6_intel.whl',
+                                pyversion='cp27'),
+        ]
+        for dist in self.dists:
+            self.addCleanup(dist.delete)
+
+    def test_tags(self):
+        dist = self.dists[0]
+        self.assertEqual(dist.filetype, 'bdist_wheel')
+        self.assertEqual((dist.python_tag, dist.abi_tag, dist.platform_tag),
+                         ('cp27', 'cp27mu', 'linux_x86_64'))
+        self.assertEqual(self.release.distributions
+                                     .filter(platform_tag='linux_x86_64')
+                                     .count(), 1)
+
+    def test_json_document(self):
+        response = self.client.get(reverse('djangopypi-release-json',
+                                           kwargs={'package': 'foo',
+                                                   'version': '1.0'}))
+        urls = json.loads(response.content)['urls']
+        self.assertEqual([(u['packagetype'], u['abi_tag']) for u in urls],
+                         [('bdist_wheel', 'cp27mu'), ('bdist_wheel', 'cp27m')])
+
+    def test_simple_pages(self):
+        files = json.loads(simple.detail_json(
+            'foo', simple.distribution_rows('foo')))['files']
+        self.assertEqual(files[0]['requires-python'], '>=2.6, <3')
+        html = render_to_string('djangopypi/package_detail_simple.html',
+                                {'package': self.release.package})
+        self.assertTrue('data-requires-python="&gt;=2.6, &lt;3"' in html)
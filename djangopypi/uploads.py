@@ -0,0 +1,168 @@
+""" Resumable uploads of large files. A client starts a session, sends the
+file in chunks, each written to a staged file of ``UPLOAD_STAGING_ROOT`` at
+the offset where the bytes received so far end, then commits it. When a
+chunk fails, the client asks for the offset and resumes from there rather
+than sending the whole file again.
+
+The md5 of a file is computed as its chunks arrive, by the process receiving
+them, and computed again on commit only when its chunks went to several
+processes. Committing gives the staged file to the storage of distributions,
+which moves it: a rename when both are on the same file system.
+``manage.py clean_uploads`` removes the sessions that were not used for
+``UPLOAD_SESSION_TTL`` seconds, and their files. """
+from __future__ import with_statement
+
+import datetime
+import fcntl
+import hashlib
+import os
+import threading
+import time
+
+from django.core.files import File
+
+from djangopypi import conf
+from djangopypi.models import UploadSession
+
+# How much of a chunk is read from the request at once
+CHUNK_SIZE = 64 * 1024
+
+# The md5 of the staged files this process received every chunk of, by
+# session, with the offset they were hashed up to
+_digests = {}
+_lock = threading.Lock()
+
+class OffsetMismatch(Exception):
+    """ A chunk does not start where the bytes received so far end """
+
+    def __init__(self, offset):
+        Exception.__init__(self, offset)
+        self.offset = offset
+
+def staging_root():
+    """ Where the files being uploaded are staged, next to the files of the
+    distributions unless ``UPLOAD_STAGING_ROOT`` is set, so that committing
+    them is a rename """
+    root = conf.UPLOAD_STAGING_ROOT or \
+           os.path.abspath(conf.RELEASE_UPLOAD_TO).rstrip('/') + '-staging'
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    return root
+
+def staged_path(session):
+    return os.path.join(staging_root(), session.pk)
+
+def append(session, offset, read, length):
+    """ Write the ``length`` bytes of a chunk, read with ``read``, at
+    ``offset`` of the staged file of ``session``, and return the offset the
+    next chunk starts at. The bytes received before a client went away are
+    kept, and the next chunk starts after them. """
+    if session.size is not None and offset + length > session.size:
+        raise ValueError('The chunk ends after the %d bytes of the file' % (
+            session.size,))
+    f = os.fdopen(os.open(staged_path(session), os.O_RDWR | os.O_CREAT,
+                          0640), 'r+b')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        # Another request may have written a chunk meanwhile
+        current = list(UploadSession.objects.filter(pk=session.pk)
+                                            .values_list('offset', flat=True))
+        if not current:
+            raise UploadSession.DoesNotExist()
+        if current[0] != offset:
+            raise OffsetMismatch(current[0])
+
+        with _lock:
+            known = _digests.pop(session.pk, None)
+        if offset == 0:
+            digest = hashlib.md5()
+        elif known is not None and known[0] == offset:
+            digest = known[1]
+        else:
+            digest = None
+
+        # Drop what was written after the last recorded offset
+        f.seek(offset)
+        f.truncate()
+        received = 0
+        try:
+            while received < length:
+                data = read(min(CHUNK_SIZE, length - received))
+                if not data:
+                    break
+                f.write(data)
+                if digest is not None:
+                    digest.update(data)
+                received += len(data)
+        finally:
+            f.flush()
+            offset += received
+            UploadSession.objects.filter(pk=session.pk).update(
+                offset=offset, updated=datetime.datetime.now())
+            if digest is not None:
+                with _lock:
+                    _digests[session.pk] = (offset, digest)
+        session.offset = offset
+        return offset
+    finally:
+        f.close()
+
+def digest(session):
+    """ The md5 of the staged file of ``session`` """
+    with _lock:
+        known = _digests.get(session.pk)
+    if known is not None and known[0] == session.offset:
+        return known[1].hexdigest()
+    digest = hashlib.md5()
+    with open(staged_path(session), 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), ''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class StagedFile(File):
+    """ The staged file of a session, named like the distribution it becomes.
+    Storages move it rather than copy it, like a temporary uploaded file. """
+
+    def __init__(self, session):
+        self.path = staged_path(session)
+        File.__init__(self, open(self.path, 'rb'), session.filename)
+        # Asked once the file was moved
+        self.size = os.path.getsize(self.path)
+
+    def temporary_file_path(self):
+        return self.path
+
+def discard(session):
+    """ Remove ``session`` and its staged file """
+    with _lock:
+        _digests.pop(session.pk, None)
+    try:
+        os.remove(staged_path(session))
+    except OSError:
+        pass
+    UploadSession.objects.filter(pk=session.pk).delete()
+
+def clean(max_age=None):
+    """ Remove the sessions that were not used for ``max_age`` seconds,
+    ``UPLOAD_SESSION_TTL`` by default, and the staged files without a
+    session. Returns the number of sessions removed. """
+    if max_age is None:
+        max_age = conf.UPLOAD_SESSION_TTL
+    limit = datetime.datetime.now() - datetime.timedelta(seconds=max_age)
+    expired = UploadSession.objects.filter(updated__lt=limit)
+    removed = expired.count()
+    expired.delete()
+
+    # Files are staged after their session is created, so only the old ones
+    # can be left over
+    root = staging_root()
+    sessions = set(UploadSession.objects.values_list('pk', flat=True))
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if name not in sessions and \
+               os.path.getmtime(path) < time.time() - max_age:
+                os.remove(path)
+        except OSError:
+            pass
+    return removed
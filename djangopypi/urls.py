@@ -9,14 +9,31 @@ urlpatterns = patterns("djangopypi.views",
     url(r'^simple/$','packages.simple_index', name='djangopypi-package-index-simple'),
     url(r'^bootstrap/$', 'releases.bootstrap_index', name='djangopypi-bootstrap-index-simple'),
     url(r'^search/$','packages.search',name='djangopypi-search'),
+    url(r'^resolve/$','packages.resolve',name='djangopypi-resolve'),
     url(r'^pypi/$', 'root', name='djangopypi-release-index'),
     url(r'^rss/$', ReleaseFeed(), name='djangopypi-rss'),
+    url(r'^uploads/$', 'uploads.start', name='djangopypi-upload-start'),
+    url(r'^uploads/(?P<session_id>[0-9a-f]{32})/$', 'uploads.session',
+        name='djangopypi-upload-session'),
+    url(r'^uploads/(?P<session_id>[0-9a-f]{32})/commit/$', 'uploads.commit',
+        name='djangopypi-upload-commit'),
+    url(r'^metrics/$', 'metrics.prometheus', name='djangopypi-metrics'),
+    url(r'^metrics/recent/$', 'metrics.recent',
+        name='djangopypi-metrics-recent'),
+    url(r'^classifiers/$', 'classifiers.index',
+        name='djangopypi-classifier-index'),
+    url(r'^classifiers/(?P<classifier>.+)/$', 'classifiers.details',
+        name='djangopypi-classifier'),
     
     url(r'^simple/(?P<package>[\w\d_\.\-]+)/$','packages.simple_details',
         name='djangopypi-package-simple'),
     
     url(r'^pypi/(?P<package>[\w\d_\.\-]+)/$','packages.details',
         name='djangopypi-package'),
+    url(r'^pypi/(?P<package>[\w\d_\.\-]+)/json$','packages.json_details',
+        name='djangopypi-package-json'),
+    url(r'^pypi/(?P<package>[\w\d_\.\-]+)/dependents/json$',
+        'packages.dependents_json', name='djangopypi-package-dependents'),
     #url(r'^pypi/(?P<package>[\w\d_\.\-]+)/rss/$', ReleaseFeed(),
     #    name='djangopypi-package-rss'),
     url(r'^pypi/(?P<package>[\w\d_\.\-]+)/doap.rdf$','packages.doap',
@@ -28,6 +45,10 @@ urlpatterns = patterns("djangopypi.views",
     
     url(r'^pypi/(?P<package>[\w\d_\.\-]+)/(?P<version>[\w\d_\.\-]+)/$',
         'releases.details',name='djangopypi-release'),
+    url(r'^pypi/(?P<package>[\w\d_\.\-]+)/(?P<version>[\w\d_\.\-]+)/json$',
+        'releases.json_details',name='djangopypi-release-json'),
+    url(r'^pypi/(?P<package>[\w\d_\.\-]+)/(?P<version>[\w\d_\.\-]+)/dependencies/json$',
+        'releases.dependencies_json',name='djangopypi-release-dependencies'),
     url(r'^pypi/(?P<package>[\w\d_\.\-]+)/(?P<version>[\w\d_\.\-]+)/doap.rdf$',
         'releases.doap',name='djangopypi-release-doap'),
     url(r'^pypi/(?P<package>[\w\d_\.\-]+)/(?P<version>[\w\d_\.\-]+)/manage/$',
@@ -0,0 +1,272 @@
+""" Version numbers and version specifiers (PEP 440).
+
+Parsed versions compare by a tuple key. Strings that are not valid PEP 440
+versions are still accepted, and sort before every valid version, as they do
+in pip. Parsing is memoized, since the same few thousand version strings are
+compared over and over. """
+import re
+
+VERSION_RE = re.compile(r'''
+    ^\s*v?
+    (?:(?P<epoch>[0-9]+)!)?
+    (?P<release>[0-9]+(?:\.[0-9]+)*)
+    (?P<pre>[-_.]?(?P<pre_l>a|b|c|rc|alpha|beta|pre|preview)[-_.]?(?P<pre_n>[0-9]+)?)?
+    (?P<post>(?:-(?P<post_n1>[0-9]+))|(?:[-_.]?(?P<post_l>post|rev|r)[-_.]?(?P<post_n2>[0-9]+)?))?
+    (?P<dev>[-_.]?dev[-_.]?(?P<dev_n>[0-9]+)?)?
+    (?:\+(?P<local>[a-z0-9]+(?:[-_.][a-z0-9]+)*))?
+    \s*$
+''', re.VERBOSE | re.IGNORECASE)
+
+SPECIFIER_RE = re.compile(r'^\s*(~=|===|==|!=|<=|>=|<|>)?\s*(\S+?)\s*$')
+
+PRE_RELEASE_ORDER = {'a': 0, 'alpha': 0, 'b': 1, 'beta': 1,
+                     'c': 2, 'rc': 2, 'pre': 2, 'preview': 2}
+
+# Stand in for the infinities of the comparison key
+_NONE_BEFORE = -1
+_NONE_AFTER = 1 << 62
+
+_MEMO_SIZE = 100000
+
+SORT_KEY_LENGTH = 255
+_memo = {}
+_specifier_memo = {}
+
+class InvalidSpecifier(ValueError):
+    pass
+
+class Version(object):
+    __slots__ = ('string', 'valid', 'epoch', 'release', 'pre', 'post', 'dev',
+                 'local', 'key')
+
+    def __init__(self, string):
+        self.string = string
+        match = VERSION_RE.match(string)
+        self.valid = match is not None
+        if not self.valid:
+            self.epoch, self.release = -1, ()
+            self.pre = self.post = self.dev = None
+            self.local = ()
+            self.key = (-1, tuple(_legacy_parts(string)))
+            return
+
+        self.epoch = int(match.group('epoch') or 0)
+        self.release = tuple(int(part) for part in
+                             match.group('release').split('.'))
+        self.pre = None
+        if match.group('pre'):
+            self.pre = (PRE_RELEASE_ORDER[match.group('pre_l').lower()],
+                        int(match.group('pre_n') or 0))
+        self.post = None
+        if match.group('post'):
+            self.post = int(match.group('post_n1') or
+                            match.group('post_n2') or 0)
+        self.dev = None
+        if match.group('dev'):
+            self.dev = int(match.group('dev_n') or 0)
+        self.local = ()
+        if match.group('local'):
+            self.local = tuple(_local_part(part) for part in
+                               re.split(r'[-_.]', match.group('local')))
+
+        release = list(self.release)
+        while len(release) > 1 and release[-1] == 0:
+            release.pop()
+        if self.pre is not None:
+            pre = self.pre
+        elif self.post is None and self.dev is not None:
+            # 1.0.dev1 comes before 1.0a1
+            pre = (_NONE_BEFORE, 0)
+        else:
+            pre = (_NONE_AFTER, 0)
+        self.key = (self.epoch, tuple(release), pre,
+                    _NONE_BEFORE if self.post is None else self.post,
+                    _NONE_AFTER if self.dev is None else self.dev,
+                    self.local)
+
+    @property
+    def is_prerelease(self):
+        return self.pre is not None or self.dev is not None
+
+    @property
+    def public_key(self):
+        """ The comparison key without the local version label """
+        return self.key[:5] + ((),)
+
+    @property
+    def sort_key(self):
+        """ A string that sorts like the version, for an indexed column. It
+        only holds digits and lower case letters, so that it sorts the same
+        under any collation: numbers are zero-padded to fixed widths, each
+        release segment follows a 1 and the last one is followed by a 0, so
+        1 comes before 1.1. """
+        if not self.valid:
+            return ('0' + ''.join(_encode_part(part)
+                                  for part in self.key[1]))[:SORT_KEY_LENGTH]
+        epoch, release, pre, post, dev, local = self.key
+        if pre[0] == _NONE_BEFORE:
+            pre_key = '0'
+        elif pre[0] == _NONE_AFTER:
+            pre_key = '4'
+        else:
+            pre_key = '%d%s' % (pre[0] + 1, _padded_number(pre[1]))
+        key = '1%s%s0%s%s%s%s' % (
+            _padded_number(epoch, 4),
+            ''.join('1' + _padded_number(part) for part in release),
+            pre_key,
+            '0' if post == _NONE_BEFORE else '1' + _padded_number(post),
+            '1' if dev == _NONE_AFTER else '0' + _padded_number(dev),
+            ''.join(_encode_part(part) for part in local))
+        return key[:SORT_KEY_LENGTH]
+
+    def __cmp__(self, other):
+        return cmp(self.key, other.key)
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return '<Version %r>' % (self.string,)
+
+def _padded_number(number, width=8):
+    return '%0*d' % (width, min(number, 10 ** width - 1))
+
+def _encode_part(part):
+    """ Encode a ``(is_number, number, text)`` part of a local or legacy
+    version, letters sorting before numbers. Text is written as the hex
+    digits of its UTF-8 bytes followed by 00, which sorts before any byte, so
+    that a part sorts before the longer parts it starts. """
+    if part[0]:
+        return 'n' + _padded_number(part[1])
+    text = part[2]
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return 'a' + text.encode('hex') + '00'
+
+def _local_part(part):
+    if part.isdigit():
+        return (1, int(part), '')
+    return (0, 0, part.lower())
+
+def _legacy_parts(string):
+    for part in re.split(r'(\d+|[a-z]+|\.|-)', string.lower()):
+        if not part or part in '.-':
+            continue
+        if part.isdigit():
+            yield (1, int(part), '')
+        else:
+            yield (0, 0, part)
+
+def parse(string):
+    """ The ``Version`` of ``string``, memoized """
+    try:
+        return _memo[string]
+    except KeyError:
+        pass
+    if len(_memo) >= _MEMO_SIZE:
+        _memo.clear()
+    version = _memo[string] = Version(string)
+    return version
+
+def _padded(release, length):
+    return tuple(release) + (0,) * (length - len(release))
+
+def _clause_matches(operator, spec, version):
+    if operator == '===':
+        return version.string.strip().lower() == spec.lower()
+
+    if operator in ('==', '!=') and spec.endswith('.*'):
+        prefix = parse(spec[:-2])
+        if not prefix.valid:
+            raise InvalidSpecifier(spec)
+        length = len(prefix.release)
+        matched = (version.valid and version.epoch == prefix.epoch and
+                   _padded(version.release, length)[:length] ==
+                   prefix.release)
+        return matched == (operator == '==')
+
+    target = parse(spec)
+    if not target.valid:
+        raise InvalidSpecifier(spec)
+    if not version.valid:
+        return False
+
+    if operator in ('==', '!='):
+        if target.local:
+            matched = version.key == target.key
+        else:
+            matched = version.public_key == target.key
+        return matched == (operator == '==')
+
+    key = version.public_key
+    if operator == '>=':
+        return key >= target.key
+    if operator == '<=':
+        return key <= target.key
+    if operator == '<':
+        if not key < target.key:
+            return False
+        # <1.0 does not match 1.0a1, unless it was <1.0b1
+        return (target.is_prerelease or not version.is_prerelease or
+                _padded(version.release, len(target.release)) !=
+                _padded(target.release, len(version.release)))
+    if operator == '>':
+        if not key > target.key:
+            return False
+        # >1.0 does not match 1.0.post1, unless it was >1.0.post0
+        return (target.post is not None or version.post is None or
+                _padded(version.release, len(target.release)) !=
+                _padded(target.release, len(version.release)))
+    if operator == '~=':
+        if len(target.release) < 2:
+            raise InvalidSpecifier(spec)
+        length = len(target.release) - 1
+        return (key >= target.key and version.epoch == target.epoch and
+                _padded(version.release, length)[:length] ==
+                target.release[:length])
+    raise InvalidSpecifier(operator)
+
+def parse_specifier(specifier):
+    """ ``(operator, version)`` for each clause of ``specifier``, such as
+    ``>=1.0,<2``. A bare version is taken to mean ``==``. Memoized like
+    ``parse``. """
+    try:
+        return _specifier_memo[specifier]
+    except KeyError:
+        pass
+    if len(_specifier_memo) >= _MEMO_SIZE:
+        _specifier_memo.clear()
+    clauses = _specifier_memo[specifier] = _parse_specifier(specifier)
+    return clauses
+
+def _parse_specifier(specifier):
+    clauses = []
+    for clause in specifier.split(','):
+        if not clause.strip():
+            continue
+        match = SPECIFIER_RE.match(clause)
+        if not match:
+            raise InvalidSpecifier(clause)
+        operator, spec = match.group(1) or '==', match.group(2)
+        if operator != '===':
+            wildcard = spec.endswith('.*') and operator in ('==', '!=')
+            if not parse(spec[:-2] if wildcard else spec).valid:
+                raise InvalidSpecifier(clause)
+        clauses.append((operator, spec))
+    return tuple(clauses)
+
+def matches(specifier, version, prereleases=True):
+    """ Whether the version string ``version`` satisfies ``specifier``. With
+    ``prereleases`` false, pre-releases only match when a clause of the
+    specifier names one. """
+    if isinstance(version, basestring):
+        version = parse(version)
+    clauses = parse_specifier(specifier)
+    if not prereleases and version.is_prerelease and \
+       not any(parse(spec.rstrip('.*')).is_prerelease
+               for operator, spec in clauses):
+        return False
+    for operator, spec in clauses:
+        if not _clause_matches(operator, spec, version):
+            return False
+    return True
@@ -0,0 +1,33 @@
+from django.shortcuts import get_object_or_404, render_to_response
+from django.template import RequestContext
+from django.views.generic import list_detail
+from django.contrib.auth.views import redirect_to_login
+
+from djangopypi import classifiers
+from djangopypi.models import Classifier, Package
+
+def index(request, **kwargs):
+    if not request.user.is_authenticated():
+        return redirect_to_login(request.get_full_path())
+    kwargs.setdefault('template_name', 'djangopypi/classifier_list.html')
+
+    classifier_list = [{'name': name, 'packages': count}
+                       for name, count in classifiers.counts(request.user)]
+    return render_to_response(kwargs['template_name'],
+                              {'classifier_list': classifier_list},
+                              context_instance=RequestContext(request))
+
+def details(request, classifier, **kwargs):
+    if not request.user.is_authenticated():
+        return redirect_to_login(request.get_full_path())
+    classifier = get_object_or_404(Classifier, name=classifier)
+
+    releases = classifiers.visible_releases(request.user) \
+                          .filter(classifiers=classifier)
+    kwargs.setdefault('template_name', 'djangopypi/classifier_detail.html')
+    kwargs.setdefault('template_object_name', 'package')
+    kwargs.setdefault('queryset', Package.objects.filter(
+        name__in=releases.values('package')))
+    kwargs.setdefault('extra_context', {})
+    kwargs['extra_context']['classifier'] = classifier
+    return list_detail.object_list(request, **kwargs)
@@ -1,8 +1,12 @@
+import Queue
+import hashlib
 import os
+import sys
 import textwrap
+import threading
 
 from django.conf import settings
-from django.db import transaction
+from django.db import IntegrityError
 from django.http import HttpResponseForbidden, HttpResponseBadRequest, \
                         HttpResponse
 from django.core.urlresolvers import reverse
@@ -10,17 +14,15 @@ from django.utils.translation import ugettext_lazy as _
 from django.utils.datastructures import MultiValueDict
 from django.contrib.sites.models import Site
 
-from djangopypi import conf
+from djangopypi import conf, coremetadata, deferred, events, wheels
 from djangopypi.decorators import basic_auth
 from djangopypi.forms import PackageForm, ReleaseForm
-from djangopypi.models import Package, Release, Distribution, Classifier
-import logging
-
-from datetime import datetime
-
-# Get an instance of a logger
-logger = logging.getLogger(__name__)
-
+from djangopypi.metrics import instrument
+from djangopypi.models import Package, Release, Distribution, Classifier, \
+                              FileNameTaken
+CONFLICT_FMT = (
+    "package:%s version%s. A %s file of the same python version and tags was "
+    "already uploaded.")
 ALREADY_EXISTS_FMT = _(
     "A file named '%s' already exists for %s. Please create a new release.")
 
@@ -75,95 +77,180 @@ def submit_package_or_release(user, post_data, files):
 
     return HttpResponse()
 
-@basic_auth
-@transaction.autocommit
-def register_or_upload(request):
+def refuse(request, response_class, reason, **fields):
+    """ Record why an upload was refused, and tell the client """
+    events.emit('upload_refused', request, reason=reason, **fields)
+    return response_class(reason)
 
-    username = request.user.username
-    
-    if request.method != 'POST':
-        logger.info('user:%s. Only post requests are supported.' % (username))
-        return HttpResponseBadRequest('Only post requests are supported.')
+class UploadRefused(Exception):
+    """ Raised by the checks of an upload, with the response to refuse it
+    with """
 
-    name = request.POST.get('name',None).strip()
-    
-    if not name:
-        logger.info('user:%s. No package name specified.' % (username))
-        return HttpResponseBadRequest('No package name specified.')
+    def __init__(self, response_class, reason, **fields):
+        Exception.__init__(self, reason)
+        self.response_class = response_class
+        self.reason = reason
+        self.fields = fields
 
-    # get group of user
-    try:
-        group = request.user.groups.get()
-    except:
-        logger.info('Not allowing package to be uploaded: %s should only be in one group.' % (username))
-        return HttpResponseForbidden('Not allowing package to be uploaded: %s should only be in one group.' % (username))
-        
-    if not group:
-        logger.info('%s is not in a group, not allowing package to be uploaded.' % (username))
-        return HttpResponseForbidden('%s is not in a group, not allowing package to be uploaded.' % (username))
+def upload_digest(uploaded):
+    """ The md5 of an uploaded file, for clients that do not send it """
+    digest = hashlib.md5()
+    for chunk in uploaded.chunks():
+        digest.update(chunk)
+    uploaded.seek(0)
+    return digest.hexdigest()
+
+def upload_digests(files):
+    """ The md5 of each of ``files``, hashed by up to ``UPLOAD_HASH_THREADS``
+    threads, as hashlib lets other threads run while it hashes a chunk """
+    pending = Queue.Queue()
+    for index in range(len(files)):
+        pending.put(index)
+    digests = [None] * len(files)
+    errors = []
+
+    def work():
+        while True:
+            try:
+                index = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                digests[index] = upload_digest(files[index])
+            except Exception:
+                errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=work, name='djangopypi-hash')
+               for i in range(min(conf.UPLOAD_HASH_THREADS, len(files)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+    return digests
+
+def check_uploader(request, name):
+    """ The id and name of the group of the user, and the package ``name``
+    when it exists, after checking that the group can upload it """
+    username = request.user.username
+
+    # get the group of the user, and its permissions, at once
+    groups = {}
+    for group_id, group_name, codename in request.user.groups.values_list(
+            'pk', 'name', 'permissions__codename'):
+        groups.setdefault((group_id, group_name), set()).add(codename)
+    if len(groups) != 1:
+        raise UploadRefused(HttpResponseForbidden,
+                            'Not allowing package to be uploaded: %s should '
+                            'only be in one group.' % (username), package=name)
+    (group_id, group_name), codenames = groups.popitem()
 
     # check group can upload
-    if not 'add_package' in [ perm.codename for perm in group.permissions.all()]:
-        logger.info("%s's group - %s does not have permissions to upload new packages." % (username, group.name))
-        return HttpResponseForbidden("%s's group - %s does not have permissions to upload new packages." % (username, group.name))
+    if not 'add_package' in codenames:
+        raise UploadRefused(HttpResponseForbidden,
+                            "%s's group - %s does not have permissions to "
+                            "upload new packages." % (username, group_name),
+                            package=name)
     
-    # fetch existing package or create new one
     try:
         package = Package.objects.get(name=name)
-        created_package = False
     except Package.DoesNotExist:
-        package = Package.objects.create(name=name)
-        package.owners.add(request.user.groups.all()[0])
-        package.download_permissions.add(request.user.groups.all()[0])
-        created_package = True
+        package = None
         
-    if not request.user.is_superuser:
-        if not group in package.owners.all():
-            logger.info(
-                "'%s' is in the group '%s', only members of '%s' can upload new " \
-                "versions of this package." % (
-                    username,
-                    group.name,
-                    ",".join([p.name for p in package.owners.all()]),
-                )
-            )
-            return HttpResponseForbidden(
+    if package is not None and not request.user.is_superuser:
+        owners = dict(package.owners.values_list('pk', 'name'))
+        if not group_id in owners:
+            raise UploadRefused(HttpResponseForbidden,
                 "'%s' is in the group '%s', only members of '%s' can upload " \
                 "new versions of this package." % (
                     username,
-                    ",".join([p.name for p in package.owners.all()]),
-                    group.name
-                )
-            )
-    
-    version = request.POST.get('version', None)
+                    group_name,
+                    ",".join(sorted(owners.values())),
+                ), package=name)
+    return group_id, group_name, package
+
+def check_release(data, package, name):
+    """ The version and metadata version of the release being uploaded, from
+    the fields ``data``, and the release when it exists """
+    version = data.get('version', None)
     if version:
         version = version.strip()
-    
-    release, created = Release.objects.get_or_create(package=package,
-                                                     version=version)
 
-    metadata_version = request.POST.get('metadata_version', None)
-    if not metadata_version:
+    try:
+        release = package.releases.get(version=version)
+        release.package = package
+    except (AttributeError, Release.DoesNotExist):
+        release = None
+
+    metadata_version = data.get('metadata_version', None)
+    if not metadata_version and release is not None:
         metadata_version = release.metadata_version
 
     if metadata_version:
         metadata_version = metadata_version.strip()
     
     if not version or not metadata_version:
-        transaction.rollback()
-        logger.info('user:%s. Release version and metadata version must be specified' % (username))
-        return HttpResponseBadRequest('Release version and metadata version must be specified')
+        raise UploadRefused(HttpResponseBadRequest,
+                            'Release version and metadata version must be '
+                            'specified', package=name, version=version)
     
     if not metadata_version in conf.METADATA_FIELDS:
-        transaction.rollback()
-        logger.info('user:%s. Metadata version must be one of: %s' 
-                                      (username, ', '.join(conf.METADATA_FIELDS.keys()),))
-        return HttpResponseBadRequest('Metadata version must be one of: %s' 
-                                      (', '.join(conf.METADATA_FIELDS.keys()),))
-    
+        raise UploadRefused(HttpResponseBadRequest,
+                            'Metadata version must be one of: %s' % (
+                                ', '.join(conf.METADATA_FIELDS.keys()),),
+                            package=name, version=version)
+    return release, version, metadata_version
+
+def check_files(names, name, version):
+    """ Check that files named ``names`` can be stored, with a single query
+    however many there are """
+    filenames = []
+    for filename in names:
+        if wheels.is_wheel(filename) and \
+           wheels.parse_filename(filename) is None:
+            raise UploadRefused(HttpResponseBadRequest,
+                                'Invalid wheel file name: %s' % (filename,),
+                                package=name, version=version,
+                                filename=filename)
+
+        # Files of every package share a directory, so a name is only used
+        # once
+        path = Distribution._meta.get_field('content').generate_filename(
+            None, filename)
+        filenames.append(os.path.basename(path))
+
+    if len(set(filenames)) != len(filenames):
+        raise UploadRefused(HttpResponseBadRequest,
+                            'package:%s version%s. The same file is uploaded '
+                            'more than once.' % (name, version),
+                            package=name, version=version)
+    if len(filenames) == 1:
+        exists = Distribution.objects.filter(filename=filenames[0]).exists()
+    else:
+        exists = Distribution.objects.filter(filename__in=filenames).exists()
+    if exists:
+        """ Need to add handling optionally deleting old and putting up new """
+        raise UploadRefused(HttpResponseBadRequest,
+                            'package:%s version%s. That file has already been '
+                            'uploaded.' % (name, version),
+                            package=name, version=version,
+                            filename=', '.join(names))
+
+def save_release(data, package, release, name, version, metadata_version,
+                 group_id):
+    """ Create the package and the release when they do not exist, and update
+    the metadata of the release from the fields ``data``. Only called once
+    every check passed. """
+    if package is None:
+        package = Package.objects.create(name=name)
+        package.owners.add(group_id)
+        package.download_permissions.add(group_id)
+
+    if release is None:
+        release = Release(package=package, version=version)
     
-    if (('classifiers' in request.POST or 'download_url' in request.POST) and 
+    if (('classifiers' in data or 'download_url' in data) and 
         metadata_version == '1.0'):
         metadata_version = '1.1'
     
@@ -171,11 +258,11 @@ def register_or_upload(request):
     
     fields = conf.METADATA_FIELDS[metadata_version]
     
-    if 'classifiers' in request.POST:
-        request.POST.setlist('classifier',request.POST.getlist('classifiers'))
+    if 'classifiers' in data:
+        data.setlist('classifier',data.getlist('classifiers'))
     
     package_info = MultiValueDict(dict(filter(lambda t: t[0] in fields,
-                                                      request.POST.iterlists())))
+                                                      data.iterlists())))
     if package_info:
         release.package_info = package_info
     
@@ -184,37 +271,29 @@ def register_or_upload(request):
                                      filter(lambda v: v != 'UNKNOWN', value))
     
     release.save()
-    if not 'content' in request.FILES:
-        transaction.commit()
-        logger.info('release registered')
-        return HttpResponse('release registered')
-    
-    uploaded = request.FILES.get('content')
-    
-    for dist in release.distributions.all():
-        if os.path.basename(dist.content.name) == uploaded.name:
-            """ Need to add handling optionally deleting old and putting up new """
-            transaction.rollback()
-            logger.info('user:%s package:%s. That file has already been uploaded.' % (username, package.name))
-            return HttpResponseBadRequest('package:%s version%s. That file has already been uploaded.' % (package.name, version))
-
-    md5_digest = request.POST.get('md5_digest','')
-    
-    try:
-        new_file = Distribution.objects.create(release=release,
-                                               content=uploaded,
-                                               filetype=request.POST.get('filetype','sdist'),
-                                               pyversion=request.POST.get('pyversion',''),
-                                               uploader=request.user,
-                                               comment=request.POST.get('comment',''),
-                                               signature=request.POST.get('gpg_signature',''),
-                                               md5_digest=md5_digest)
-    except Exception, e:
-        transaction.rollback()
-        raise
-    
-    transaction.commit()
-    logger.info('user:%s package:%s version:%s uploaded:%s' % (username, package.name, version, datetime.strftime(datetime.now(), '%Y-%m-%d %H:%M:%S')))
+    return package, release
+
+def conflict_reason(error, name, version, new_files):
+    """ Why saving ``new_files`` failed with ``error``, when it is because of
+    other files, None otherwise """
+    if isinstance(error, FileNameTaken):
+        return 'package:%s version%s. %s' % (name, version, error)
+    if isinstance(error, IntegrityError):
+        if len(new_files) == 1:
+            return CONFLICT_FMT % (name, version, new_files[0].filetype)
+        return 'package:%s version%s. Two files have the same type, python ' \
+               'version and tags.' % (name, version)
+    return None
+
+def remove_stored(new_files):
+    """ Remove the files, and their metadata, stored for ``new_files`` whose
+    rows were rolled back """
+    for new_file in new_files:
+        if new_file.content._committed:
+            coremetadata.delete(new_file)
+            new_file.content.storage.delete(new_file.content.name)
+
+def upload_accepted(request, package, group_name, created_package):
     if created_package:
         return HttpResponse(textwrap.dedent('''
             Upload accepted. Added new package %(package_name)s.
@@ -225,9 +304,7 @@ def register_or_upload(request):
             ''' % {
                 'package_name': package.name,
                 'package_url': request.build_absolute_uri(package.get_absolute_url()),
-                'groups': ','.join(
-                    g.name for g in package.download_permissions.all()
-                ),
+                'groups': group_name,
                 'admin_url': request.build_absolute_uri(reverse(
                     'admin:djangopypi_package_change',
                     args=(package.name,))
@@ -236,8 +313,165 @@ def register_or_upload(request):
         ))
     else:
         return HttpResponse('\nUpload accepted.\n')
+
+@instrument()
+@basic_auth
+@deferred.commit_on_success
+def register_or_upload(request):
+    """ Register a release and upload a file, with a number of queries that
+    does not depend on the releases and files of the package. Everything is
+    checked before anything is written, in a single transaction. """
+
+    if request.method != 'POST':
+        return refuse(request, HttpResponseBadRequest,
+                      'Only post requests are supported.')
+
+    name = request.POST.get('name', '').strip()
+    
+    if not name:
+        return refuse(request, HttpResponseBadRequest,
+                      'No package name specified.')
+
+    uploaded = request.FILES.get('content')
+    try:
+        group_id, group_name, package = check_uploader(request, name)
+        release, version, metadata_version = check_release(request.POST,
+                                                           package, name)
+        if uploaded is not None:
+            check_files([uploaded.name], name, version)
+    except UploadRefused, e:
+        return refuse(request, e.response_class, e.reason, **e.fields)
+
+    # Everything was checked, from here on the request only writes
+    created_package = package is None
+    package, release = save_release(request.POST, package, release, name,
+                                    version, metadata_version, group_id)
+    if uploaded is None:
+        events.emit('register', request, package=package.name,
+                    version=version)
+        return HttpResponse('release registered')
+
+    new_file = Distribution(release=release,
+                            content=uploaded,
+                            filetype=request.POST.get('filetype','sdist'),
+                            pyversion=request.POST.get('pyversion',''),
+                            uploader=request.user,
+                            comment=request.POST.get('comment',''),
+                            signature=request.POST.get('gpg_signature',''),
+                            md5_digest=request.POST.get('md5_digest','') or
+                                       upload_digest(uploaded))
+    try:
+        new_file.save()
+    except Exception, e:
+        deferred.rollback()
+        remove_stored([new_file])
+        reason = conflict_reason(e, name, version, [new_file])
+        if reason is None:
+            raise
+        return refuse(request, HttpResponseBadRequest, reason,
+                      package=name, version=version,
+                      filename=uploaded.name)
     
+    events.emit('upload', request, package=package.name, version=version,
+                filename=new_file.filename, md5_digest=new_file.md5_digest)
+    return upload_accepted(request, package, group_name, created_package)
+
+def file_fields(request, key, count, default=''):
+    """ The values of the field ``key`` for each of ``count`` files: a field
+    given once is shared by every file, otherwise it is given once per file,
+    in the order of the files """
+    values = request.POST.getlist(key)
+    if not values:
+        return [default] * count
+    if len(values) == 1:
+        return values * count
+    if len(values) != count:
+        raise UploadRefused(HttpResponseBadRequest,
+                            '%s must be given once, or once for each of the '
+                            '%d files.' % (key, count),
+                            package=request.POST.get('name'),
+                            version=request.POST.get('version'))
+    return values
+
+@instrument()
+@basic_auth
+@deferred.commit_on_success
+def batch_upload(request):
+    """ Register a release and upload several of its files at once, e.g. the
+    builds of every platform. The request is like a ``file_upload`` one, with
+    a ``content`` file per distribution. Every file is checked, and hashed in
+    parallel, before any is stored, and either all of them are uploaded or
+    none is. """
+
+    if request.method != 'POST':
+        return refuse(request, HttpResponseBadRequest,
+                      'Only post requests are supported.')
+
+    name = request.POST.get('name', '').strip()
+    if not name:
+        return refuse(request, HttpResponseBadRequest,
+                      'No package name specified.')
+
+    files = request.FILES.getlist('content')
+    if not files:
+        return refuse(request, HttpResponseBadRequest,
+                      'No files to upload.', package=name)
+
+    try:
+        group_id, group_name, package = check_uploader(request, name)
+        release, version, metadata_version = check_release(request.POST,
+                                                           package, name)
+        check_files([f.name for f in files], name, version)
+        fields = dict((key, file_fields(request, key, len(files), default))
+                      for key, default in (('filetype', 'sdist'),
+                                           ('pyversion', ''),
+                                           ('comment', ''),
+                                           ('gpg_signature', ''),
+                                           ('md5_digest', '')))
+        digests = upload_digests(files)
+        for uploaded, expected, digest in zip(files, fields['md5_digest'],
+                                              digests):
+            if expected and expected != digest:
+                raise UploadRefused(HttpResponseBadRequest,
+                                    'The md5_digest of %s does not match its '
+                                    'content.' % (uploaded.name,),
+                                    package=name, version=version,
+                                    filename=uploaded.name)
+    except UploadRefused, e:
+        return refuse(request, e.response_class, e.reason, **e.fields)
+
+    # Everything was checked, from here on the request only writes
+    created_package = package is None
+    package, release = save_release(request.POST, package, release, name,
+                                    version, metadata_version, group_id)
+    new_files = [Distribution(release=release,
+                              content=uploaded,
+                              filetype=fields['filetype'][i],
+                              pyversion=fields['pyversion'][i],
+                              uploader=request.user,
+                              comment=fields['comment'][i],
+                              signature=fields['gpg_signature'][i],
+                              md5_digest=digests[i])
+                 for i, uploaded in enumerate(files)]
+    try:
+        for new_file in new_files:
+            new_file.save()
+    except Exception, e:
+        deferred.rollback()
+        remove_stored(new_files)
+        reason = conflict_reason(e, name, version, new_files)
+        if reason is None:
+            raise
+        return refuse(request, HttpResponseBadRequest, reason,
+                      package=name, version=version)
+
+    for new_file in new_files:
+        events.emit('upload', request, package=package.name, version=version,
+                    filename=new_file.filename,
+                    md5_digest=new_file.md5_digest)
+    return upload_accepted(request, package, group_name, created_package)
 
+@instrument()
 def list_classifiers(request, mimetype='text/plain'):
     response = HttpResponse(mimetype=mimetype)
     response.write(u'\n'.join(map(lambda c: c.name,Classifier.objects.all())))
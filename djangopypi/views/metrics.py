@@ -0,0 +1,34 @@
+from django.http import HttpResponse
+from django.utils import simplejson as json
+
+from djangopypi import conf, metrics
+from djangopypi.http import HttpResponseUnauthorized
+from djangopypi.views.packages import request_user
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _allowed(request):
+    """ Whether the metrics may be shown: to the Prometheus server and to
+    staff users """
+    if request.META.get('REMOTE_ADDR') in conf.METRICS_ALLOWED_IPS:
+        return True
+    user = request_user(request)
+    return user is not None and user.is_staff
+
+def prometheus(request):
+    if not _allowed(request):
+        return HttpResponseUnauthorized('pypi')
+    return HttpResponse(metrics.prometheus(),
+                        mimetype=PROMETHEUS_CONTENT_TYPE)
+
+def recent(request):
+    """ The last requests, most recent first, optionally only those of the
+    ``endpoint`` given in the query string """
+    if not _allowed(request):
+        return HttpResponseUnauthorized('pypi')
+    rows = metrics.recent()
+    endpoint = request.GET.get('endpoint')
+    if endpoint:
+        rows = [row for row in rows if row['endpoint'] == endpoint]
+    rows.reverse()
+    return HttpResponse(json.dumps(rows), mimetype='application/json')
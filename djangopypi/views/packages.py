@@ -1,34 +1,59 @@
 from django.conf import settings
 from django.db.models.query import Q
-from django.http import Http404, HttpResponseRedirect, HttpResponseForbidden
+from django.http import Http404, HttpResponse, HttpResponseForbidden, \
+                        HttpResponseNotAllowed
 from django.forms.models import inlineformset_factory
 from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
+from django.template.loader import render_to_string
+from django.utils import simplejson as json
 from django.views.generic import list_detail, create_update
 from django.contrib.auth.views import redirect_to_login
 
-from djangopypi import conf
-from djangopypi.http import login_basic_auth, HttpResponseUnauthorized
-from djangopypi.decorators import user_owns_package, user_maintains_package
+from djangopypi import conf, dependencies, permissions, proxy, resolver, \
+                       simple
+from djangopypi.documents import package_document
+from djangopypi.http import login_basic_auth, HttpResponseUnauthorized, \
+                            HttpResponseBadGateway, conditional_response
+from djangopypi.decorators import csrf_exempt, user_owns_package, \
+                                  user_maintains_package
+from djangopypi.metrics import instrument
 from djangopypi.models import Package, Release
+from djangopypi.permissions import user_packages
 from djangopypi.forms import SimplePackageSearchForm, PackageForm
 
-def user_packages(user):
-    ''' Return a list of packages that the user has permission to download '''
-    if user.is_superuser:
-        return Package.objects.all()
+def request_user(request):
+    ''' The logged in user, or the one given with basic auth, or None '''
+    if request.user.is_authenticated():
+        return request.user
+    return login_basic_auth(request)
+
+def check_download_permission(request, package):
+    ''' Return None if the request may download the files of package, or the
+    response to send back otherwise '''
+    if permissions.is_anonymous(package):
+        return None
+
+    if request.user.is_authenticated():
+        user = request.user
     else:
-        return Package.objects.filter(
-            Q(download_permissions=None) |
-            Q(allow_authenticated=True) |
-            Q(download_permissions__in=user.groups.all())
-        ).distinct()
+        user = login_basic_auth(request)
+
+    if user is None:
+        return HttpResponseUnauthorized('pypi')
 
+    if not permissions.can_download(user, package):
+        return HttpResponseForbidden('You do not have sufficient \
+                                      permissions to view this package')
+    return None
+
+@instrument()
 def index(request, **kwargs):
     kwargs.setdefault('template_object_name', 'package')
     kwargs.setdefault('queryset', Package.objects.all())
     return list_detail.object_list(request, **kwargs)
 
+@instrument()
 def simple_index(request, **kwargs):
     if request.user.is_authenticated():
         user = request.user
@@ -38,10 +63,22 @@ def simple_index(request, **kwargs):
     if user is None:
         return HttpResponseUnauthorized('pypi')
 
-    kwargs.setdefault('template_name', 'djangopypi/package_list_simple.html')
-    kwargs['queryset'] = user_packages(user)
-    return index(request, **kwargs)
+    content_type = simple.negotiate(request)
+    template_name = kwargs.get('template_name',
+                               'djangopypi/package_list_simple.html')
+
+    def build():
+        packages = user_packages(user)
+        if content_type == simple.JSON_CONTENT_TYPE:
+            return simple.index_json(packages.values_list('name', flat=True))
+        return render_to_string(template_name, {'package_list': packages})
 
+    return simple.serve(request,
+                        simple.index_key(permissions.user_scope(user),
+                                         content_type, template_name),
+                        build, content_type)
+
+@instrument()
 def details(request, package, simple=False, **kwargs):
     package = get_object_or_404(Package, name=package)
     kwargs.setdefault('template_object_name', 'package')
@@ -64,22 +101,111 @@ def details(request, package, simple=False, **kwargs):
         return HttpResponseForbidden('You do not have sufficient \
                                       permissions to view this package')
 
+@instrument()
 def simple_details(request, package, **kwargs):
-    kwargs.setdefault('template_name', 'djangopypi/package_detail_simple.html')
-    try:
-        return details(request, package, simple=True, **kwargs)
-    except Http404, e:
-        if conf.PROXY_MISSING:
-            return HttpResponseRedirect('%s/%s/' % 
-                                        (conf.PROXY_BASE_URL.rstrip('/'),
-                                         package))
-        raise e
+    name = package
+    # Only authenticated clients may make the index fetch from upstream
+    user = login_basic_auth(request)
+    if not user:
+        return HttpResponseUnauthorized('pypi')
 
+    if conf.PROXY_MISSING:
+        try:
+            package = proxy.lookup(name)
+        except proxy.ProxyError, e:
+            return HttpResponseBadGateway(str(e))
+        if package is None:
+            raise Http404('%s does not exist' % (name,))
+    else:
+        package = get_object_or_404(Package, name=name)
+
+    if not permissions.can_download(user, package):
+        return HttpResponseForbidden('You do not have sufficient \
+                                      permissions to view this package')
+
+    content_type = simple.negotiate(request)
+    template_name = kwargs.get('template_name',
+                               'djangopypi/package_detail_simple.html')
+
+    def build():
+        if content_type == simple.JSON_CONTENT_TYPE:
+            return simple.detail_json(package.name,
+                                      simple.distribution_rows(package))
+        return render_to_string(template_name, {'package': package})
+
+    return simple.serve(request,
+                        simple.detail_key(package.name, content_type,
+                                          template_name),
+                        build, content_type)
+
+@instrument()
 def doap(request, package, **kwargs):
     kwargs.setdefault('template_name', 'djangopypi/package_doap.xml')
     kwargs.setdefault('mimetype', 'text/xml')
     return details(request, package, simple=True, **kwargs)
 
+@instrument()
+def json_details(request, package, **kwargs):
+    package = get_object_or_404(Package, name=package)
+    response = check_download_permission(request, package)
+    if response is not None:
+        return response
+
+    etag, content = package_document(package)
+    return conditional_response(request, etag, content, 'application/json')
+
+@instrument()
+def dependents_json(request, package, **kwargs):
+    """ The releases that depend on ``package``, or on the version of it given
+    in the ``version`` parameter """
+    version = request.GET.get('version') or None
+    allowed = permissions.allowed_packages(request_user(request))
+    rows = [row for row in dependencies.dependents(package, version)
+            if row[0] in allowed]
+    content = json.dumps({
+        'name': package,
+        'version': version,
+        'dependents': [{'name': name, 'version': release_version,
+                        'specifier': specifier, 'marker': marker}
+                       for name, release_version, specifier, marker in rows],
+    })
+    return HttpResponse(content, mimetype='application/json')
+
+@instrument()
+@csrf_exempt
+def resolve(request, **kwargs):
+    """ Pin a requirements list, POSTed as the body or as the
+    ``requirements`` form field, to releases and the URLs of their files """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    if request.META.get('CONTENT_TYPE', '').startswith('text/plain'):
+        text = request.raw_post_data
+    else:
+        text = request.POST.get('requirements', '')
+
+    user = request_user(request)
+    allowed = None
+    if user is None or not user.is_superuser:
+        allowed = permissions.allowed_packages(user)
+
+    try:
+        pins = resolver.resolve(resolver.parse_requirements(text), allowed)
+    except resolver.InvalidRequirement, e:
+        return HttpResponse(json.dumps({'error': str(e)}), status=400,
+                            mimetype='application/json')
+    except resolver.ResolutionError, e:
+        return HttpResponse(json.dumps({'error': str(e)}), status=409,
+                            mimetype='application/json')
+
+    content = json.dumps({'pins': [
+        {'name': name, 'version': version,
+         'files': [{'filename': filename, 'url': url,
+                    'hashes': md5_digest and {'md5': md5_digest} or {}}
+                   for filename, url, md5_digest in files]}
+        for name, version, files in pins]})
+    return HttpResponse(content, mimetype='application/json')
+
+@instrument()
 def search(request, **kwargs):
     if request.method == 'POST':
         form = SimplePackageSearchForm(request.POST)
@@ -89,10 +215,12 @@ def search(request, **kwargs):
     if form.is_valid():
         q = form.cleaned_data['q']
         kwargs['queryset'] = Package.objects.filter(Q(name__contains=q) | 
-                                                    Q(releases__package_info__contains=q)).distinct()
+                                                    Q(releases__package_info__contains=q) |
+                                                    Q(releases__long_description__text__contains=q)).distinct()
 
     return index(request, **kwargs)
 
+@instrument()
 @user_owns_package()
 def manage(request, package, **kwargs):
     kwargs['object_id'] = package
@@ -102,6 +230,7 @@ def manage(request, package, **kwargs):
 
     return create_update.update_object(request, **kwargs)
 
+@instrument()
 @user_maintains_package()
 def manage_versions(request, package, **kwargs):
     package = get_object_or_404(Package, name=package)
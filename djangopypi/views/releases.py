@@ -10,13 +10,20 @@ from django.views.generic import list_detail, create_update
 from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
 from django.contrib.auth.views import redirect_to_login
+from django.utils import simplejson as json
 
-from djangopypi import conf
+from djangopypi import conf, coremetadata, dependencies, downloads, \
+                       events, permissions, proxy
 from djangopypi.decorators import user_maintains_package
+from djangopypi.documents import release_document
+from djangopypi.metrics import instrument, served
 from djangopypi.models import Package, Release, Distribution
-from djangopypi.http import login_basic_auth, HttpResponseUnauthorized
+from djangopypi.http import login_basic_auth, HttpResponseUnauthorized, \
+                            HttpResponseBadGateway, conditional_response
 from djangopypi.forms import ReleaseForm, DistributionUploadForm
-from djangopypi.views.packages import user_packages
+from djangopypi.requirements import normalize_name
+from djangopypi.views.packages import user_packages, request_user, \
+                                     check_download_permission
 
 from sendfile import sendfile
 
@@ -38,6 +45,7 @@ def anonymous_releases():
         package__allow_authenticated=False,
     )
 
+@instrument()
 def index(request, **kwargs):
     if not request.user.is_authenticated():
         return redirect_to_login(request.get_full_path())
@@ -48,6 +56,7 @@ def index(request, **kwargs):
     )
     return list_detail.object_list(request, **kwargs)
 
+@instrument()
 def details(request, package, version, simple=False, **kwargs):
     kwargs.setdefault('template_object_name', 'release')
     release = get_object_or_404(Package, name=package).get_release(version)
@@ -72,11 +81,50 @@ def details(request, package, version, simple=False, **kwargs):
         kwargs.setdefault('queryset', Release.objects.all())
         return list_detail.object_detail(request, object_id=release.id, **kwargs)
 
+@instrument()
 def doap(request, package, version, **kwargs):
     kwargs.setdefault('template_name','djangopypi/release_doap.xml')
     kwargs.setdefault('mimetype', 'text/xml')
     return details(request, package, version, **kwargs)
 
+@instrument()
+def json_details(request, package, version, **kwargs):
+    package = get_object_or_404(Package, name=package)
+    response = check_download_permission(request, package)
+    if response is not None:
+        return response
+
+    release = get_object_or_404(Release, package=package, version=version)
+    etag, content = release_document(release)
+    return conditional_response(request, etag, content, 'application/json')
+
+@instrument()
+def dependencies_json(request, package, version, **kwargs):
+    """ The requirements of a release, and the packages it depends on directly
+    or not """
+    package = get_object_or_404(Package, name=package)
+    response = check_download_permission(request, package)
+    if response is not None:
+        return response
+    release = get_object_or_404(Release, package=package, version=version)
+
+    allowed = set(normalize_name(name) for name in
+                  permissions.allowed_packages(request_user(request)))
+    content = json.dumps({
+        'name': package.name,
+        'version': release.version,
+        'requires': [{'name': name, 'specifier': specifier, 'marker': marker}
+                     for name, specifier, marker in release.dependencies
+                     .order_by('name').values_list('name', 'specifier',
+                                                   'marker')],
+        # Packages that are not in the index are listed without a version
+        'closure': [{'name': name, 'version': dep_version}
+                    for name, dep_version in dependencies.closure(release)
+                    if dep_version is None or name in allowed],
+    })
+    return HttpResponse(content, mimetype='application/json')
+
+@instrument()
 @user_maintains_package()
 def manage(request, package, version, **kwargs):
     release = get_object_or_404(Package, name=package).get_release(version)
@@ -93,6 +141,7 @@ def manage(request, package, version, **kwargs):
     
     return create_update.update_object(request, **kwargs)
 
+@instrument()
 @user_maintains_package()
 def manage_metadata(request, package, version, **kwargs):
     kwargs.setdefault('template_name', 'djangopypi/release_manage.html')
@@ -126,6 +175,7 @@ def manage_metadata(request, package, version, **kwargs):
             initial[key] = values
         else:
             initial[key] = '\n'.join(values)
+    initial['description'] = release.description
     
     if request.method == 'POST':
         form = form_class(data=request.POST, initial=initial)
@@ -149,6 +199,7 @@ def manage_metadata(request, package, version, **kwargs):
                               context_instance=RequestContext(request),
                               mimetype=kwargs['mimetype'])
 
+@instrument()
 @user_maintains_package()
 def manage_files(request, package, version, **kwargs):
     release = get_object_or_404(Package, name=package).get_release(version)
@@ -189,6 +240,7 @@ def manage_files(request, package, version, **kwargs):
                               context_instance=RequestContext(request),
                               mimetype=kwargs['mimetype'])
 
+@instrument()
 @user_maintains_package()
 def upload_file(request, package, version, **kwargs):
     release = get_object_or_404(Package, name=package).get_release(version)
@@ -226,6 +278,7 @@ def upload_file(request, package, version, **kwargs):
                               context_instance=RequestContext(request),
                               mimetype=kwargs['mimetype'])
 
+@instrument()
 def bootstrap_index(request):
     return list_detail.object_list(
         request,
@@ -233,27 +286,60 @@ def bootstrap_index(request):
         template_name='djangopypi/bootstrap.html',
     )
 
+def find_distribution(queryset, path):
+    """ The distribution of ``queryset`` stored at ``path``, looked up by
+    its indexed file name """
+    # Files sharing their base name with an older one are named by their path
+    for dist in queryset.filter(filename__in=(os.path.basename(path), path)):
+        if dist.content.name == path:
+            return dist
+    raise Http404('No distribution at %s' % (path,))
+
+@instrument()
 def download_dist(request, path, document_root=None, show_indexes=False):
     log = logging.getLogger(__name__)
 
-    def serve(username, dist):
-        log.info('user: %s package: %s downloaded' % (username, package.name))
-        return sendfile(request, dist.content.path, attachment=True)
+    def serve(user, dist):
+        if dist.mirror_url and not dist.content.storage.exists(dist.path):
+            try:
+                proxy.fetch_distribution(dist)
+            except proxy.ProxyError, e:
+                log.warning('package: %s could not be mirrored: %s' % (
+                    package.name, e))
+                return HttpResponseBadGateway(str(e))
+        if metadata:
+            path = coremetadata.metadata_path(dist.content.path)
+            served(request, os.path.getsize(path))
+            return sendfile(request, path, mimetype='text/plain')
+        served(request, dist.content.size)
+        response = sendfile(request, dist.content.path, attachment=True)
+        if response.status_code == 200:
+            downloads.count(dist.pk)
+            events.emit('download', request, user=user and user.username,
+                        package=package.name, version=dist.release.version,
+                        filename=dist.filename)
+        return response
 
-    def forbidden(username, dist):
-        error = 'user: %s package: %s download permission denied' % (
-            username,
-            package.name
-        )
-        log.info(error)
-        return HttpResponseForbidden(error)
+    def forbidden(user, dist):
+        events.emit('download_denied', request, user=user.username,
+                    package=package.name, version=dist.release.version,
+                    filename=dist.filename)
+        return HttpResponseForbidden(
+            'user: %s package: %s download permission denied' % (
+                user.username, package.name))
 
-    dist = get_object_or_404(Distribution, content=path)
+    # The core metadata of a file is served at <file>.metadata (PEP 658)
+    metadata = path.endswith(coremetadata.SUFFIX)
+    dists = Distribution.objects.select_related('release__package')
+    if metadata:
+        path = path[:-len(coremetadata.SUFFIX)]
+        dists = dists.exclude(metadata_sha256='')
+    dist = find_distribution(dists, path)
     package = dist.release.package
 
-    if package.download_permissions.count() == 0 and not package.allow_authenticated:
+    if permissions.is_anonymous(package):
         # If no download permissions, anon users can access the package
-        return serve('Anonymous', dist)
+        return serve(None, dist)
     else:
         # Check authentication, falling-back to basic auth if necessary
         if request.user.is_authenticated():
@@ -264,7 +350,7 @@ def download_dist(request, path, document_root=None, show_indexes=False):
         if user is None: # Specify 401 and await creds on next request
             return HttpResponseUnauthorized('pypi')
         else:
-            if package in user_packages(user):
-                return serve(user.username, dist)
+            if permissions.can_download(user, package):
+                return serve(user, dist)
             else:
-                return forbidden(user.username, dist)
+                return forbidden(user, dist)
@@ -0,0 +1,187 @@
+import os
+import re
+
+from django.core.files.move import file_move_safe
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse, HttpResponseBadRequest, \
+                        HttpResponseNotAllowed
+from django.shortcuts import get_object_or_404
+from django.utils import simplejson as json
+
+from djangopypi import coremetadata, deferred, events, uploads
+from djangopypi.decorators import basic_auth, csrf_exempt
+from djangopypi.metrics import instrument
+from djangopypi.models import Distribution, FileNameTaken, UploadSession
+from djangopypi.views.distutils import UploadRefused, refuse, \
+     check_uploader, check_release, check_files, conflict_reason, \
+     save_release, upload_accepted
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+def session_response(request, session, status=200):
+    url = request.build_absolute_uri(reverse('djangopypi-upload-session',
+                                             kwargs={'session_id': session.pk}))
+    response = HttpResponse(json.dumps({
+        'id': session.pk,
+        'filename': session.filename,
+        'size': session.size,
+        'offset': session.offset,
+        'url': url,
+        'commit_url': url + 'commit/',
+    }), status=status, mimetype='application/json')
+    if status == 201:
+        response['Location'] = url
+    return response
+
+@instrument()
+@csrf_exempt
+@basic_auth
+def start(request):
+    """ Start uploading a file in chunks. Takes the fields of a
+    ``file_upload`` request, with the ``filename`` and, optionally, the
+    ``size`` of the file instead of its content, and checks them before any
+    chunk is sent. """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    data = request.POST.copy()
+    name = data.get('name', '').strip()
+    filename = data.get('filename', '').strip()
+    if not name:
+        return refuse(request, HttpResponseBadRequest,
+                      'No package name specified.')
+    if not filename or os.path.basename(filename) != filename:
+        return refuse(request, HttpResponseBadRequest,
+                      'No file name specified.', package=name)
+    try:
+        size = data.get('size') and int(data['size']) or None
+    except ValueError:
+        return refuse(request, HttpResponseBadRequest,
+                      'Invalid size: %s' % (data['size'],), package=name)
+
+    try:
+        group_id, group_name, package = check_uploader(request, name)
+        release, version, metadata_version = check_release(data, package,
+                                                           name)
+        check_files([filename], name, version)
+    except UploadRefused, e:
+        return refuse(request, e.response_class, e.reason, **e.fields)
+
+    session = UploadSession(user=request.user, filename=filename, size=size,
+                            md5_digest=data.get('md5_digest', ''))
+    session.set_fields(data)
+    session.save(force_insert=True)
+    return session_response(request, session, status=201)
+
+@instrument()
+@csrf_exempt
+@basic_auth
+def session(request, session_id):
+    """ ``GET`` the offset at which the next chunk starts, ``PUT`` a chunk
+    whose ``Content-Range`` starts at that offset, or ``DELETE`` the
+    upload """
+    session = get_object_or_404(UploadSession, pk=session_id,
+                                user=request.user)
+    if request.method == 'GET':
+        return session_response(request, session)
+    if request.method == 'DELETE':
+        uploads.discard(session)
+        return HttpResponse(status=204)
+    if request.method != 'PUT':
+        return HttpResponseNotAllowed(['GET', 'PUT', 'DELETE'])
+
+    match = CONTENT_RANGE.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+    try:
+        length = int(request.META.get('CONTENT_LENGTH', 0))
+    except (ValueError, TypeError):
+        length = 0
+    if match is None or \
+       int(match.group(2)) - int(match.group(1)) + 1 != length:
+        return HttpResponseBadRequest('Chunks are sent with a Content-Range '
+                                      'header, bytes <first>-<last>/<size>, '
+                                      'matching their length.')
+    try:
+        uploads.append(session, int(match.group(1)), request.read, length)
+    except uploads.OffsetMismatch, e:
+        # Tell the client where to resume from
+        session.offset = e.offset
+        return session_response(request, session, status=409)
+    except ValueError, e:
+        return HttpResponseBadRequest(str(e))
+    return session_response(request, session)
+
+@instrument()
+@csrf_exempt
+@basic_auth
+@deferred.commit_on_success
+def commit(request, session_id):
+    """ Check the file uploaded in chunks, and add it to its release like a
+    ``file_upload`` request would """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    session = get_object_or_404(UploadSession, pk=session_id,
+                                user=request.user)
+    data = session.get_fields()
+    name = data.get('name', '').strip()
+    fields = {'package': name, 'version': data.get('version'),
+              'filename': session.filename}
+
+    if not session.offset or session.size not in (None, session.offset):
+        return refuse(request, HttpResponseBadRequest,
+                      'Only %d of the bytes of %s were received.' % (
+                          session.offset, session.filename), **fields)
+    md5_digest = uploads.digest(session)
+    if session.md5_digest and session.md5_digest != md5_digest:
+        return refuse(request, HttpResponseBadRequest,
+                      'The md5_digest of %s does not match its content.' % (
+                          session.filename,), **fields)
+
+    # The package and its files may have changed since the upload started
+    try:
+        group_id, group_name, package = check_uploader(request, name)
+        release, version, metadata_version = check_release(data, package,
+                                                           name)
+        check_files([session.filename], name, version)
+    except UploadRefused, e:
+        return refuse(request, e.response_class, e.reason, **e.fields)
+    # A file left over under that name would have the staged one renamed
+    content = Distribution._meta.get_field('content')
+    if content.storage.exists(content.generate_filename(None,
+                                                        session.filename)):
+        return refuse(request, HttpResponseBadRequest,
+                      'package:%s version%s. %s' % (
+                          name, version, FileNameTaken(session.filename)),
+                      **fields)
+
+    created_package = package is None
+    package, release = save_release(data, package, release, name, version,
+                                    metadata_version, group_id)
+    new_file = Distribution(release=release,
+                            content=uploads.StagedFile(session),
+                            filetype=data.get('filetype', 'sdist'),
+                            pyversion=data.get('pyversion', ''),
+                            uploader=request.user,
+                            comment=data.get('comment', ''),
+                            signature=data.get('gpg_signature', ''),
+                            md5_digest=md5_digest)
+    try:
+        new_file.save()
+    except Exception, e:
+        deferred.rollback()
+        if isinstance(e, FileNameTaken):
+            # The storage removed the file it renamed
+            uploads.discard(session)
+        elif new_file.content._committed:
+            # Stage the file again, for the client to retry
+            coremetadata.delete(new_file)
+            file_move_safe(new_file.content.path,
+                           uploads.staged_path(session))
+        reason = conflict_reason(e, name, version, [new_file])
+        if reason is None:
+            raise
+        return refuse(request, HttpResponseBadRequest, reason, **fields)
+    uploads.discard(session)
+
+    events.emit('upload', request, package=package.name, version=version,
+                filename=new_file.filename, md5_digest=new_file.md5_digest)
+    return upload_accepted(request, package, group_name, created_package)
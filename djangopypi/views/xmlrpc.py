@@ -2,7 +2,8 @@ import xmlrpclib
 
 from django.http import HttpResponseNotAllowed, HttpResponse
 
-from djangopypi import conf
+from djangopypi import conf, downloads
+from djangopypi.metrics import instrument
 from djangopypi.models import Package, Release
 
 class XMLRPCResponse(HttpResponse):
@@ -29,29 +30,35 @@ def parse_xmlrpc_request(request):
     else:
         return HttpResponseNotAllowed(conf.XMLRPC_COMMANDS.keys())
 
+@instrument()
 def list_packages(request):
     return XMLRPCResponse(params=(list(Package.objects.all().values_list('name', flat=True)),),
                           content_type='text/xml')
 
+@instrument()
 def package_releases(request, package_name, show_hidden=False):
     try:
         return XMLRPCResponse(params=(list(Package.objects.get(name=package_name).releases.filter(hidden=show_hidden).values_list('version', flat=True)),))
     except Package.DoesNotExist:
         return XMLRPCResponse(params=([],))
 
+@instrument()
 def release_urls(request, package_name, version):
     base_url = '%s://%s' % (request.is_secure() and 'https' or 'http',
                               request.get_host())
     dists = []
     try:
-        for dist in Package.objects.get(name=package_name).releases.get(version=version).distributions.all():
+        release = Package.objects.get(name=package_name).releases.get(version=version)
+        distributions = list(release.distributions.all())
+        counts = downloads.totals([dist.pk for dist in distributions])
+        for dist in distributions:
             dists.append({
                 'url': '%s%s' % (base_url, dist.get_absolute_url()),
                 'packagetype': dist.filetype,
                 'filename': dist.filename,
                 'size': dist.content.size,
                 'md5_digest': dist.md5_digest,
-                'downloads': 0,
+                'downloads': counts[dist.pk],
                 'has_sig': len(dist.signature)>0,
                 'python_version': dist.pyversion,
                 'comment_text': dist.comment
@@ -61,6 +68,7 @@ def release_urls(request, package_name, version):
     
     return XMLRPCResponse(params=(dists,))
 
+@instrument()
 def release_data(request, package_name, version):
     output = {
         'name': '',
@@ -92,11 +100,15 @@ def release_data(request, package_name, version):
         release = Package.objects.get(name=package_name).releases.get(version=version)
         output.update({'name': package_name, 'version': version,})
         output.update(release.package_info)
+        output['description'] = release.description
+        output['downloads'] = downloads.recent(
+            release.distributions.values_list('pk', flat=True))
     except (Package.DoesNotExist, Release.DoesNotExist):
         pass
     
     return XMLRPCResponse(params=(output,))
 
+@instrument()
 def search(request, spec, operator='or'):
     """
     search(spec[, operator])
@@ -139,5 +151,6 @@ def changelog(since):
     }
     return XMLRPCResponse(params=(output,))
 
+@instrument()
 def ratings(request, name, version, since):
     return XMLRPCResponse(params=([],))
@@ -0,0 +1,22 @@
+""" Wheel (PEP 427) file names, which carry the tags installers match against
+the running interpreter: ``name-version[-build]-python-abi-platform.whl``.
+Each tag may be a dotted set, such as ``py2.py3``. """
+import re
+
+WHEEL_RE = re.compile(r'''
+    ^(?P<name>[^-]+)-(?P<version>[^-]+)
+    (?:-(?P<build>\d[^-]*))?
+    -(?P<python_tag>[^-]+)-(?P<abi_tag>[^-]+)-(?P<platform_tag>[^-]+)
+    \.whl$
+''', re.VERBOSE)
+
+def is_wheel(filename):
+    return filename.lower().endswith('.whl')
+
+def parse_filename(filename):
+    """ The parts of a wheel file name as a dict, or None when ``filename``
+    is not that of a wheel """
+    match = WHEEL_RE.match(filename)
+    if not match:
+        return None
+    return match.groupdict()